@@ -0,0 +1,289 @@
+"""
+Model Artifacts
+Loads the precomputed similarity artifacts from model/ and turns them into
+collaborative signals that can be blended with the live content score
+"""
+import logging
+import os
+import pickle
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from collaborative import CollaborativeEngine, InteractionIndex, NeighbourIndex, TOP_K, top_k_from_similarity
+from model_format import csr_arrays, csr_from_arrays, load_bundle, resolve_bundle
+
+logger = logging.getLogger("recommendation.artifacts")
+
+# Number of similar users consulted for the similar-user signal
+USER_NEIGHBOURS = 20
+# Relative weights of the collaborative signals inside the blend
+SIGNAL_WEIGHTS = {'item': 0.4, 'user': 0.4, 'coattendance': 0.2}
+
+
+def _load_pickle(path: str):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        logger.error(f"Error loading {path}: {e}")
+        return None
+
+
+class ModelArtifacts:
+    def __init__(self,
+                 events: Optional[NeighbourIndex] = None,
+                 interactions: Optional[InteractionIndex] = None,
+                 collaborative: Optional[CollaborativeEngine] = None,
+                 users_vector: Optional[sp.csr_matrix] = None,
+                 version: Optional[str] = None,
+                 cooccurrence: Optional[sp.csr_matrix] = None):
+        self.events = events
+        self.interactions = interactions
+        self.collaborative = collaborative
+        self.users_vector = users_vector
+        self.version = version
+        # events x events co-attendance counts over the interaction event ids
+        self.cooccurrence = cooccurrence
+
+    @classmethod
+    def load(cls, model_dir: str = 'model') -> Optional['ModelArtifacts']:
+        """Load the active bundle from model_dir, falling back to the legacy pickles"""
+        bundle = resolve_bundle(model_dir)
+        if bundle is not None:
+            artifacts = cls.from_bundle(bundle)
+        else:
+            artifacts = cls.from_pickles(model_dir)
+            if artifacts is not None:
+                logger.warning("Loaded legacy pickled artifacts; run convert_model.py "
+                               "to switch to the memory-mapped format")
+        if artifacts is None or not artifacts.has_signals():
+            return None
+        logger.info(f"Loaded model artifacts: {artifacts.summary()}")
+        return artifacts
+
+    @classmethod
+    def from_bundle(cls, path: str, mmap: bool = True) -> 'ModelArtifacts':
+        """Open a bundle written by model_format.write_bundle; arrays stay memory-mapped"""
+        bundle = load_bundle(path, mmap=mmap)
+        arrays, ids = bundle['arrays'], bundle['ids']
+        user_ids = ids.get('user_ids', [])
+        interactions = InteractionIndex.from_arrays(user_ids, ids.get('interaction_event_ids', []), arrays)
+        users = NeighbourIndex.from_arrays('users', user_ids, arrays)
+        collaborative = None
+        if users is not None and interactions is not None:
+            collaborative = CollaborativeEngine(users, interactions)
+        return cls(
+            events=NeighbourIndex.from_arrays('events', ids.get('event_ids', []), arrays),
+            interactions=interactions if interactions is not None and len(interactions) else None,
+            collaborative=collaborative,
+            users_vector=csr_from_arrays('users_vector', arrays),
+            version=bundle['manifest'].get('version'),
+            cooccurrence=csr_from_arrays('cooccurrence', arrays),
+        )
+
+    @classmethod
+    def from_pickles(cls, model_dir: str = 'model', k: int = TOP_K) -> Optional['ModelArtifacts']:
+        """Build everything in memory from the notebook pickles in model_dir"""
+        events = _load_pickle(os.path.join(model_dir, 'events.pkl'))
+        users = _load_pickle(os.path.join(model_dir, 'users.pkl'))
+        users_event = _load_pickle(os.path.join(model_dir, 'users_event.pkl'))
+        events_similarity = _load_pickle(os.path.join(model_dir, 'events_similarity.pkl'))
+        users_similarity = _load_pickle(os.path.join(model_dir, 'users_similarity.pkl'))
+        users_vector = _load_pickle(os.path.join(model_dir, 'users_vector.pkl'))
+        if all(a is None for a in (events, users, users_event, events_similarity, users_similarity, users_vector)):
+            return None
+
+        event_ids = [str(e) for e in events['event_id']] if events is not None else []
+        user_ids = [str(u) for u in users['user_id']] if users is not None else []
+        user_events = {}
+        if users_event is not None:
+            user_events = {str(u): e for u, e in zip(users_event['user_id'], users_event['events'])}
+
+        # Matrices are only usable when they line up with the id lists
+        if events_similarity is not None and np.shape(events_similarity)[0] != len(event_ids):
+            logger.warning("events_similarity does not match events.pkl, ignoring it")
+            events_similarity = None
+        if users_similarity is not None and np.shape(users_similarity)[0] != len(user_ids):
+            logger.warning("users_similarity does not match users.pkl, ignoring it")
+            users_similarity = None
+        if users_vector is not None and np.shape(users_vector)[0] != len(user_ids):
+            logger.warning("users_vector does not match users.pkl, ignoring it")
+            users_vector = None
+
+        if not user_ids:
+            user_ids = list(user_events)
+        interactions = InteractionIndex.from_mapping(user_ids, user_events)
+        collaborative = CollaborativeEngine.build(user_ids, interactions, users_similarity, users_vector, k)
+
+        events_index = None
+        if events_similarity is not None:
+            ids, scores = top_k_from_similarity(np.asarray(events_similarity), k)
+            events_index = NeighbourIndex(event_ids, ids, scores)
+
+        if users_vector is not None:
+            users_vector = np.asarray(users_vector, dtype=np.float32)
+            norms = np.linalg.norm(users_vector, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            users_vector = sp.csr_matrix(users_vector / norms)
+
+        return cls(
+            events=events_index,
+            interactions=interactions if len(interactions) else None,
+            collaborative=collaborative,
+            users_vector=users_vector,
+        )
+
+    def to_bundle(self) -> Tuple[Dict[str, np.ndarray], Dict[str, List[str]]]:
+        """Arrays and id lists for model_format.write_bundle"""
+        arrays: Dict[str, np.ndarray] = {}
+        ids: Dict[str, List[str]] = {}
+        if self.collaborative is not None:
+            arrays.update(self.collaborative.users.to_arrays('users'))
+            ids['user_ids'] = self.collaborative.users.keys
+        interactions = self.interactions or (self.collaborative.interactions if self.collaborative else None)
+        if interactions is not None:
+            arrays.update(interactions.to_arrays())
+            ids['user_ids'] = interactions.user_ids
+            ids['interaction_event_ids'] = interactions.event_ids
+        if self.events is not None:
+            arrays.update(self.events.to_arrays('events'))
+            ids['event_ids'] = self.events.keys
+        if self.users_vector is not None:
+            arrays.update(csr_arrays('users_vector', self.users_vector))
+        if self.cooccurrence is not None:
+            arrays.update(csr_arrays('cooccurrence', self.cooccurrence))
+        return arrays, ids
+
+    def validate(self) -> None:
+        """Raise ValueError if the arrays are inconsistent with each other or their id lists"""
+        if not self.has_signals():
+            raise ValueError("Model has no events, interactions or collaborative data")
+        neighbour_indexes = [('events', self.events)]
+        if self.collaborative is not None:
+            neighbour_indexes.append(('users', self.collaborative.users))
+        for name, index in neighbour_indexes:
+            if index is None:
+                continue
+            if index.ids.shape[0] != len(index.keys) or index.scores.shape != index.ids.shape:
+                raise ValueError(f"{name} neighbour arrays do not match {len(index.keys)} ids")
+            if len(index.keys) and (index.ids.min() < -1 or index.ids.max() >= len(index.keys)):
+                raise ValueError(f"{name} neighbour ids out of range")
+            if not np.isfinite(index.scores).all():
+                raise ValueError(f"{name} neighbour scores are not finite")
+
+        interactions = self.interactions or (self.collaborative.interactions if self.collaborative else None)
+        if interactions is not None:
+            for label, indptr, indices, rows, width in (
+                ('user', interactions.indptr, interactions.indices,
+                 len(interactions.user_ids), len(interactions.event_ids)),
+                ('event', interactions.event_indptr, interactions.event_users,
+                 len(interactions.event_ids), len(interactions.user_ids)),
+            ):
+                if (len(indptr) != rows + 1 or indptr[0] != 0 or indptr[-1] != len(indices)
+                        or (np.diff(indptr) < 0).any()):
+                    raise ValueError(f"Interaction {label} index pointers are inconsistent")
+                if len(indices) and (indices.min() < 0 or indices.max() >= width):
+                    raise ValueError(f"Interaction {label} index entries out of range")
+
+        if interactions is not None and self.cooccurrence is not None:
+            width = len(interactions.event_ids)
+            if self.cooccurrence.shape != (width, width):
+                raise ValueError(f"cooccurrence shape {self.cooccurrence.shape} does not match the interaction ids")
+
+        if (self.users_vector is not None and self.collaborative is not None
+                and self.users_vector.shape[0] != len(self.collaborative.users.keys)):
+            raise ValueError("users_vector rows do not match the user ids")
+
+    def has_signals(self) -> bool:
+        return (self.events is not None
+                or self.interactions is not None
+                or self.collaborative is not None)
+
+    def summary(self) -> Dict:
+        return {
+            'version': self.version,
+            'events': len(self.events.keys) if self.events is not None else 0,
+            'event_neighbours': self.events is not None,
+            'users_with_history': len(self.interactions.user_ids) if self.interactions is not None else 0,
+            'cooccurrence': self.cooccurrence is not None,
+            'collaborative': self.collaborative.summary() if self.collaborative is not None else None,
+        }
+
+    def item_scores(self, candidate_ids: List[str], attended_ids: List[str]) -> np.ndarray:
+        """Highest top-K item similarity between each candidate and the attended events"""
+        scores = np.zeros(len(candidate_ids), dtype=np.float32)
+        if self.events is None:
+            return scores
+        best: Dict[str, float] = {}
+        for event_id in attended_ids:
+            ids, sims = self.events.neighbours(event_id)
+            for i, sim in zip(ids, sims):
+                key = self.events.keys[i]
+                if sim > best.get(key, 0.0):
+                    best[key] = float(sim)
+        if best:
+            for i, event_id in enumerate(candidate_ids):
+                scores[i] = best.get(event_id, 0.0)
+        return scores
+
+    def user_scores(self, candidate_ids: List[str], user_id: str, neighbours: int = USER_NEIGHBOURS) -> np.ndarray:
+        """Similarity-weighted share of the user's nearest neighbours that attended each candidate"""
+        scores = np.zeros(len(candidate_ids), dtype=np.float32)
+        if self.collaborative is None:
+            return scores
+        rows, weights, total = self.collaborative.neighbour_event_weights(user_id, neighbours)
+        if total <= 0 or not len(rows):
+            return scores
+
+        event_ids = self.collaborative.interactions.event_ids
+        by_event = {event_ids[r]: w for r, w in zip(rows, weights)}
+        for i, event_id in enumerate(candidate_ids):
+            scores[i] = by_event.get(event_id, 0.0) / total
+        return scores
+
+    def coattendance_scores(self, candidate_ids: List[str], attended_ids: List[str]) -> np.ndarray:
+        """
+        Share of each candidate's attendees who also attended one of the
+        user's events. With a co-occurrence matrix this is the largest share
+        for any single attended event, read from a few sparse rows.
+        """
+        scores = np.zeros(len(candidate_ids), dtype=np.float32)
+        if self.interactions is None:
+            return scores
+        index = self.interactions.event_index
+        attended_rows = [index[e] for e in attended_ids if e in index]
+        if not attended_rows:
+            return scores
+        if self.cooccurrence is not None:
+            rows = np.fromiter((index.get(e, -1) for e in candidate_ids), dtype=np.int64, count=len(candidate_ids))
+            known = np.flatnonzero(rows >= 0)
+            if not len(known):
+                return scores
+            together = self.cooccurrence[np.unique(attended_rows)][:, rows[known]].max(axis=0).toarray().ravel()
+            attendees = np.diff(self.interactions.event_indptr)[rows[known]]
+            scores[known] = together / np.maximum(attendees, 1)
+            return scores
+        peers = np.unique(np.concatenate([self.interactions.event_rows(r) for r in attended_rows]))
+        for i, event_id in enumerate(candidate_ids):
+            row = index.get(event_id)
+            if row is None:
+                continue
+            attendees = self.interactions.event_rows(row)
+            if len(attendees):
+                scores[i] = np.count_nonzero(np.isin(attendees, peers, assume_unique=True)) / len(attendees)
+        return scores
+
+    def collaborative_scores(self, candidate_ids: List[str], user_id: Optional[str],
+                             attended_ids: List[str]) -> Dict[str, np.ndarray]:
+        """All collaborative signals plus their weighted blend, each in [0, 1]"""
+        signals = {
+            'item': self.item_scores(candidate_ids, attended_ids),
+            'user': self.user_scores(candidate_ids, user_id) if user_id else np.zeros(len(candidate_ids), dtype=np.float32),
+            'coattendance': self.coattendance_scores(candidate_ids, attended_ids),
+        }
+        signals['blend'] = sum(SIGNAL_WEIGHTS[name] * signals[name] for name in SIGNAL_WEIGHTS)
+        return signals
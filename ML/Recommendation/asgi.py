@@ -0,0 +1,188 @@
+"""
+ASGI Serving
+Runs the Flask app under an ASGI server. Scoring endpoints execute on a
+bounded thread pool with a queue-depth limit (503 when full) and a
+per-request timeout (504); every other endpoint has its own small pool, so
+/health and / answer while recommendations are computing.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 7860
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from server import app as flask_app
+
+logger = logging.getLogger("recommendation.asgi")
+
+# Path prefixes whose handlers do CPU-bound scoring
+SCORING_PATHS = ('/recommend',)
+SCORING_WORKERS = int(os.environ.get('RECOMMENDATION_SCORING_WORKERS', min(4, os.cpu_count() or 1)))
+# Scoring requests allowed to wait for a worker before new ones are shed with 503
+QUEUE_DEPTH = int(os.environ.get('RECOMMENDATION_QUEUE_DEPTH', 16))
+# Below the backend's ML_API_TIMEOUT (10s) so it gets a 504 instead of a socket timeout
+REQUEST_TIMEOUT = float(os.environ.get('RECOMMENDATION_REQUEST_TIMEOUT', 8))
+IO_WORKERS = int(os.environ.get('RECOMMENDATION_IO_WORKERS', 4))
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+def build_environ(scope: Dict, body: bytes) -> Dict:
+    """WSGI environ (PEP 3333) for an ASGI HTTP scope and its buffered body"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            continue
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app, environ: Dict) -> Tuple[int, Headers, bytes]:
+    """Run a WSGI app to completion and return status, headers and the buffered body"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    chunks = wsgi_app(environ, start_response)
+    try:
+        body = b''.join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return response['status'], response['headers'], body
+
+
+def json_response(status: int, payload: Dict, headers: Headers = ()) -> Tuple[int, Headers, bytes]:
+    return status, [(b'content-type', b'application/json')] + list(headers), json.dumps(payload).encode('utf-8')
+
+
+class BoundedWSGI:
+    """
+    ASGI wrapper around a WSGI app. Scoring requests count against
+    workers + queue_depth until their thread really finishes, so a timed-out
+    request keeps its slot and load is shed rather than piled up.
+    """
+
+    def __init__(self, wsgi_app, scoring_workers: int = SCORING_WORKERS, queue_depth: int = QUEUE_DEPTH,
+                 timeout: float = REQUEST_TIMEOUT, io_workers: int = IO_WORKERS):
+        self.wsgi_app = wsgi_app
+        self.scoring_workers = scoring_workers
+        self.limit = scoring_workers + queue_depth
+        self.timeout = timeout
+        self._scoring = ThreadPoolExecutor(scoring_workers, thread_name_prefix='scoring')
+        self._io = ThreadPoolExecutor(io_workers, thread_name_prefix='io')
+        # Only touched from the event loop thread
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def stats(self) -> Dict:
+        return {
+            'scoring_workers': self.scoring_workers,
+            'queue_limit': self.limit,
+            'in_flight': self.in_flight,
+            'queued': max(0, self.in_flight - self.scoring_workers),
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'timeout': self.timeout,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        body = await self._read_body(receive)
+        environ = build_environ(scope, body)
+        loop = asyncio.get_running_loop()
+
+        if not scope['path'].startswith(SCORING_PATHS):
+            response = await loop.run_in_executor(self._io, call_wsgi, self.wsgi_app, environ)
+            return await self._send(send, *response)
+
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            return await self._send(send, *json_response(
+                503, {'error': 'Recommendation service is busy, retry later', 'recommendations': []},
+                [(b'retry-after', b'1')]
+            ))
+
+        self.in_flight += 1
+        future: Future = self._scoring.submit(call_wsgi, self.wsgi_app, environ)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        try:
+            response = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+        except asyncio.TimeoutError:
+            # Drops the request if it never started; a running one finishes and is discarded
+            future.cancel()
+            self.timed_out += 1
+            response = json_response(504, {
+                'error': f'Recommendation timed out after {self.timeout:g}s',
+                'recommendations': []
+            })
+        await self._send(send, *response)
+
+    def _release(self):
+        self.in_flight -= 1
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    @staticmethod
+    async def _send(send, status: int, headers: Headers, body: bytes):
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self._scoring.shutdown(wait=False, cancel_futures=True)
+                self._io.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = BoundedWSGI(flask_app)
+# Lets /health report queue depth and shed/timed-out counts
+flask_app.extensions['serving'] = app
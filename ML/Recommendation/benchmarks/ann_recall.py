@@ -0,0 +1,137 @@
+"""
+Recall vs latency of ANN candidate retrieval against exact TF-IDF scoring
+
+    python benchmarks/ann_recall.py --events 100000 --queries 200 --ann-k 200,500,1000,2000
+
+Exact scores every event for each user profile from dataset/users.json.
+The candidate paths score only their pool: 'index' is the tag/type/organizer
+and recency pool, 'ann@k' adds the k nearest FAISS neighbours (efSearch is
+max(--ef, k)).
+Recall@k is the overlap of each path's top k with the exact top k.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ann  # noqa: E402
+from candidates import DEFAULT_POOL_SIZE, generate_candidates  # noqa: E402
+from event_store import EventVectorStore  # noqa: E402
+from scoring import boost_scores, profile_text, top_k  # noqa: E402
+from synthetic_events import generate_events  # noqa: E402
+
+USERS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dataset', 'users.json')
+
+
+def load_profiles(n: int, seed: int = 0):
+    with open(USERS) as f:
+        users = json.load(f)
+    rng = np.random.default_rng(seed)
+    return [{
+        'userId': u['user_id'],
+        'interests': u.get('interests', []),
+        'skills': u.get('skills', []),
+        'attendedEvents': [],
+    } for u in (users[i] for i in rng.choice(len(users), size=min(n, len(users)), replace=False))]
+
+
+def score(store, batch, profile, positions=None):
+    """Exact content + boost scores over the given batch positions (all when None)"""
+    vectors = batch.vectors if positions is None else batch.vectors[positions]
+    scores = (vectors @ batch.queries.T).toarray().ravel().astype(np.float32)
+    return scores + boost_scores(store, batch, profile, positions)
+
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000
+    return {f'p{p}': round(float(np.percentile(values, p)), 3) for p in (50, 95, 99)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--pool', type=int, default=DEFAULT_POOL_SIZE, help='Candidate pool / ANN neighbours')
+    parser.add_argument('--ann-k', default='200,500,1000,2000', help='Comma-separated ANN neighbour counts')
+    parser.add_argument('--ef', type=int, default=ann.EF_SEARCH, help='Minimum efSearch')
+    parser.add_argument('--output', default=None, help='Write results as JSON')
+    args = parser.parse_args(argv)
+
+    if not ann.available():
+        print("faiss is not installed; pip install faiss-cpu")
+        return 1
+
+    started = time.perf_counter()
+    events = generate_events(args.events)
+    store = EventVectorStore()
+    keys = [e['eventId'] for e in events]
+    store.ensure(events, catalogue=True)
+    ingest_seconds = time.perf_counter() - started
+
+    retriever = ann.ANNRetriever(store)
+    retriever.refresh(background=False)
+    build_seconds = retriever.stats()['build_seconds']
+
+    profiles = load_profiles(args.queries)
+    full = store.vectorize_keys(keys, [profile_text(p) for p in profiles])
+    ann_ks = [int(k) for k in args.ann_k.split(',')]
+    paths = ['exact', 'index'] + [f'ann@{k}' for k in ann_ks]
+    latency = {path: [] for path in paths}
+    recall = {path: [] for path in paths}
+    pool_sizes = {path: [] for path in paths}
+
+    for i, profile in enumerate(profiles):
+        batch = full._replace(queries=full.queries[i:i + 1])
+
+        t = time.perf_counter()
+        exact = top_k(score(store, batch, profile)[np.newaxis, :], args.k)[0]
+        latency['exact'].append(time.perf_counter() - t)
+        recall['exact'].append(1.0)
+        pool_sizes['exact'].append(len(keys))
+        truth = set(exact.tolist())
+
+        for path in paths[1:]:
+            t = time.perf_counter()
+            candidates = generate_candidates(store, batch, profile, args.pool)
+            if path != 'index':
+                nearest = retriever.candidates(batch, int(path.split('@')[1]), ef_search=args.ef)
+                candidates = np.union1d(candidates, nearest)
+            top = candidates[top_k(score(store, batch, profile, candidates)[np.newaxis, :], args.k)[0]]
+            latency[path].append(time.perf_counter() - t)
+            recall[path].append(len(truth.intersection(top.tolist())) / args.k)
+            pool_sizes[path].append(len(candidates))
+
+    results = {
+        'events': len(keys),
+        'queries': len(profiles),
+        'k': args.k,
+        'pool': args.pool,
+        'ingest_seconds': round(ingest_seconds, 2),
+        'ann_build_seconds': build_seconds,
+        'paths': {path: {
+            f'recall@{args.k}': round(float(np.mean(recall[path])), 4),
+            'mean_pool': int(np.mean(pool_sizes[path])),
+            'latency_ms': percentiles(latency[path]),
+        } for path in paths},
+    }
+
+    print(f"{len(keys)} events, {len(profiles)} queries, ingest {ingest_seconds:.1f}s, ANN build {build_seconds}s")
+    print(f"{'path':<10} {'recall@' + str(args.k):>10} {'pool':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for path, row in results['paths'].items():
+        ms = row['latency_ms']
+        print(f"{path:<10} {row[f'recall@{args.k}']:>10.3f} {row['mean_pool']:>8} "
+              f"{ms['p50']:>8.2f} {ms['p95']:>8.2f} {ms['p99']:>8.2f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
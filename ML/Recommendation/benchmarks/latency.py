@@ -0,0 +1,412 @@
+"""
+/recommend latency, throughput and memory at several catalogue sizes
+
+    python benchmarks/latency.py --scales 500,5000,50000 --concurrency 1,8 --output results/HEAD.json
+    python benchmarks/latency.py --mode http --scales 5000 --concurrency 1,4,16
+    python benchmarks/latency.py --compare results/base.json results/HEAD.json
+
+Events and users are synthetic (benchmarks/synthetic_events.py and
+synthetic_users.py). Every request comes from a different user so neither
+the user vector cache nor the result cache can answer it, and the result
+cache is disabled as well.
+
+Payloads:
+  inline     availableEvents in every request, as Backend/Controller/recommendation.js
+             sends today (the backend caps it at 500 events)
+  catalogue  events pushed once with POST /events/sync; requests carry only the profile
+
+Modes:
+  inprocess  recommend_events through Flask's test client, one fresh process
+             per scale so peak RSS is per scale (it includes the harness itself)
+  http       a fresh `python serve.py` per scale (or --url for a running
+             server); peak RSS is the server's VmHWM, when it can be read
+
+Results are written as JSON; --compare prints the change in p50/p95/p99 and
+throughput between two result files.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_events import generate_events  # noqa: E402
+from synthetic_users import generate_users  # noqa: E402
+
+PAYLOADS = ('inline', 'catalogue')
+# Applied to the service under test: no result cache, no model polling
+SERVICE_ENV = {
+    'RECOMMENDATION_RESULT_CACHE_SIZE': '0',
+    'RECOMMENDATION_MODEL_POLL': '0',
+}
+
+Post = Callable[[str, bytes], int]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def process_peak_rss_mb(pid: int) -> Optional[float]:
+    """VmHWM of another process, or None where /proc is not available"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def latency_summary(samples: List[float]) -> Dict:
+    values = np.asarray(samples) * 1000
+    summary = {f'p{p}': round(float(np.percentile(values, p)), 3) for p in (50, 95, 99)}
+    summary['mean'] = round(float(values.mean()), 3)
+    summary['max'] = round(float(values.max()), 3)
+    return summary
+
+
+class RequestBodies:
+    """
+    /recommend bodies built on demand outside the timed section; the event
+    list is serialized once and spliced in, so inline payloads at large
+    scales do not hold one copy per request
+    """
+
+    def __init__(self, users: List[Dict], events: List[Dict], payload: str, options: Dict):
+        self.users = users
+        self.options = json.dumps(options)[1:-1]
+        self.events = json.dumps(events) if payload == 'inline' else None
+
+    def __call__(self, i: int) -> bytes:
+        body = '{"userProfile": ' + json.dumps(self.users[i % len(self.users)])
+        if self.options:
+            body += ', ' + self.options
+        if self.events is not None:
+            body += ', "availableEvents": ' + self.events
+        return (body + '}').encode('utf-8')
+
+
+def run_load(post: Post, bodies: RequestBodies, requests: int, concurrency: int, offset: int = 0) -> Dict:
+    """Send requests bodies from concurrency threads and summarise latency and throughput"""
+    counter = itertools.count(offset)
+    last = offset + requests
+    lock = threading.Lock()
+    latencies, statuses = [], {}
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter)
+            if i >= last:
+                return
+            body = bodies(i)
+            started = time.perf_counter()
+            status = post('/recommend', body)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': sum(count for status, count in statuses.items() if status != 200),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'latency_ms': latency_summary(latencies),
+        'throughput_rps': round(requests / wall, 2),
+        'wall_seconds': round(wall, 3),
+    }
+
+
+def run_scale(post: Post, scale: int, args: Dict) -> List[Dict]:
+    """Every payload x concurrency combination for one catalogue size"""
+    events = generate_events(scale, seed=args['seed'])
+    per_run = args['warmup'] + args['requests']
+    runs_per_payload = len(args['concurrency'])
+    users = generate_users(per_run * runs_per_payload * len(args['payloads']), events, seed=args['seed'])
+    options = {'limit': args['limit']}
+    if args['scoring_mode']:
+        options['scoringMode'] = args['scoring_mode']
+    if args['retrieval']:
+        options['retrieval'] = args['retrieval']
+
+    runs, offset = [], 0
+    for payload in args['payloads']:
+        setup_seconds = None
+        if payload == 'catalogue':
+            started = time.perf_counter()
+            status = post('/events/sync', json.dumps({'events': events}).encode('utf-8'))
+            if status != 200:
+                raise RuntimeError(f"Loading the catalogue failed with HTTP {status}")
+            setup_seconds = round(time.perf_counter() - started, 3)
+        bodies = RequestBodies(users, events, payload, options)
+        for concurrency in args['concurrency']:
+            # Warm-up requests fit the vocabulary and vectorize the events
+            run_load(post, bodies, args['warmup'], concurrency, offset)
+            result = run_load(post, bodies, args['requests'], concurrency, offset + args['warmup'])
+            offset += per_run
+            runs.append({'scale': scale, 'payload': payload, 'setup_seconds': setup_seconds, **result})
+            print(f"  {payload:<9} c={concurrency:<3} p50 {result['latency_ms']['p50']:>9.2f} ms  "
+                  f"p95 {result['latency_ms']['p95']:>9.2f} ms  p99 {result['latency_ms']['p99']:>9.2f} ms  "
+                  f"{result['throughput_rps']:>8.1f} req/s  errors {result['errors']}", flush=True)
+    return runs
+
+
+def inprocess_scale(scale: int, args: Dict) -> List[Dict]:
+    """Child process entry point: import the service with benchmark settings and drive its test client"""
+    os.environ.update(SERVICE_ENV)
+    os.chdir(SERVICE_DIR)
+    import logging
+    logging.disable(logging.INFO)
+    import server
+
+    local = threading.local()
+
+    def post(path: str, body: bytes) -> int:
+        if not hasattr(local, 'client'):
+            local.client = server.app.test_client()
+        return local.client.post(path, data=body, content_type='application/json').status_code
+
+    runs = run_scale(post, scale, args)
+    rss = peak_rss_mb()
+    return [{**run, 'peak_rss_mb': rss} for run in runs]
+
+
+def http_poster(base_url: str, timeout: float) -> Post:
+    """POST over one keep-alive connection per client thread"""
+    url = urlparse(base_url)
+    local = threading.local()
+
+    def post(path: str, body: bytes) -> int:
+        for attempt in range(2):
+            if getattr(local, 'connection', None) is None:
+                local.connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+            try:
+                local.connection.request('POST', url.path.rstrip('/') + path, body,
+                                         {'Content-Type': 'application/json'})
+                response = local.connection.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, OSError):
+                # The server closed an idle keep-alive connection; reconnect once
+                local.connection.close()
+                local.connection = None
+                if attempt:
+                    raise
+
+    return post
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning'],
+        cwd=SERVICE_DIR, env={**os.environ, **SERVICE_ENV},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve.py exited with code {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("serve.py did not become healthy within 60s")
+
+
+def http_scale(scale: int, args: Dict) -> List[Dict]:
+    post = http_poster(args['url'], args['timeout']) if args['url'] else None
+    if post is not None:
+        return [{**run, 'peak_rss_mb': None} for run in run_scale(post, scale, args)]
+
+    port = free_port()
+    process = start_server(port, args['workers'])
+    try:
+        runs = run_scale(http_poster(f'http://127.0.0.1:{port}', args['timeout']), scale, args)
+        rss = process_peak_rss_mb(process.pid)
+    finally:
+        process.terminate()
+        process.wait()
+    return [{**run, 'peak_rss_mb': rss} for run in runs]
+
+
+def git_revision() -> Optional[str]:
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVICE_DIR,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--', '.'], cwd=SERVICE_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return revision + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_key(run: Dict) -> Tuple:
+    return run['scale'], run['payload'], run['concurrency']
+
+
+def compare(baseline: Dict, current: Dict) -> List[Dict]:
+    """Percentage change per matching run; positive latency and negative throughput are regressions"""
+    before = {run_key(run): run for run in baseline['runs']}
+    rows = []
+    for run in current['runs']:
+        base = before.get(run_key(run))
+        if base is None:
+            continue
+        row = {'scale': run['scale'], 'payload': run['payload'], 'concurrency': run['concurrency']}
+        for p in ('p50', 'p95', 'p99'):
+            row[p] = round(100 * (run['latency_ms'][p] / base['latency_ms'][p] - 1), 1)
+        row['throughput'] = round(100 * (run['throughput_rps'] / base['throughput_rps'] - 1), 1)
+        rows.append(row)
+    return rows
+
+
+def print_comparison(baseline: Dict, current: Dict) -> List[Dict]:
+    rows = compare(baseline, current)
+    print(f"{baseline['meta'].get('revision')} -> {current['meta'].get('revision')} (change in %)")
+    print(f"{'scale':>8} {'payload':<9} {'conc':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8}")
+    for row in rows:
+        print(f"{row['scale']:>8} {row['payload']:<9} {row['concurrency']:>4} {row['p50']:>+8.1f} "
+              f"{row['p95']:>+8.1f} {row['p99']:>+8.1f} {row['throughput']:>+8.1f}")
+    return rows
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(',') if v]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('inprocess', 'http'), default='inprocess')
+    parser.add_argument('--scales', type=int_list, default=[500, 5000, 50000], help='Comma-separated event counts')
+    parser.add_argument('--payloads', default=','.join(PAYLOADS), help='Comma-separated: inline, catalogue')
+    parser.add_argument('--concurrency', type=int_list, default=[1, 8], help='Comma-separated client thread counts')
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per run')
+    parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests before each run')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--scoring-mode', default=None, help='scoringMode sent with each request')
+    parser.add_argument('--retrieval', default=None, help='retrieval sent with each request')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', default=None,
+                        help='http mode: benchmark a running server instead of starting one '
+                             '(the catalogue payload replaces its catalogue)')
+    parser.add_argument('--workers', type=int, default=1, help='http mode: serve.py worker processes')
+    parser.add_argument('--timeout', type=float, default=60, help='http mode: client socket timeout')
+    parser.add_argument('--output', default=None, help='Write results as JSON')
+    parser.add_argument('--compare', nargs='+', metavar='RESULTS',
+                        help='BASELINE [CURRENT]: compare two result files, or a baseline with this run')
+    parser.add_argument('--max-regression', type=float, default=None,
+                        help='With --compare, exit 1 when any p95 grows by more than this percentage')
+    args = parser.parse_args(argv)
+
+    if args.compare and len(args.compare) > 2:
+        parser.error('--compare takes a baseline and at most one current result file')
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            rows = print_comparison(json.load(f), json.load(g))
+        return _regressed(rows, args.max_regression)
+
+    payloads = [p for p in args.payloads.split(',') if p]
+    unknown = set(payloads) - set(PAYLOADS)
+    if unknown:
+        parser.error(f"unknown payloads: {', '.join(sorted(unknown))}")
+    config = {
+        'payloads': payloads,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'warmup': args.warmup,
+        'limit': args.limit,
+        'scoring_mode': args.scoring_mode,
+        'retrieval': args.retrieval,
+        'seed': args.seed,
+        'url': args.url,
+        'workers': args.workers,
+        'timeout': args.timeout,
+    }
+
+    runs = []
+    for scale in args.scales:
+        print(f"{scale} events ({args.mode})", flush=True)
+        if args.mode == 'http':
+            runs.extend(http_scale(scale, config))
+        else:
+            # A fresh interpreter per scale keeps peak RSS and caches independent
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                runs.extend(pool.submit(inprocess_scale, scale, config).result())
+
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'mode': args.mode,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'config': {**config, 'scales': args.scales},
+        },
+        'runs': runs,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            rows = print_comparison(json.load(f), results)
+        return _regressed(rows, args.max_regression)
+    return 0
+
+
+def _regressed(rows: List[Dict], max_regression: Optional[float]) -> int:
+    if max_regression is None:
+        return 0
+    worse = [row for row in rows if row['p95'] > max_regression]
+    for row in worse:
+        print(f"p95 regression of {row['p95']:+.1f}% at {row['scale']} events, "
+              f"{row['payload']} payload, concurrency {row['concurrency']}")
+    return 1 if worse else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Scale dataset/events.json up to any size by recombining real events
+
+    python benchmarks/synthetic_events.py --events 100000 --output /tmp/events_100k.json
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dataset', 'events.json')
+SECONDS_PER_DAY = 86400
+
+
+def load_events(path: str = DATASET) -> List[Dict]:
+    """dataset/events.json in the request format the service expects"""
+    with open(path) as f:
+        raw = json.load(f)
+    return [{
+        'eventId': e['event_id'],
+        'title': e.get('title', ''),
+        'description': e.get('description', ''),
+        'tags': e.get('tags', []),
+        'type': e.get('type', ''),
+        'organizer': e.get('organizationName', ''),
+    } for e in raw]
+
+
+def generate_events(n: int, base: List[Dict] = None, seed: int = 0, now: float = None) -> List[Dict]:
+    """
+    n synthetic events: title and description halves spliced from two real
+    events, 1-4 tags and a type from the real pools, organizers spread over
+    variants of the real ones, and dates within +/- 60 days of now
+    """
+    base = base or load_events()
+    rng = np.random.default_rng(seed)
+    now = time.time() if now is None else now
+    tags = sorted({t for e in base for t in e['tags']})
+    types = sorted({e['type'] for e in base if e['type']})
+    organizers = sorted({e['organizer'] for e in base if e['organizer']})
+
+    firsts = rng.integers(len(base), size=n)
+    seconds = rng.integers(len(base), size=n)
+    tag_counts = rng.integers(1, 5, size=n)
+    offsets = rng.uniform(-60, 60, size=n) * SECONDS_PER_DAY
+    events = []
+    for i in range(n):
+        a, b = base[firsts[i]], base[seconds[i]]
+        title_a, title_b = a['title'].split(), b['title'].split()
+        desc_a, desc_b = a['description'].split('. '), b['description'].split('. ')
+        events.append({
+            'eventId': f"syn-{i:07d}",
+            'title': ' '.join(title_a[:len(title_a) // 2 + 1] + title_b[len(title_b) // 2 + 1:]),
+            'description': '. '.join(desc_a[:len(desc_a) // 2 + 1] + desc_b[len(desc_b) // 2 + 1:]),
+            'tags': [str(t) for t in rng.choice(tags, size=min(tag_counts[i], len(tags)), replace=False)],
+            'type': types[rng.integers(len(types))],
+            'organizer': f"{organizers[rng.integers(len(organizers))]} {rng.integers(50)}",
+            'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(now + offsets[i])),
+        })
+    return events
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    events = generate_events(args.events, seed=args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(events, f)
+    print(f"Wrote {len(events)} events to {args.output} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Synthetic user profiles shaped like dataset/users.json and the backend's /recommend payload
+
+    python benchmarks/synthetic_users.py --users 10000 --events /tmp/events_100k.json --output /tmp/users_10k.json
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dataset', 'users.json')
+
+
+def load_users(path: str = DATASET) -> List[Dict]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def history_entry(event: Dict) -> Dict:
+    """The subset of an event the backend sends in attendedEvents / registeredEvents"""
+    return {key: event.get(key) for key in ('eventId', 'title', 'type', 'tags', 'organizer')}
+
+
+def generate_users(n: int, events: List[Dict] = None, base: List[Dict] = None, seed: int = 0,
+                   max_history: int = 5) -> List[Dict]:
+    """
+    n profiles in the backend's userProfile format: 2-6 interests and
+    skills drawn from the real pools, and up to max_history attended and
+    registered events sampled from events (no history when events is None)
+    """
+    base = base or load_users()
+    rng = np.random.default_rng(seed)
+    interests = sorted({i for u in base for i in u.get('interests', [])})
+    skills = sorted({s for u in base for s in u.get('skills', [])})
+
+    profiles = []
+    for i in range(n):
+        attended, registered = [], []
+        if events:
+            picks = rng.integers(len(events), size=rng.integers(0, max_history + 1) + rng.integers(0, 3))
+            history = [history_entry(events[j]) for j in picks]
+            split = rng.integers(0, len(history) + 1)
+            attended, registered = history[:split], history[split:]
+        profiles.append({
+            'userId': f"bench-user-{i:07d}",
+            'interests': [str(x) for x in rng.choice(interests, size=rng.integers(2, 7), replace=False)],
+            'skills': [str(x) for x in rng.choice(skills, size=rng.integers(2, 7), replace=False)],
+            'attendedEvents': attended,
+            'registeredEvents': registered,
+        })
+    return profiles
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--events', default=None, help='JSON array of events to draw history from')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    events = None
+    if args.events:
+        with open(args.events) as f:
+            events = json.load(f)
+    users = generate_users(args.users, events, seed=args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(users, f)
+    print(f"Wrote {len(users)} users to {args.output} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
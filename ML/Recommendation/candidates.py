@@ -0,0 +1,119 @@
+"""
+Candidate Generation
+Cheap first stage of the recommendation pipeline: pick a bounded pool of
+plausible events so exact scoring only runs on those
+"""
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from event_store import EventBatch, EventVectorStore
+from scoring import ORGANIZER_BOOST, TAG_BOOST, TYPE_BOOST, boost_scores
+
+# Candidate pool used when the request does not set candidatePoolSize
+DEFAULT_POOL_SIZE = 500
+# Events starting within this many days are always considered
+DEFAULT_RECENCY_DAYS = 14
+# Small pre-score for upcoming events so they win ties against older matches
+RECENCY_WEIGHT = 0.05
+# Walk posting lists only while they cover less than this share of the
+# batch; broader terms are cheaper as one vectorized boost pass
+MAX_POSTING_SHARE = 0.05
+
+SECONDS_PER_DAY = 86400.0
+
+
+def recency_mask(batch: EventBatch, recency_days: float, now: Optional[float] = None) -> np.ndarray:
+    """Events dated between now and now + recency_days"""
+    if recency_days is None or recency_days <= 0:
+        return np.zeros(len(batch.timestamps), dtype=bool)
+    now = time.time() if now is None else now
+    with np.errstate(invalid='ignore'):
+        return (batch.timestamps >= now) & (batch.timestamps <= now + recency_days * SECONDS_PER_DAY)
+
+
+def batch_positions(batch: EventBatch, rows: np.ndarray) -> np.ndarray:
+    """Position in the batch of each store row, -1 for rows not in the batch"""
+    rows = np.asarray(rows, dtype=np.int64)
+    positions = np.full(len(rows), -1, dtype=np.int64)
+    if not len(batch.rows):
+        return positions
+    position = np.full(int(batch.rows.max()) + 1, -1, dtype=np.int64)
+    position[batch.rows] = np.arange(len(batch.rows))
+    valid = (rows >= 0) & (rows < len(position))
+    positions[valid] = position[rows[valid]]
+    return positions
+
+
+def index_prescores(store: EventVectorStore, batch: EventBatch,
+                    user_profile: Dict) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Batch positions of events posted under the user's interests (tag, type)
+    or attended organizers, with their boost as a pre-score. Selective terms
+    are answered from the posting lists, so work is proportional to the
+    matches rather than the catalogue. None when the store has refit since
+    the batch was built, as its rows no longer match the batch.
+    """
+    interests = user_profile.get('interests', [])
+    organizers = [e.get('organizer') for e in user_profile.get('attendedEvents', [])]
+    index = store.index
+
+    postings = (index.posting_count('tag', interests) + index.posting_count('type', interests)
+                + index.posting_count('organizer', organizers))
+    if postings > MAX_POSTING_SHARE * len(batch.rows):
+        boosts = boost_scores(store, batch, user_profile)
+        positions = np.flatnonzero(boosts > 0)
+        return positions, boosts[positions]
+
+    pre: Dict[str, float] = {}
+    for key, count in index.counts('tag', interests).items():
+        pre[key] = TAG_BOOST * count
+    for key in index.lookup('type', interests):
+        pre[key] = pre.get(key, 0.0) + TYPE_BOOST
+    for key in index.lookup('organizer', organizers):
+        pre[key] = pre.get(key, 0.0) + ORGANIZER_BOOST
+    if not pre or not len(batch.rows):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    keys = list(pre)
+    rows = store.rows_of(keys, batch.version)
+    if rows is None:
+        return None
+    positions = batch_positions(batch, rows)
+    found = positions >= 0
+    scores = np.fromiter((pre[k] for k in keys), dtype=np.float32, count=len(keys))
+    return positions[found], scores[found]
+
+
+def generate_candidates(store: EventVectorStore, batch: EventBatch, user_profile: Dict, pool_size: int,
+                        recency_days: float = DEFAULT_RECENCY_DAYS,
+                        now: Optional[float] = None) -> Optional[np.ndarray]:
+    """
+    Indices of candidate events, or None when the whole batch should be scored.
+
+    Sources are the inverted-index matches for the user's interests and
+    attended organizers and events inside the recency window. When the
+    union is larger than pool_size it is trimmed by the index pre-score with
+    argpartition.
+    """
+    n = len(batch.rows)
+    if pool_size is None or pool_size <= 0 or n <= pool_size:
+        return None
+
+    prescores = index_prescores(store, batch, user_profile)
+    if prescores is None:
+        return None
+    positions, scores = prescores
+    pre_score = np.zeros(n, dtype=np.float32)
+    pre_score[positions] = scores
+    recent = recency_mask(batch, recency_days, now)
+    pre_score += RECENCY_WEIGHT * recent
+
+    selected = recent.copy()
+    selected[positions] = True
+    candidates = np.flatnonzero(selected)
+    if len(candidates) > pool_size:
+        keep = np.argpartition(-pre_score[candidates], pool_size - 1)[:pool_size]
+        candidates = np.sort(candidates[keep])
+    return candidates
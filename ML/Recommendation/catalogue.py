@@ -0,0 +1,155 @@
+"""
+Event Catalogue
+Server-side copy of the events the backend has pushed, so /recommend can
+take event IDs or a filter instead of the full event list on every call
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from event_store import EventBatch, EventVectorStore, content_hash, event_timestamp
+
+logger = logging.getLogger("recommendation.catalogue")
+
+# Filter fields answered from the inverted index, and the index kind each one reads
+INDEXED_FILTERS = {'tags': 'tag', 'types': 'type', 'organizers': 'organizer'}
+
+
+class VersionConflict(Exception):
+    """A write named a catalogue version (If-Match) that is no longer current"""
+
+
+def _digest(event: Dict) -> str:
+    return content_hash(json.dumps(event, sort_keys=True, default=str))
+
+
+class EventCatalogue:
+    """
+    Events keyed by eventId with a version that is bumped once per change.
+    The version is exposed as an ETag so the backend can skip syncs when
+    nothing changed and guard writes with If-Match.
+    """
+
+    def __init__(self, store: EventVectorStore):
+        self.store = store
+        self._lock = threading.RLock()
+        self._events: Dict[str, Dict] = {}
+        self._digests: Dict[str, str] = {}
+        # Distinguishes this process so ETags from before a restart never match
+        self._epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.updated_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def __contains__(self, event_id) -> bool:
+        return str(event_id) in self._events
+
+    @property
+    def etag(self) -> str:
+        return f'"{self._epoch}-{self.version}"'
+
+    def get(self, event_id) -> Optional[Dict]:
+        return self._events.get(str(event_id))
+
+    def matches(self, if_match: Optional[str]) -> bool:
+        """Whether an If-Match header value names the current version"""
+        if not if_match or if_match.strip() == '*':
+            return True
+        return self.etag in (tag.strip() for tag in if_match.split(','))
+
+    def update(self, upsert: List[Dict], remove: Iterable = (), if_match: Optional[str] = None) -> Dict[str, int]:
+        """Add or replace events and remove IDs as one version; unchanged events are not re-vectorized"""
+        with self._lock:
+            if not self.matches(if_match):
+                raise VersionConflict(f"Catalogue is at {self.etag}")
+            return self._apply(upsert, remove)
+
+    def sync(self, events: List[Dict], if_match: Optional[str] = None) -> Dict[str, int]:
+        """Replace the whole catalogue with events, dropping everything not listed"""
+        with self._lock:
+            keep = {str(e.get('eventId')) for e in events}
+            return self.update(events, [k for k in self._events if k not in keep], if_match)
+
+    def _apply(self, upsert: List[Dict], remove: Iterable) -> Dict[str, int]:
+        changed = {}
+        for event in upsert:
+            if event.get('eventId') is None:
+                raise ValueError('Every catalogue event needs an eventId')
+            key = str(event['eventId'])
+            digest = _digest(event)
+            if self._digests.get(key) != digest:
+                changed[key] = (event, digest)
+        removed = [str(k) for k in remove if str(k) in self._events]
+
+        if changed:
+            self.store.ensure([event for event, _ in changed.values()], catalogue=True)
+            for key, (event, digest) in changed.items():
+                self._events[key] = event
+                self._digests[key] = digest
+        if removed:
+            self.store.remove(removed)
+            for key in removed:
+                del self._events[key]
+                del self._digests[key]
+
+        if changed or removed:
+            self.version += 1
+            self.updated_at = time.time()
+            logger.info(f"Catalogue version {self.version}: {len(changed)} upserted, "
+                        f"{len(removed)} removed, {len(self._events)} events")
+        return {'upserted': len(changed), 'unchanged': len(upsert) - len(changed), 'removed': len(removed)}
+
+    def select(self, event_ids: Optional[Iterable] = None,
+               filters: Optional[Dict] = None) -> Tuple[List[str], List[Dict]]:
+        """
+        Keys and events for a request: the given IDs (unknown ones are
+        skipped) or the whole catalogue, narrowed by an optional filter with
+        tags/types/organizers (any-of, via the inverted index) and
+        dateFrom/dateTo.
+        """
+        with self._lock:
+            if event_ids is None:
+                keys = list(self._events)
+            else:
+                keys = [k for k in map(str, event_ids) if k in self._events]
+
+            for field, kind in INDEXED_FILTERS.items():
+                if filters and filters.get(field) is not None:
+                    allowed = self.store.index.lookup(kind, filters[field])
+                    keys = [k for k in keys if k in allowed]
+
+            date_from = event_timestamp(filters.get('dateFrom')) if filters else float('nan')
+            date_to = event_timestamp(filters.get('dateTo')) if filters else float('nan')
+            if date_from == date_from or date_to == date_to:
+                keys = [k for k in keys if self._in_range(self._events[k], date_from, date_to)]
+
+            return keys, [self._events[k] for k in keys]
+
+    def vectorize(self, texts: List[str], event_ids: Optional[Iterable] = None,
+                  filters: Optional[Dict] = None,
+                  user_keys: Optional[List] = None, with_texts: bool = False) -> Tuple[List[Dict], Optional[EventBatch]]:
+        """Selected events and their batch, read under one lock so a concurrent delete cannot split them"""
+        with self._lock:
+            keys, events = self.select(event_ids, filters)
+            return events, (self.store.vectorize_keys(keys, texts, user_keys, with_texts) if keys else None)
+
+    @staticmethod
+    def _in_range(event: Dict, date_from: float, date_to: float) -> bool:
+        when = event_timestamp(event.get('date'))
+        if when != when:
+            return False
+        return not (when < date_from) and not (when > date_to)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'events': len(self._events),
+                'version': self.version,
+                'etag': self.etag,
+                'updated_at': self.updated_at,
+            }
@@ -0,0 +1,298 @@
+"""
+Collaborative Filtering Engine
+Production version of the similar_user / events_of_user / recommend helpers
+from Scripts/main.ipynb, backed by precomputed top-K neighbour lists
+"""
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+logger = logging.getLogger("recommendation.collaborative")
+
+TOP_K = 50
+BLOCK_SIZE = 1024
+# Upper bound on the dense rows x N similarity block held at once (float32)
+MAX_BLOCK_CELLS = 16_000_000
+
+
+def _block_rows(n: int, block_size: int) -> int:
+    return max(1, min(block_size, MAX_BLOCK_CELLS // max(n, 1)))
+
+
+def _top_k_block(block: np.ndarray, row_offset: int, k: int, exclude_self: bool) -> Tuple[np.ndarray, np.ndarray]:
+    block = np.array(block, dtype=np.float32)
+    rows = np.arange(block.shape[0])
+    if exclude_self:
+        block[rows, rows + row_offset] = -np.inf
+    k_eff = min(k, block.shape[1])
+    part = np.argpartition(-block, k_eff - 1, axis=1)[:, :k_eff]
+    part_scores = np.take_along_axis(block, part, axis=1)
+    # Only the K survivors are sorted, so each row costs O(N + K log K)
+    order = np.argsort(-part_scores, axis=1)
+    ids = np.take_along_axis(part, order, axis=1).astype(np.int32)
+    scores = np.take_along_axis(part_scores, order, axis=1)
+
+    invalid = ~np.isfinite(scores) | (scores <= 0)
+    ids[invalid] = -1
+    scores[invalid] = 0.0
+    if k_eff < k:
+        pad = k - k_eff
+        ids = np.pad(ids, ((0, 0), (0, pad)), constant_values=-1)
+        scores = np.pad(scores, ((0, 0), (0, pad)))
+    return ids, scores.astype(np.float32)
+
+
+def top_k_from_similarity(similarity: np.ndarray, k: int = TOP_K, block_size: int = BLOCK_SIZE,
+                          exclude_self: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-K neighbour ids (int32, -1 padded) and scores (float32) per row of a dense similarity matrix"""
+    n = similarity.shape[0]
+    ids = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    block_size = _block_rows(similarity.shape[1], block_size)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        ids[start:stop], scores[start:stop] = _top_k_block(similarity[start:stop], start, k, exclude_self)
+    return ids, scores
+
+
+def top_k_from_vectors(vectors, k: int = TOP_K, block_size: int = BLOCK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-K cosine neighbours of dense or scipy sparse row vectors, computed
+    block by block so only a bounded rows x N slice is ever materialized
+    """
+    if sp.issparse(vectors):
+        vectors = normalize(sp.csr_matrix(vectors, dtype=np.float32))
+        product = lambda block: (block @ vectors.T).toarray()  # noqa: E731
+    else:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+        product = lambda block: block @ vectors.T  # noqa: E731
+    n = vectors.shape[0]
+    ids = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    block_size = _block_rows(n, block_size)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        ids[start:stop], scores[start:stop] = _top_k_block(product(vectors[start:stop]), start, k, True)
+    return ids, scores
+
+
+class NeighbourIndex:
+    """Fixed-width neighbour lists: row i holds the K nearest rows to key i"""
+
+    def __init__(self, keys: List[str], ids: np.ndarray, scores: np.ndarray):
+        self.keys = list(keys)
+        self.key_index = {key: i for i, key in enumerate(self.keys)}
+        self.ids = ids
+        self.scores = scores
+
+    @property
+    def k(self) -> int:
+        return self.ids.shape[1]
+
+    def neighbours(self, key: str, k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        row = self.key_index.get(key)
+        if row is None:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        ids = self.ids[row, :k]
+        scores = self.scores[row, :k]
+        valid = ids >= 0
+        return ids[valid], scores[valid]
+
+    def to_arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+        return {
+            f"{prefix}_topk_ids": np.asarray(self.ids, dtype=np.int32),
+            f"{prefix}_topk_scores": np.asarray(self.scores, dtype=np.float32),
+        }
+
+    @classmethod
+    def from_arrays(cls, prefix: str, keys: List[str], arrays: Dict[str, np.ndarray]) -> Optional['NeighbourIndex']:
+        if f"{prefix}_topk_ids" not in arrays:
+            return None
+        return cls(keys, arrays[f"{prefix}_topk_ids"], arrays[f"{prefix}_topk_scores"])
+
+
+class InteractionIndex:
+    """CSR index from user to attended events, with the transposed event -> users view"""
+
+    def __init__(self, user_ids: List[str], event_ids: List[str],
+                 indptr: np.ndarray, indices: np.ndarray,
+                 event_indptr: Optional[np.ndarray] = None, event_users: Optional[np.ndarray] = None):
+        self.user_ids = list(user_ids)
+        self.user_index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self.event_ids = list(event_ids)
+        self.event_index = {event_id: i for i, event_id in enumerate(self.event_ids)}
+        self.indptr = indptr
+        self.indices = indices
+
+        if event_indptr is None or event_users is None:
+            # Transpose once so event -> attendees is also a slice
+            order = np.argsort(indices, kind='stable')
+            user_of_entry = np.repeat(np.arange(len(self.user_ids), dtype=np.int32), np.diff(indptr))
+            event_users = user_of_entry[order]
+            event_indptr = np.zeros(len(self.event_ids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(indices, minlength=len(self.event_ids)), out=event_indptr[1:])
+        self.event_indptr = event_indptr
+        self.event_users = event_users
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            'interactions_indptr': np.asarray(self.indptr, dtype=np.int64),
+            'interactions_indices': np.asarray(self.indices, dtype=np.int32),
+            'interactions_event_indptr': np.asarray(self.event_indptr, dtype=np.int64),
+            'interactions_event_users': np.asarray(self.event_users, dtype=np.int32),
+        }
+
+    @classmethod
+    def from_arrays(cls, user_ids: List[str], event_ids: List[str],
+                    arrays: Dict[str, np.ndarray]) -> Optional['InteractionIndex']:
+        if 'interactions_indptr' not in arrays:
+            return None
+        return cls(user_ids, event_ids, arrays['interactions_indptr'], arrays['interactions_indices'],
+                   arrays['interactions_event_indptr'], arrays['interactions_event_users'])
+
+    @classmethod
+    def from_mapping(cls, user_ids: List[str], user_events: Dict[str, Iterable[str]]) -> 'InteractionIndex':
+        event_index: Dict[str, int] = {}
+        indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+        indices: List[int] = []
+        for row, user_id in enumerate(user_ids):
+            for event_id in dict.fromkeys(map(str, user_events.get(user_id, ()))):
+                indices.append(event_index.setdefault(event_id, len(event_index)))
+            indptr[row + 1] = len(indices)
+        return cls(user_ids, list(event_index), indptr, np.asarray(indices, dtype=np.int32))
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def matrix(self, n_users: Optional[int] = None, n_events: Optional[int] = None) -> sp.csr_matrix:
+        """Binary users x events CSR view, optionally widened with empty rows/columns for new ids"""
+        n_users = len(self.user_ids) if n_users is None else n_users
+        n_events = len(self.event_ids) if n_events is None else n_events
+        indptr = np.concatenate([self.indptr, np.full(n_users - len(self.user_ids), self.indptr[-1], dtype=np.int64)])
+        return sp.csr_matrix((np.ones(len(self.indices), dtype=np.float32), self.indices, indptr),
+                             shape=(n_users, n_events))
+
+    def cooccurrence(self) -> sp.csr_matrix:
+        """events x events count of users who attended both; the diagonal is attendees per event"""
+        matrix = self.matrix()
+        return (matrix.T @ matrix).tocsr()
+
+    def user_rows(self, user_row: int) -> np.ndarray:
+        return self.indices[self.indptr[user_row]:self.indptr[user_row + 1]]
+
+    def event_rows(self, event_row: int) -> np.ndarray:
+        return self.event_users[self.event_indptr[event_row]:self.event_indptr[event_row + 1]]
+
+    def events_of_user(self, user_id: str) -> List[str]:
+        row = self.user_index.get(user_id)
+        if row is None:
+            return []
+        return [self.event_ids[i] for i in self.user_rows(row)]
+
+    def users_of_event(self, event_id: str) -> List[str]:
+        row = self.event_index.get(event_id)
+        if row is None:
+            return []
+        return [self.user_ids[i] for i in self.event_rows(row)]
+
+
+class CollaborativeEngine:
+    def __init__(self, users: NeighbourIndex, interactions: InteractionIndex):
+        self.users = users
+        self.interactions = interactions
+        # Neighbour rows index users.keys; map them onto interaction rows once
+        self._interaction_row = np.array(
+            [interactions.user_index.get(user_id, -1) for user_id in users.keys], dtype=np.int64
+        )
+
+    @classmethod
+    def build(cls, user_ids: List[str], interactions: InteractionIndex,
+              users_similarity: Optional[np.ndarray] = None, users_vector: Optional[np.ndarray] = None,
+              k: int = TOP_K) -> Optional['CollaborativeEngine']:
+        """Precompute neighbour lists from a dense similarity matrix or, failing that, raw user vectors"""
+        if users_similarity is not None:
+            ids, scores = top_k_from_similarity(users_similarity, k)
+        elif users_vector is not None:
+            ids, scores = top_k_from_vectors(users_vector, k)
+        else:
+            return None
+        logger.info(f"Built collaborative engine: {len(user_ids)} users, top-{k} neighbours, "
+                    f"{len(interactions)} interactions")
+        return cls(NeighbourIndex(user_ids, ids, scores), interactions)
+
+    def similar_users(self, user_id: str, k: Optional[int] = None) -> List[Tuple[str, float]]:
+        ids, scores = self.users.neighbours(user_id, k)
+        return [(self.users.keys[i], float(s)) for i, s in zip(ids, scores)]
+
+    def events_of_user(self, user_id: str) -> List[str]:
+        return self.interactions.events_of_user(user_id)
+
+    def neighbour_event_weights(self, user_id: str, k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, float]:
+        """
+        Accumulate neighbour similarity per event attended by the user's top-K
+        neighbours. Returns (event rows, summed weights, total neighbour weight);
+        cost is O(K * events per neighbour), independent of the user count.
+        """
+        ids, scores = self.users.neighbours(user_id, k)
+        rows = self._interaction_row[ids] if len(ids) else np.empty(0, dtype=np.int64)
+        keep = rows >= 0
+        rows, scores = rows[keep], scores[keep]
+        total = float(scores.sum())
+        if not len(rows):
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32), total
+
+        events = [self.interactions.user_rows(r) for r in rows]
+        counts = np.fromiter((len(e) for e in events), dtype=np.int64, count=len(events))
+        if not counts.sum():
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32), total
+        flat = np.concatenate(events)
+        weights = np.repeat(scores, counts)
+        unique, inverse = np.unique(flat, return_inverse=True)
+        return unique, np.bincount(inverse, weights=weights).astype(np.float32), total
+
+    def recommend(self, user_id: str, limit: int = 10, k: Optional[int] = None,
+                  exclude_attended: bool = True, allowed: Optional[Iterable[str]] = None) -> List[Dict]:
+        """Events attended by similar users, ranked by summed neighbour similarity"""
+        rows, weights, total = self.neighbour_event_weights(user_id, k)
+        if not len(rows) or total <= 0:
+            return []
+
+        keep = np.ones(len(rows), dtype=bool)
+        if exclude_attended:
+            own_row = self.interactions.user_index.get(user_id)
+            if own_row is not None:
+                keep &= ~np.isin(rows, self.interactions.user_rows(own_row))
+        if allowed is not None:
+            allowed_rows = [self.interactions.event_index[e] for e in allowed if e in self.interactions.event_index]
+            keep &= np.isin(rows, allowed_rows)
+        rows, weights = rows[keep], weights[keep]
+        if not len(rows):
+            return []
+
+        limit = min(limit, len(rows))
+        top = np.argpartition(-weights, limit - 1)[:limit]
+        top = top[np.argsort(-weights[top], kind='stable')]
+        return [{
+            'eventId': self.interactions.event_ids[rows[i]],
+            'score': float(weights[i] / total),
+            'supportingUsers': int(np.count_nonzero(self._supporters(user_id, rows[i], k))),
+        } for i in top]
+
+    def _supporters(self, user_id: str, event_row: int, k: Optional[int]) -> np.ndarray:
+        ids, _ = self.users.neighbours(user_id, k)
+        attendees = self.interactions.event_rows(event_row)
+        return np.isin(self._interaction_row[ids], attendees)
+
+    def summary(self) -> Dict:
+        return {
+            'users': len(self.users.keys),
+            'neighbours_per_user': self.users.k,
+            'events': len(self.interactions.event_ids),
+            'interactions': len(self.interactions),
+        }
@@ -0,0 +1,50 @@
+"""
+Convert the notebook pickles in model/ into a memory-mapped model bundle
+
+    python convert_model.py --model-dir model --top-k 50
+"""
+import argparse
+import logging
+import sys
+import time
+
+from artifacts import ModelArtifacts
+from collaborative import TOP_K
+from model_format import new_version, write_bundle
+
+logger = logging.getLogger("recommendation.convert")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--model-dir', default='model', help='Directory holding the .pkl files (default: model)')
+    parser.add_argument('--output-dir', default=None, help='Where to write the bundle (default: --model-dir)')
+    parser.add_argument('--top-k', type=int, default=TOP_K, help=f'Neighbours kept per row (default: {TOP_K})')
+    parser.add_argument('--version', default=None, help='Version name (default: UTC timestamp)')
+    parser.add_argument('--no-activate', action='store_true', help='Write the bundle without updating CURRENT')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    artifacts = ModelArtifacts.from_pickles(args.model_dir, k=args.top_k)
+    if artifacts is None or not artifacts.has_signals():
+        logger.error(f"No usable .pkl artifacts found in {args.model_dir}")
+        return 1
+
+    arrays, ids = artifacts.to_bundle()
+    path = write_bundle(
+        args.output_dir or args.model_dir,
+        args.version or new_version(),
+        arrays,
+        ids,
+        meta={'source': 'pickle', 'top_k': args.top_k},
+        activate=not args.no_activate,
+    )
+    size = sum(a.nbytes for a in arrays.values())
+    logger.info(f"Converted {len(arrays)} arrays ({size / 1e6:.2f} MB) to {path} "
+                f"in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""
+Event Embeddings
+Optional sentence-transformer embeddings of the event catalogue (the
+chatbot's all-MiniLM-L6-v2 by default), held as one float32 matrix with a
+row per distinct event text. Each text is encoded once, in batches, and
+appended to disk as a part so a restart reloads it instead of re-encoding.
+Rows whose text no stored event has any more are dropped once they outnumber
+the rest. Without sentence-transformers installed the 'embedding' scoring
+mode is unavailable.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from cache import LRUCache
+from event_store import QUERY_CACHE_SIZE, QUERY_CACHE_TTL, EventVectorStore, content_hash
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # optional dependency
+    SentenceTransformer = None
+
+logger = logging.getLogger("recommendation.embeddings")
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+# Texts per encode() batch
+BATCH_SIZE = 64
+# Texts encoded and persisted together, so a long warm-up keeps its progress
+CHUNK_SIZE = 4096
+# Parts on disk before they are merged into one file
+MAX_PARTS = 16
+
+
+def available() -> bool:
+    return SentenceTransformer is not None
+
+
+class EventEmbeddings:
+    """
+    Embedding rows keyed by a hash of the event text, plus a map from event
+    store rows to embedding rows. The map belongs to one vocabulary version
+    and is rebuilt (by re-hashing the texts captured with each batch, never
+    re-encoding) when the store renumbers its rows on a refit.
+    """
+
+    def __init__(self, store: EventVectorStore, directory: str, model_name: str = MODEL_NAME,
+                 batch_size: int = BATCH_SIZE, query_cache_size: int = QUERY_CACHE_SIZE,
+                 query_cache_ttl: float = QUERY_CACHE_TTL):
+        if SentenceTransformer is None:
+            raise ImportError("sentence-transformers is not installed; "
+                              "pip install sentence-transformers to enable embedding scoring")
+        self.store = store
+        self.directory = directory
+        self.model_name = model_name
+        self.batch_size = batch_size
+        # (user id, profile text hash) -> embedding
+        self.query_cache = LRUCache(query_cache_size, query_cache_ttl)
+        self._lock = threading.RLock()
+        # One encode or compaction at a time; lookups of already encoded rows never wait for it
+        self._encode_lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._model = None
+        self.dim: Optional[int] = None
+        # Rows [0, _count) are in use; capacity doubles as the catalogue grows
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._count = 0
+        self._index: Dict[str, int] = {}
+        self._row_map = np.zeros(0, dtype=np.int64)
+        self._mapped_version: Optional[int] = None
+        self._parts = 0
+        self._warming = False
+        self._rewarm = False
+        self.encoded = 0
+        self.dropped = 0
+        self.encode_seconds = 0.0
+        self.last_encode: Optional[Dict] = None
+        self.model_load_seconds: Optional[float] = None
+        self._load()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _part_path(self, n: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"part-{n:05d}.{suffix}")
+
+    def _load(self) -> None:
+        """Read the persisted parts written with the same model; a part counts once its .json exists"""
+        if not os.path.isdir(self.directory):
+            return
+        started = time.perf_counter()
+        names = self._part_names()
+        for name in names:
+            n = int(name[len('part-'):-len('.json')])
+            self._parts = max(self._parts, n)
+            with open(os.path.join(self.directory, name)) as f:
+                meta = json.load(f)
+            if meta.get('model') != self.model_name:
+                continue
+            vectors = np.load(self._part_path(n, 'npy'))
+            fresh = [i for i, key in enumerate(meta['keys']) if key not in self._index]
+            self._append([meta['keys'][i] for i in fresh], vectors[fresh])
+        if self._count:
+            logger.info(f"Loaded {self._count} event embeddings from {self.directory} "
+                        f"in {time.perf_counter() - started:.2f}s")
+        if len(names) > MAX_PARTS:
+            self._merge_parts(names)
+
+    def _write_part(self, keys: List[str], vectors: np.ndarray) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._parts += 1
+        n = self._parts
+        np.save(self._part_path(n, 'tmp.npy'), vectors)
+        os.replace(self._part_path(n, 'tmp.npy'), self._part_path(n, 'npy'))
+        with open(self._part_path(n, 'json.tmp'), 'w') as f:
+            json.dump({'model': self.model_name, 'dim': int(vectors.shape[1]), 'keys': keys}, f)
+        os.replace(self._part_path(n, 'json.tmp'), self._part_path(n, 'json'))
+
+    def _part_names(self) -> List[str]:
+        return sorted(f for f in os.listdir(self.directory) if f.startswith('part-') and f.endswith('.json'))
+
+    def _merge_parts(self, names: List[str]) -> None:
+        """Rewrite every row as one part and delete the old ones"""
+        with self._lock:
+            keys = sorted(self._index, key=self._index.get)
+            vectors = self._matrix[:self._count].copy()
+        try:
+            if keys:
+                self._write_part(keys, vectors)
+            for name in names:
+                os.remove(os.path.join(self.directory, name))
+                os.remove(os.path.join(self.directory, name[:-len('json')] + 'npy'))
+        except OSError:
+            logger.exception("Could not merge embedding parts")
+
+    def _append(self, keys: List[str], vectors: np.ndarray) -> None:
+        if not keys:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        if self._count + len(keys) > self._matrix.shape[0]:
+            grown = np.empty((max(2 * self._matrix.shape[0], self._count + len(keys), 1024), self.dim),
+                             dtype=np.float32)
+            if self._count:
+                grown[:self._count] = self._matrix[:self._count]
+            self._matrix = grown
+        self._matrix[self._count:self._count + len(keys)] = vectors
+        for offset, key in enumerate(keys):
+            self._index[key] = self._count + offset
+        self._count += len(keys)
+
+    def _load_model(self):
+        with self._model_lock:
+            if self._model is None:
+                started = time.perf_counter()
+                model = SentenceTransformer(self.model_name)
+                self.model_load_seconds = round(time.perf_counter() - started, 3)
+                self.dim = model.get_sentence_embedding_dimension()
+                self._model = model
+                logger.info(f"Loaded embedding model {self.model_name} in {self.model_load_seconds:.2f}s")
+        return self._model
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self._load_model().encode(
+            texts, batch_size=self.batch_size, convert_to_numpy=True,
+            normalize_embeddings=True, show_progress_bar=False
+        ), dtype=np.float32)
+
+    def _encode_missing(self, keys: List[str], texts: List[str]) -> None:
+        """Encode the texts whose key has no row yet, chunk by chunk, persisting each chunk; needs _encode_lock"""
+        with self._lock:
+            todo = {key: text for key, text in zip(keys, texts) if key not in self._index}
+        items = list(todo.items())
+        for start in range(0, len(items), CHUNK_SIZE):
+            chunk = items[start:start + CHUNK_SIZE]
+            started = time.perf_counter()
+            vectors = self._encode([text for _, text in chunk])
+            seconds = time.perf_counter() - started
+            chunk_keys = [key for key, _ in chunk]
+            with self._lock:
+                self._append(chunk_keys, vectors)
+                self.encoded += len(chunk)
+                self.encode_seconds += seconds
+                self.last_encode = {
+                    'events': len(chunk),
+                    'seconds': round(seconds, 3),
+                    'ms_per_event': round(1000 * seconds / len(chunk), 3),
+                    'at': time.time(),
+                }
+            try:
+                self._write_part(chunk_keys, vectors)
+            except OSError:
+                logger.exception("Could not persist event embeddings")
+            logger.info(f"Encoded {len(chunk)} events in {seconds:.2f}s")
+
+    def _mapped(self, store_rows: np.ndarray, version: int) -> np.ndarray:
+        """Mapped embedding row of each store row, -1 where unknown; the map follows the newest version seen"""
+        if self._mapped_version is None or version > self._mapped_version:
+            self._row_map = np.zeros(0, dtype=np.int64)
+            self._mapped_version = version
+        if version != self._mapped_version:
+            return np.full(len(store_rows), -1, dtype=np.int64)
+        needed = int(store_rows.max()) + 1 if len(store_rows) else 0
+        if len(self._row_map) < needed:
+            self._row_map = np.concatenate([self._row_map, np.full(needed - len(self._row_map), -1, dtype=np.int64)])
+        return self._row_map[store_rows]
+
+    def lookup(self, store_rows: np.ndarray, texts: List[str], version: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The embedding matrix and the row in it of each event, encoding texts
+        seen for the first time. store_rows, their texts and the vocabulary
+        version must come from one EventBatch (vectorize(..., with_texts=True)),
+        so a refit after it cannot mix up the rows.
+        """
+        store_rows = np.asarray(store_rows, dtype=np.int64)
+        with self._lock:
+            result = self._mapped(store_rows, version)
+            if (result >= 0).all():
+                return self._matrix[:self._count], result
+        with self._encode_lock:
+            # Again under the encode lock: a compaction may have renumbered the rows
+            with self._lock:
+                result = self._mapped(store_rows, version)
+            missing = np.flatnonzero(result < 0)
+            keys = [content_hash(texts[i]) for i in missing]
+            self._encode_missing(keys, [texts[i] for i in missing])
+            with self._lock:
+                result[missing] = np.fromiter((self._index[key] for key in keys), dtype=np.int64, count=len(keys))
+                if version == self._mapped_version:
+                    self._row_map[store_rows[missing]] = result[missing]
+                return self._matrix[:self._count], result
+
+    def _compact(self, live: Set[str]) -> None:
+        """Drop rows whose text is not in live and rewrite the parts on disk without them"""
+        with self._encode_lock:
+            with self._lock:
+                keys = [key for key in sorted(self._index, key=self._index.get) if key in live]
+                removed = self._count - len(keys)
+                if not removed:
+                    return
+                # A new array, so matrices handed out by lookup() keep their rows
+                self._matrix = self._matrix[[self._index[key] for key in keys]]
+                self._index = {key: row for row, key in enumerate(keys)}
+                self._count = len(keys)
+                self._row_map = np.zeros(0, dtype=np.int64)
+                self._mapped_version = None
+                self.dropped += removed
+            logger.info(f"Dropped {removed} embeddings of removed or edited events")
+            if os.path.isdir(self.directory):
+                self._merge_parts(self._part_names())
+
+    def encode_queries(self, texts: List[str], user_keys: Optional[List] = None) -> np.ndarray:
+        """Normalised embeddings of free text; texts with a user key go through the query cache"""
+        user_keys = user_keys if user_keys is not None else [None] * len(texts)
+        vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+        cache_keys = [(str(u), content_hash(t)) if u is not None else None for t, u in zip(texts, user_keys)]
+        for i, key in enumerate(cache_keys):
+            if key is not None:
+                vectors[i] = self.query_cache.get(key)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            fresh = self._encode([texts[i] for i in missing])
+            for offset, i in enumerate(missing):
+                vectors[i] = fresh[offset]
+                if cache_keys[i] is not None:
+                    self.query_cache.put(cache_keys[i], fresh[offset])
+        return np.vstack(vectors) if vectors else np.zeros((0, self.dim or 0), dtype=np.float32)
+
+    @staticmethod
+    def score(matrix: np.ndarray, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of one query with the given rows of a matrix from
+        lookup(). When the rows cover most of the matrix, one product over
+        the whole matrix is cheaper than gathering them first.
+        """
+        if 2 * len(rows) >= len(matrix):
+            return (matrix @ query)[rows]
+        return matrix[rows] @ query
+
+    def warm(self) -> bool:
+        """Encode every event in the store in a background thread; False if one is already running"""
+        with self._lock:
+            if self._warming:
+                self._rewarm = True
+                return False
+            self._warming = True
+        threading.Thread(target=self._warm, name='embedding-warm', daemon=True).start()
+        return True
+
+    def _warm(self) -> None:
+        try:
+            while True:
+                self._rewarm = False
+                live, texts, version = self.store.live_texts()
+                self.lookup(live, texts, version)
+                # Rows of removed or edited events, once they outnumber the live ones
+                if self._count > 2 * max(len(texts), 1):
+                    self._compact({content_hash(text) for text in texts})
+                if not self._rewarm:
+                    break
+        except Exception:
+            logger.exception("Embedding warm-up failed")
+        finally:
+            self._warming = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'model': self.model_name,
+                'model_loaded': self._model is not None,
+                'model_load_seconds': self.model_load_seconds,
+                'dim': self.dim,
+                'events': self._count,
+                'matrix_bytes': self._count * (self.dim or 0) * 4,
+                'allocated_bytes': int(self._matrix.nbytes + self._row_map.nbytes),
+                'encoded': self.encoded,
+                'dropped': self.dropped,
+                'encode_seconds': round(self.encode_seconds, 3),
+                'ms_per_event': round(1000 * self.encode_seconds / self.encoded, 3) if self.encoded else None,
+                'last_encode': self.last_encode,
+                'warming': self._warming,
+                'directory': self.directory,
+                'query_cache': self.query_cache.stats(),
+            }
@@ -0,0 +1,433 @@
+"""
+Event Vector Store
+Keeps TF-IDF vectors for every event the service has seen so requests
+only transform the user profile instead of refitting on the whole catalogue
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from cache import LRUCache
+from inverted_index import InvertedIndex, normalize
+
+logger = logging.getLogger("recommendation.store")
+
+MAX_FEATURES = 1000
+# Refit the vocabulary once the number of stored events has grown by this
+# fraction since the last fit; keeps the total refit cost amortised O(n).
+REFIT_GROWTH = 0.5
+# Also refit when terms the vocabulary lacks have appeared in enough added
+# events to be kept by a refit (any new term while the vocabulary has room).
+# A refit costs time in proportion to the store, so these wait at least
+# REFIT_SECONDS_PER_EVENT per stored event (10s at 10,000 events) since the
+# last fit. Events added since the last fit wait at most REFIT_SECONDS.
+REFIT_SECONDS_PER_EVENT = 0.001
+REFIT_SECONDS = 600.0
+# User profile vectors kept between requests, keyed by user id and profile hash
+QUERY_CACHE_SIZE = 10000
+QUERY_CACHE_TTL = 3600
+# Store keys of inline availableEvents, so a request carrying its own copy of
+# a catalogue event never replaces the catalogue's row or index entries
+INLINE_PREFIX = 'inline:'
+# Inline events not sent by any request for this long are dropped (catalogue
+# events stay until the catalogue removes them); swept at most once a minute
+INLINE_TTL = 3600.0
+EVICT_INTERVAL = 60.0
+
+
+def event_text(event: Dict) -> str:
+    """Build the text used to vectorize an event"""
+    return f"{event.get('title', '')} {event.get('description', '')} {' '.join(event.get('tags', []))} {event.get('type', '')} {event.get('organizer', '')}"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def event_timestamp(value) -> float:
+    """Seconds since the epoch for an ISO date string or epoch milliseconds; NaN if unknown"""
+    if value is None or value == '':
+        return float('nan')
+    if isinstance(value, (int, float)):
+        return float(value) / 1000.0
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return float('nan')
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class EventBatch(NamedTuple):
+    """Vectors and boost features for a set of events, all from one vocabulary"""
+    rows: np.ndarray
+    vectors: sp.csr_matrix
+    queries: sp.csr_matrix
+    tags: sp.csr_matrix
+    types: np.ndarray
+    organizers: np.ndarray
+    timestamps: np.ndarray
+    # Vocabulary version the row numbers belong to, and the stored texts of
+    # the rows when requested (a later refit may renumber the rows)
+    version: int = 0
+    texts: Optional[List[str]] = None
+
+
+class EventVectorStore:
+    def __init__(self, max_features: int = MAX_FEATURES, refit_growth: float = REFIT_GROWTH,
+                 query_cache_size: int = QUERY_CACHE_SIZE, query_cache_ttl: float = QUERY_CACHE_TTL,
+                 refit_seconds: float = REFIT_SECONDS, inline_ttl: float = INLINE_TTL):
+        self.max_features = max_features
+        self.refit_growth = refit_growth
+        self.refit_seconds = refit_seconds
+        self.inline_ttl = inline_ttl
+        # (user id, profile text hash) -> vector under the current vocabulary
+        self.query_cache = LRUCache(query_cache_size, query_cache_ttl)
+        self._lock = threading.RLock()
+        self._vectorizer: Optional[TfidfVectorizer] = None
+        # key -> (content hash, row index)
+        self._index: Dict[str, Tuple[str, int]] = {}
+        self._texts: List[str] = []
+        self._live = np.zeros(0, dtype=bool)
+        self._matrix = sp.csr_matrix((0, 0), dtype=np.float64)
+        self._pending: List[sp.csr_matrix] = []
+        self._fitted_on = 0
+        self._fitted_at = 0.0
+        self._analyze = None
+        # Fewest events a term needs to be in the vocabulary (from the fitted idf)
+        self._min_df = 1
+        # Since the last fit: events added, and events per term the vocabulary lacks
+        self._added = 0
+        self._novel_df: Dict[str, int] = {}
+        # Inline key -> last time a request sent it
+        self._seen: Dict[str, float] = {}
+        self._swept_at = time.monotonic()
+        self.evicted = 0
+        self.vocabulary_version = 0
+        # Categorical features used for score boosting, one id space per kind
+        self._feature_ids: Dict[str, Dict[str, int]] = {'tag': {}, 'type': {}, 'organizer': {}}
+        self._tag_rows: List[np.ndarray] = []
+        self._type_ids: List[int] = []
+        self._organizer_ids: List[int] = []
+        self._timestamps: List[float] = []
+        # Posting lists from normalized tag/type/organizer to event keys
+        self.index = InvertedIndex()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @staticmethod
+    def _key(event: Dict, digest: str, catalogue: bool = False) -> str:
+        """Catalogue events are keyed by eventId, inline ones by INLINE_PREFIX + eventId (or their digest)"""
+        event_id = event.get('eventId')
+        if event_id is None:
+            return f"#{digest}"
+        return str(event_id) if catalogue else f"{INLINE_PREFIX}{event_id}"
+
+    def ensure(self, events: List[Dict], catalogue: bool = False) -> np.ndarray:
+        """
+        Make sure every event has an up-to-date row and return the row
+        indices in request order. Only new or edited events are vectorized.
+        catalogue=True stores them under the catalogue's keys, otherwise
+        they are inline events in their own key space.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._swept_at > EVICT_INTERVAL:
+                self._evict(now)
+            rows = np.empty(len(events), dtype=np.int64)
+            missing = []
+            waiting = {}
+            for i, event in enumerate(events):
+                text = event_text(event)
+                digest = content_hash(f"{text}|{event.get('date', '')}")
+                key = self._key(event, digest, catalogue)
+                if not catalogue:
+                    self._seen[key] = now
+                entry = self._index.get(key)
+                if entry is not None and entry[0] == digest:
+                    rows[i] = entry[1]
+                elif key in waiting:
+                    waiting[key].append(i)
+                else:
+                    waiting[key] = [i]
+                    missing.append((key, digest, text, event))
+
+            if missing:
+                self._add(missing, waiting, rows)
+            elif self._refit_due(now):
+                self._refit(rows)
+            return rows
+
+    def _add(self, missing, waiting, rows):
+        # Orphan the previous row of any edited event
+        for key, _, _, _ in missing:
+            entry = self._index.get(key)
+            if entry is not None:
+                self._live[entry[1]] = False
+
+        start = len(self._texts)
+        self._texts.extend(text for _, _, text, _ in missing)
+        self._live = np.concatenate([self._live, np.ones(len(missing), dtype=bool)])
+        for offset, (key, digest, _, event) in enumerate(missing):
+            self._index[key] = (digest, start + offset)
+            rows[waiting[key]] = start + offset
+            tag_ids = np.unique(np.fromiter(
+                (self._feature_id('tag', tag) for tag in event.get('tags', []) or []), dtype=np.int32
+            ))
+            self._tag_rows.append(tag_ids[tag_ids >= 0])
+            self._type_ids.append(self._feature_id('type', event.get('type')))
+            self._organizer_ids.append(self._feature_id('organizer', event.get('organizer')))
+            self._timestamps.append(event_timestamp(event.get('date')))
+            self.index.add(key, event)
+
+        self._added += len(missing)
+        if self._vectorizer is not None:
+            for _, _, text, _ in missing:
+                for term in set(self._analyze(text)):
+                    if term not in self._vectorizer.vocabulary_:
+                        self._novel_df[term] = self._novel_df.get(term, 0) + 1
+
+        live_count = int(self._live.sum())
+        if (self._vectorizer is None or live_count > self._fitted_on * (1 + self.refit_growth)
+                or self._refit_due(time.monotonic())):
+            self._refit(rows)
+        else:
+            self._pending.append(self._vectorizer.transform([text for _, _, text, _ in missing]).tocsr())
+
+    def _refit_due(self, now: float) -> bool:
+        """Whether events added since the last fit carry terms a refit would keep, or have waited too long"""
+        if self._vectorizer is None or not self._added:
+            return False
+        elapsed = now - self._fitted_at
+        if self.refit_seconds > 0 and elapsed > self.refit_seconds:
+            return True
+        return (elapsed > REFIT_SECONDS_PER_EVENT * self._fitted_on
+                and max(self._novel_df.values(), default=0) >= self._min_df)
+
+    def remove(self, keys: Iterable[str]) -> int:
+        """Drop events from the store and the inverted index; returns how many existed"""
+        with self._lock:
+            return self._drop([str(key) for key in keys])
+
+    def _drop(self, keys: List[str]) -> int:
+        removed = 0
+        for key in keys:
+            self._seen.pop(key, None)
+            entry = self._index.pop(key, None)
+            if entry is None:
+                continue
+            self._live[entry[1]] = False
+            self.index.remove(key)
+            removed += 1
+        # Compact once orphaned rows outnumber live ones
+        if removed and self._vectorizer is not None and len(self._texts) > 2 * max(len(self._index), 1):
+            self._refit(np.empty(0, dtype=np.int64))
+        return removed
+
+    def _evict(self, now: float) -> None:
+        """Drop inline events no request has sent within inline_ttl"""
+        self._swept_at = now
+        if self.inline_ttl <= 0:
+            return
+        stale = [key for key, seen in self._seen.items() if now - seen > self.inline_ttl]
+        if stale:
+            self.evicted += self._drop(stale)
+            logger.info(f"Evicted {len(stale)} inline events not seen for {self.inline_ttl:.0f}s")
+
+    def rows_of(self, keys: Iterable[str], version: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        Current row of each event key, -1 for unknown keys. With a version
+        (e.g. EventBatch.version), None when a refit has renumbered the rows since
+        """
+        with self._lock:
+            if version is not None and version != self.vocabulary_version:
+                return None
+            return np.fromiter((self._index[k][1] if k in self._index else -1 for k in keys), dtype=np.int64)
+
+    def _feature_id(self, kind: str, value) -> int:
+        term = normalize(value)
+        if not term:
+            return -1
+        ids = self._feature_ids[kind]
+        return ids.setdefault(term, len(ids))
+
+    def lookup(self, kind: str, values: Iterable) -> np.ndarray:
+        """Ids of the known feature values of one kind ('tag', 'type' or 'organizer'), matched after normalization"""
+        ids = self._feature_ids[kind]
+        found = [ids[t] for t in map(normalize, values) if t in ids]
+        return np.asarray(found, dtype=np.int32)
+
+    def feature_count(self, kind: str) -> int:
+        return len(self._feature_ids[kind])
+
+    def _refit(self, rows):
+        """Fit the vocabulary on every live event and compact orphaned rows"""
+        live_rows = np.flatnonzero(self._live)
+        remap = np.full(len(self._texts), -1, dtype=np.int64)
+        remap[live_rows] = np.arange(len(live_rows))
+
+        texts = [self._texts[r] for r in live_rows]
+        self._vectorizer = TfidfVectorizer(stop_words='english', max_features=self.max_features)
+        try:
+            self._matrix = self._vectorizer.fit_transform(texts).tocsr()
+        except ValueError:
+            # Every document was empty or stop words only; keep a degenerate
+            # vocabulary so transform still works and scores stay zero.
+            self._vectorizer = TfidfVectorizer(max_features=self.max_features, token_pattern=r'(?u)\b\w+\b')
+            self._vectorizer.fit(['_'])
+            self._matrix = self._vectorizer.transform(texts).tocsr()
+        self._pending = []
+        self._analyze = self._vectorizer.build_analyzer()
+        # idf = ln((1 + n) / (1 + df)) + 1, so the largest idf gives the
+        # smallest document count among kept terms; while the vocabulary has
+        # room, one event is enough for a new term to be kept
+        if len(self._vectorizer.vocabulary_) >= self.max_features and len(texts):
+            self._min_df = max(1, round((1 + len(texts)) / math.exp(self._vectorizer.idf_.max() - 1) - 1))
+        else:
+            self._min_df = 1
+        self._added = 0
+        self._novel_df = {}
+        self._fitted_at = time.monotonic()
+        self._texts = texts
+        self._tag_rows = [self._tag_rows[r] for r in live_rows]
+        self._type_ids = [self._type_ids[r] for r in live_rows]
+        self._organizer_ids = [self._organizer_ids[r] for r in live_rows]
+        self._timestamps = [self._timestamps[r] for r in live_rows]
+        self._live = np.ones(len(texts), dtype=bool)
+        self._index = {key: (digest, int(remap[row])) for key, (digest, row) in self._index.items()}
+        rows[:] = remap[rows]
+        self._fitted_on = len(texts)
+        self.vocabulary_version += 1
+        # Cached user vectors belong to the old vocabulary
+        self.query_cache.invalidate()
+        logger.info(f"Fitted event vocabulary on {len(texts)} events "
+                    f"({len(self._vectorizer.vocabulary_)} terms)")
+
+    def _materialize(self) -> sp.csr_matrix:
+        if self._pending:
+            self._matrix = sp.vstack([self._matrix] + self._pending, format='csr')
+            self._pending = []
+        return self._matrix
+
+    def row_count(self) -> int:
+        """Rows allocated so far, including orphaned ones awaiting compaction"""
+        return len(self._texts)
+
+    def live_texts(self) -> Tuple[np.ndarray, List[str], int]:
+        """Rows and texts of every current event and the vocabulary version the rows belong to"""
+        with self._lock:
+            rows = np.flatnonzero(self._live)
+            return rows, [self._texts[r] for r in rows], self.vocabulary_version
+
+    def snapshot(self) -> Tuple[sp.csr_matrix, int]:
+        """Every stored vector (by row) and the vocabulary version they belong to"""
+        with self._lock:
+            return self._materialize(), self.vocabulary_version
+
+    def rows(self, indices: np.ndarray) -> sp.csr_matrix:
+        """Return the stored vectors for the given row indices"""
+        with self._lock:
+            return self._materialize()[indices]
+
+    def transform(self, texts: List[str], user_keys: Optional[List] = None) -> sp.csr_matrix:
+        """
+        Vectorize free text (e.g. user profiles) with the fitted vocabulary.
+        Texts with a user key (e.g. userId) are served from and added to the
+        query cache; texts without one are always transformed.
+        """
+        with self._lock:
+            if self._vectorizer is None:
+                return sp.csr_matrix((len(texts), 0), dtype=np.float64)
+            if user_keys is None:
+                return self._vectorizer.transform(texts).tocsr()
+
+            vectors: List[Optional[sp.csr_matrix]] = [None] * len(texts)
+            cache_keys = [None] * len(texts)
+            missing = []
+            for i, (text, user_key) in enumerate(zip(texts, user_keys)):
+                if user_key is None:
+                    missing.append(i)
+                    continue
+                cache_keys[i] = (str(user_key), content_hash(text))
+                vectors[i] = self.query_cache.get(cache_keys[i])
+                if vectors[i] is None:
+                    missing.append(i)
+            if missing:
+                fresh = self._vectorizer.transform([texts[i] for i in missing]).tocsr()
+                for offset, i in enumerate(missing):
+                    vectors[i] = fresh[offset]
+                    if cache_keys[i] is not None:
+                        self.query_cache.put(cache_keys[i], vectors[i])
+            if not vectors:
+                return sp.csr_matrix((0, len(self._vectorizer.vocabulary_)), dtype=np.float64)
+            return sp.vstack(vectors, format='csr')
+
+    def invalidate_user(self, user_key) -> int:
+        """Drop cached vectors for one user, e.g. after a profile edit"""
+        user_key = str(user_key)
+        return self.query_cache.invalidate(lambda key: key[0] == user_key)
+
+    def features(self, indices: np.ndarray) -> Tuple[sp.csr_matrix, np.ndarray, np.ndarray, np.ndarray]:
+        """One-hot tag matrix, type and organizer ids (-1 when missing) and timestamps for the given rows"""
+        with self._lock:
+            tag_rows = [self._tag_rows[r] for r in indices]
+            indptr = np.zeros(len(tag_rows) + 1, dtype=np.int64)
+            np.cumsum([len(t) for t in tag_rows], out=indptr[1:])
+            tag_indices = np.concatenate(tag_rows) if tag_rows else np.empty(0, dtype=np.int32)
+            tags = sp.csr_matrix(
+                (np.ones(len(tag_indices), dtype=np.float32), tag_indices, indptr),
+                shape=(len(tag_rows), self.feature_count('tag'))
+            )
+            types = np.asarray([self._type_ids[r] for r in indices], dtype=np.int32)
+            organizers = np.asarray([self._organizer_ids[r] for r in indices], dtype=np.int32)
+            timestamps = np.asarray([self._timestamps[r] for r in indices], dtype=np.float64)
+            return tags, types, organizers, timestamps
+
+    def _batch(self, rows: np.ndarray, texts: List[str], user_keys: Optional[List], with_texts: bool) -> EventBatch:
+        tags, types, organizers, timestamps = self.features(rows)
+        return EventBatch(rows, self.rows(rows), self.transform(texts, user_keys),
+                          tags, types, organizers, timestamps, self.vocabulary_version,
+                          [self._texts[r] for r in rows] if with_texts else None)
+
+    def vectorize(self, events: List[Dict], texts: List[str], user_keys: Optional[List] = None,
+                  with_texts: bool = False) -> EventBatch:
+        """
+        Ensure events are stored and return their vectors and features plus
+        text vectors, from one vocabulary; with_texts also copies the stored
+        event texts into the batch
+        """
+        with self._lock:
+            return self._batch(self.ensure(events), texts, user_keys, with_texts)
+
+    def vectorize_keys(self, keys: List[str], texts: List[str], user_keys: Optional[List] = None,
+                       with_texts: bool = False) -> EventBatch:
+        """Like vectorize for events already in the store, looked up by key without re-hashing"""
+        with self._lock:
+            rows = self.rows_of(keys)
+            if (rows < 0).any():
+                raise KeyError(f"{int((rows < 0).sum())} events are not in the store")
+            return self._batch(rows, texts, user_keys, with_texts)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'events': len(self._index),
+                'rows': len(self._texts),
+                'vocabulary_size': len(self._vectorizer.vocabulary_) if self._vectorizer is not None else 0,
+                'vocabulary_version': self.vocabulary_version,
+                'added_since_fit': self._added,
+                'inline_events': len(self._seen),
+                'evicted': self.evicted,
+                'index': self.index.stats(),
+                'query_cache': self.query_cache.stats(),
+            }
@@ -0,0 +1,305 @@
+"""
+Feedback
+Registration, attendance and click events streamed in by the backend. Every
+action feeds the trending index at once; registrations and attendance are
+also kept as pending user-event pairs until a background compactor folds
+them into the collaborative model: the interaction CSR is merged in O(nnz),
+item co-occurrence is updated only for the users who changed, and the
+result is written as a new memory-mapped bundle and swapped in.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+import scipy.sparse as sp
+
+from artifacts import ModelArtifacts
+from collaborative import CollaborativeEngine, InteractionIndex, NeighbourIndex
+from event_store import event_timestamp
+from model_format import locked, new_version, prune_versions, resolve_bundle, write_bundle
+from model_reloader import ModelReloader
+from popularity import TrendingIndex
+
+logger = logging.getLogger("recommendation.feedback")
+
+# Accepted spellings of each action
+ACTIONS = {
+    'click': 'click', 'clicked': 'click', 'view': 'click',
+    'register': 'register', 'registered': 'register', 'registration': 'register',
+    'attend': 'attend', 'attended': 'attend', 'attendance': 'attend',
+}
+# Weight of one action in the trending index
+ACTION_WEIGHTS = {'click': 0.1, 'register': 0.7, 'attend': 1.0}
+# Actions that add the event to the user's interactions (and so to co-occurrence);
+# the hybrid signals already treat registered events like attended ones
+INTERACTION_ACTIONS = ('register', 'attend')
+COMPACT_SECONDS = 300
+# Pending user-event pairs that trigger a compaction before the interval is up
+MAX_PENDING = 100_000
+# Bundle versions kept on disk after a compaction, besides CURRENT
+KEEP_VERSIONS = 5
+
+
+class Pending:
+    """Feedback since the last compaction: the user-event pairs that became interactions and action counts"""
+
+    def __init__(self):
+        self.interactions: Dict[str, Set[str]] = {}
+        self.pairs = 0
+        self.actions = {action: 0 for action in ACTION_WEIGHTS}
+
+    def __len__(self) -> int:
+        return self.pairs
+
+    def add(self, user_id: str, event_id: str, action: str, count: int = 1) -> None:
+        self.actions[action] += count
+        if action in INTERACTION_ACTIONS:
+            events = self.interactions.setdefault(user_id, set())
+            if event_id not in events:
+                events.add(event_id)
+                self.pairs += 1
+
+    def merge(self, other: 'Pending') -> None:
+        for user_id, events in other.interactions.items():
+            self.pairs += len(events - self.interactions.get(user_id, set()))
+            self.interactions.setdefault(user_id, set()).update(events)
+        for action, count in other.actions.items():
+            self.actions[action] += count
+
+
+def _pad_rows(matrix: sp.csr_matrix, rows: int, columns: int) -> sp.csr_matrix:
+    """Widen a CSR matrix with empty trailing rows and columns"""
+    matrix = sp.csr_matrix(matrix, dtype=np.float32)
+    indptr = np.concatenate([matrix.indptr, np.full(rows - matrix.shape[0], matrix.indptr[-1], dtype=matrix.indptr.dtype)])
+    return sp.csr_matrix((matrix.data, matrix.indices, indptr), shape=(rows, columns))
+
+
+def fold(base: Optional[ModelArtifacts], pending: Pending) -> ModelArtifacts:
+    """
+    New artifacts with pending feedback merged in. New users and events are
+    appended after the existing ids so every other array keeps its rows; new
+    users get empty neighbour lists until the next training run.
+    """
+    collaborative = base.collaborative if base is not None else None
+    interactions = collaborative.interactions if collaborative is not None else (base.interactions if base else None)
+    user_ids = list(interactions.user_ids) if interactions is not None else []
+    event_ids = list(interactions.event_ids) if interactions is not None else []
+    user_index = dict(interactions.user_index) if interactions is not None else {}
+    event_index = dict(interactions.event_index) if interactions is not None else {}
+
+    def row_of(key: str, ids: List[str], index: Dict[str, int]) -> int:
+        if key not in index:
+            index[key] = len(ids)
+            ids.append(key)
+        return index[key]
+
+    attended = [(row_of(u, user_ids, user_index), row_of(e, event_ids, event_index))
+                for u, events in pending.interactions.items() for e in events]
+    shape = (len(user_ids), len(event_ids))
+
+    before = interactions.matrix(*shape) if interactions is not None else sp.csr_matrix(shape, dtype=np.float32)
+    if attended:
+        rows, columns = np.asarray(attended, dtype=np.int64).T
+        added = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)), shape=shape)
+    else:
+        rows, added = np.empty(0, dtype=np.int64), sp.csr_matrix(shape, dtype=np.float32)
+    after = (before + added).tocsr()
+    after.data[:] = 1.0
+    after.sort_indices()
+    # The CSC form is the event -> users transpose, so no argsort is needed
+    by_event = after.tocsc()
+    by_event.sort_indices()
+    merged = InteractionIndex(user_ids, event_ids, after.indptr.astype(np.int64), after.indices.astype(np.int32),
+                              by_event.indptr.astype(np.int64), by_event.indices.astype(np.int32))
+
+    # C = X^T X changes only through the users who gained events:
+    # C' = C + A^T A - B^T B with A, B their rows after and before
+    cooccurrence = base.cooccurrence if base is not None else None
+    if cooccurrence is None:
+        cooccurrence = before.T @ before
+    cooccurrence = _pad_rows(cooccurrence, shape[1], shape[1])
+    changed = np.unique(rows)
+    if len(changed):
+        old, new = before[changed], after[changed]
+        # One pass over C: the small delta is formed first
+        cooccurrence = (cooccurrence + (new.T @ new - old.T @ old)).tocsr()
+        cooccurrence.eliminate_zeros()
+
+    engine, users_vector = None, base.users_vector if base is not None else None
+    if collaborative is not None:
+        users = collaborative.users
+        extra = len(user_ids) - len(users.keys)
+        engine = CollaborativeEngine(NeighbourIndex(
+            user_ids,
+            np.vstack([np.asarray(users.ids), np.full((extra, users.k), -1, dtype=np.int32)]),
+            np.vstack([np.asarray(users.scores), np.zeros((extra, users.k), dtype=np.float32)]),
+        ), merged)
+        if users_vector is not None:
+            users_vector = _pad_rows(users_vector, len(user_ids), users_vector.shape[1])
+
+    return ModelArtifacts(
+        events=base.events if base is not None else None,
+        interactions=merged if len(merged) else None,
+        collaborative=engine,
+        users_vector=users_vector,
+        cooccurrence=cooccurrence,
+    )
+
+
+class FeedbackStore:
+    """
+    Pending feedback plus the compactor thread. Compactions hold a lock on
+    the model directory and fold onto the newest bundle, so with several
+    workers each one adds its own feedback on top of the others' in turn.
+    Feedback not yet compacted is lost on restart. Accepted actions are also
+    passed to the trending index straight away, when one is given.
+    """
+
+    def __init__(self, models: ModelReloader, compact_seconds: float = COMPACT_SECONDS,
+                 max_pending: int = MAX_PENDING, trending: Optional[TrendingIndex] = None,
+                 keep_versions: int = KEEP_VERSIONS):
+        self.models = models
+        self.trending = trending
+        self.compact_seconds = compact_seconds
+        self.max_pending = max_pending
+        self.keep_versions = keep_versions
+        self._pending = Pending()
+        self._lock = threading.Lock()
+        # One compaction at a time in this process; locked() covers the others.
+        # record() never waits for either
+        self._compact_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.received = 0
+        self.compactions = 0
+        self.last_compaction: Optional[Dict] = None
+        self.last_error: Optional[str] = None
+
+    def record(self, items: Iterable[Dict]) -> Dict:
+        """
+        Validate and queue feedback items ({userId, eventId, action[, count,
+        timestamp]}); returns counts and errors. timestamp (ISO date or epoch
+        milliseconds, default now) only affects trending decay, so the backend
+        can replay past registrations.
+        """
+        errors, parsed, trending = [], [], []
+        for i, item in enumerate(items):
+            user_id, event_id = item.get('userId'), item.get('eventId')
+            action = ACTIONS.get(str(item.get('action', '')).strip().lower())
+            count = item.get('count', 1)
+            if user_id is None or event_id is None:
+                errors.append(f"item {i}: userId and eventId are required")
+            elif action is None:
+                errors.append(f"item {i}: unknown action {item.get('action')!r}")
+            elif not isinstance(count, int) or count < 1:
+                errors.append(f"item {i}: count must be a positive integer")
+            else:
+                parsed.append((str(user_id), str(event_id), action, count))
+                when = event_timestamp(item.get('timestamp'))
+                trending.append((str(event_id), ACTION_WEIGHTS[action] * count, when if when == when else None))
+
+        with self._lock:
+            for user_id, event_id, action, count in parsed:
+                self._pending.add(user_id, event_id, action, count)
+            accepted = len(parsed)
+            self.received += accepted
+            pending = len(self._pending)
+        if self.trending is not None and trending:
+            self.trending.add(trending)
+        if pending >= self.max_pending:
+            self._wake.set()
+        return {'accepted': accepted, 'rejected': len(errors), 'errors': errors[:20], 'pending': pending}
+
+    def events_of_user(self, user_id: str) -> List[str]:
+        """Events the user registered for or attended since the last compaction"""
+        with self._lock:
+            return list(self._pending.interactions.get(user_id, ()))
+
+    def compact(self) -> Optional[Dict]:
+        """Fold pending feedback into a new bundle and swap it in; None when there was nothing to fold"""
+        with self._compact_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Pending()
+            if not len(pending):
+                return None
+            started = time.perf_counter()
+            model_dir = self.models.model_dir
+            try:
+                with locked(model_dir):
+                    # Build on the newest bundle, e.g. one train.py or another worker just activated
+                    if resolve_bundle(model_dir) not in (None, self.models.path):
+                        self.models.reload()
+                    base = self.models.current
+                    artifacts = fold(base, pending)
+                    artifacts.validate()
+                    arrays, ids = artifacts.to_bundle()
+                    version = self._version()
+                    write_bundle(model_dir, version, arrays, ids, meta={
+                        'source': 'feedback',
+                        'base_version': base.version if base is not None else None,
+                        'feedback': {'pairs': len(pending), **pending.actions},
+                    }, activate=False)
+                    self.models.reload(version)
+                    pruned = prune_versions(model_dir, self.keep_versions, protect=[self.models.path])
+            except Exception as e:
+                # Keep the feedback for the next attempt
+                with self._lock:
+                    pending.merge(self._pending)
+                    self._pending = pending
+                self.last_error = str(e)
+                logger.exception("Feedback compaction failed")
+                raise
+
+            self.compactions += 1
+            self.last_error = None
+            self.last_compaction = {
+                'version': version,
+                'pairs': len(pending),
+                'actions': pending.actions,
+                'pruned': len(pruned),
+                'seconds': round(time.perf_counter() - started, 3),
+                'at': time.time(),
+            }
+            logger.info(f"Folded {len(pending)} feedback pairs into model version {version} "
+                        f"in {self.last_compaction['seconds']:.3f}s")
+            return self.last_compaction
+
+    def _version(self) -> str:
+        version, n = f"{new_version()}-feedback", 1
+        while os.path.exists(self.models.version_path(version)):
+            n += 1
+            version = f"{new_version()}-feedback{n}"
+        return version
+
+    def start(self) -> None:
+        if self.compact_seconds <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='feedback-compactor', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.compact_seconds)
+            self._wake.clear()
+            try:
+                self.compact()
+            except Exception:
+                pass  # logged and kept for the next round
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending, actions = len(self._pending), dict(self._pending.actions)
+        return {
+            'pending_pairs': pending,
+            'pending_actions': actions,
+            'received': self.received,
+            'compactions': self.compactions,
+            'compact_seconds': self.compact_seconds,
+            'keep_versions': self.keep_versions,
+            'last_compaction': self.last_compaction,
+            'last_error': self.last_error,
+            'running': self._thread is not None,
+        }
@@ -0,0 +1,100 @@
+"""
+Inverted Index
+Posting lists from normalized tag, type and organizer to event ids, updated
+incrementally as events are added, edited or removed
+"""
+import threading
+from typing import Dict, Iterable, Set, Tuple
+
+KINDS = ('tag', 'type', 'organizer')
+
+
+def normalize(value) -> str:
+    """Case- and whitespace-insensitive key for tags, types and organizers"""
+    if value is None:
+        return ''
+    return ' '.join(str(value).lower().split())
+
+
+def event_terms(event: Dict) -> Dict[str, Tuple[str, ...]]:
+    terms = {
+        'tag': tuple(dict.fromkeys(t for t in map(normalize, event.get('tags', []) or []) if t)),
+        'type': (normalize(event.get('type')),),
+        'organizer': (normalize(event.get('organizer')),),
+    }
+    return {kind: tuple(t for t in values if t) for kind, values in terms.items()}
+
+
+class InvertedIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, Set[str]]] = {kind: {} for kind in KINDS}
+        # event id -> terms it was indexed under, so removal never scans postings
+        self._terms: Dict[str, Dict[str, Tuple[str, ...]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def __contains__(self, event_id: str) -> bool:
+        return event_id in self._terms
+
+    def add(self, event_id: str, event: Dict) -> None:
+        """Index an event, replacing whatever it was indexed under before"""
+        with self._lock:
+            self._discard(event_id)
+            terms = event_terms(event)
+            for kind, values in terms.items():
+                postings = self._postings[kind]
+                for term in values:
+                    postings.setdefault(term, set()).add(event_id)
+            self._terms[event_id] = terms
+
+    def remove(self, event_id: str) -> bool:
+        with self._lock:
+            return self._discard(event_id)
+
+    def _discard(self, event_id: str) -> bool:
+        terms = self._terms.pop(event_id, None)
+        if terms is None:
+            return False
+        for kind, values in terms.items():
+            postings = self._postings[kind]
+            for term in values:
+                ids = postings.get(term)
+                if ids is not None:
+                    ids.discard(event_id)
+                    if not ids:
+                        del postings[term]
+        return True
+
+    def lookup(self, kind: str, values: Iterable) -> Set[str]:
+        """Union of the posting lists for the given raw values"""
+        with self._lock:
+            postings = self._postings[kind]
+            found: Set[str] = set()
+            for term in {normalize(v) for v in values}:
+                found |= postings.get(term, set())
+            return found
+
+    def counts(self, kind: str, values: Iterable) -> Dict[str, int]:
+        """Number of distinct given values each event is posted under"""
+        with self._lock:
+            postings = self._postings[kind]
+            counts: Dict[str, int] = {}
+            for term in {normalize(v) for v in values}:
+                for event_id in postings.get(term, ()):
+                    counts[event_id] = counts.get(event_id, 0) + 1
+            return counts
+
+    def posting_count(self, kind: str, values: Iterable) -> int:
+        """Total length of the posting lists for the given raw values, an upper bound on matches"""
+        with self._lock:
+            postings = self._postings[kind]
+            return sum(len(postings.get(term, ())) for term in {normalize(v) for v in values})
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'events': len(self._terms),
+                **{f'{kind}_terms': len(self._postings[kind]) for kind in KINDS},
+            }
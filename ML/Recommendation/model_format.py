@@ -0,0 +1,205 @@
+"""
+Model Bundle Format
+Versioned directory of float32/int32 .npy arrays that the server opens with
+np.load(mmap_mode='r'), so every worker process shares one page-cached copy
+
+    model/
+      CURRENT                  name of the active version
+      versions/<version>/
+        manifest.json          format version, counts, array names
+        user_ids.json          row order of every users_* array
+        event_ids.json         row order of every events_* array
+        interaction_event_ids.json
+        users_topk_ids.npy     int32  (users x K), -1 padded
+        users_topk_scores.npy  float32 (users x K)
+        events_topk_ids.npy    int32  (events x K), optional
+        events_topk_scores.npy float32 (events x K), optional
+        interactions_*.npy     CSR user -> events and its transpose
+        users_vector_*.npy     CSR float32 L2-normalised user vectors, optional
+        cooccurrence_*.npy     CSR float32 event x event co-attendance counts, optional
+      .lock                    held by whoever is writing a feedback version
+"""
+import json
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, one writer assumed
+    fcntl = None
+
+import numpy as np
+import scipy.sparse as sp
+
+logger = logging.getLogger("recommendation.model_format")
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+CURRENT = 'CURRENT'
+VERSIONS = 'versions'
+LOCK = '.lock'
+
+
+def new_version() -> str:
+    return time.strftime('%Y%m%d-%H%M%S', time.gmtime())
+
+
+def is_version_name(version) -> bool:
+    """Whether version is a plain directory name that stays inside versions/"""
+    return (isinstance(version, str) and version not in ('', '.', '..')
+            and os.path.basename(version) == version and '\\' not in version
+            and not version.startswith('.'))
+
+
+def _write_json(path: str, payload) -> None:
+    with open(path, 'w') as f:
+        json.dump(payload, f)
+
+
+def _read_json(path: str):
+    with open(path) as f:
+        return json.load(f)
+
+
+def resolve_bundle(model_dir: str) -> Optional[str]:
+    """Directory of the active bundle under model_dir, or None if there is none"""
+    pointer = os.path.join(model_dir, CURRENT)
+    if os.path.exists(pointer):
+        with open(pointer) as f:
+            version = f.read().strip()
+        path = os.path.join(model_dir, VERSIONS, version)
+        if os.path.exists(os.path.join(path, MANIFEST)):
+            return path
+        logger.warning(f"{pointer} points at missing version {version}")
+    if os.path.exists(os.path.join(model_dir, MANIFEST)):
+        return model_dir
+    return None
+
+
+def set_current(model_dir: str, version: str) -> None:
+    """Atomically point model_dir/CURRENT at a version"""
+    tmp = os.path.join(model_dir, f".{CURRENT}.tmp")
+    with open(tmp, 'w') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(model_dir, CURRENT))
+
+
+@contextmanager
+def locked(model_dir: str):
+    """Hold an exclusive lock on model_dir across processes, blocking until it is free"""
+    os.makedirs(model_dir, exist_ok=True)
+    with open(os.path.join(model_dir, LOCK), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def prune_versions(model_dir: str, keep: int, protect: Iterable[Optional[str]] = ()) -> List[str]:
+    """
+    Delete all but the keep newest versions under model_dir/versions; the
+    CURRENT version and any protected paths are never deleted. Returns the
+    removed version names.
+    """
+    versions_dir = os.path.join(model_dir, VERSIONS)
+    if keep <= 0 or not os.path.isdir(versions_dir):
+        return []
+    kept = {os.path.realpath(path) for path in protect if path}
+    current = resolve_bundle(model_dir)
+    if current is not None:
+        kept.add(os.path.realpath(current))
+    paths = [os.path.join(versions_dir, name) for name in os.listdir(versions_dir) if not name.startswith('.')]
+    paths = sorted((p for p in paths if os.path.isdir(p)), key=os.path.getmtime, reverse=True)
+    removed = []
+    for path in paths[keep:]:
+        if os.path.realpath(path) in kept:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(os.path.basename(path))
+    if removed:
+        logger.info(f"Removed {len(removed)} old model versions from {versions_dir}")
+    return removed
+
+
+def write_bundle(model_dir: str, version: str,
+                 arrays: Dict[str, np.ndarray],
+                 ids: Dict[str, List[str]],
+                 meta: Optional[Dict] = None,
+                 activate: bool = True) -> str:
+    """
+    Write a bundle into model_dir/versions/<version>. Files go to a hidden
+    staging directory first and are renamed into place in one step, so a
+    reader never sees a half-written version.
+    """
+    if not is_version_name(version):
+        raise ValueError(f"Invalid model version name {version!r}")
+    versions_dir = os.path.join(model_dir, VERSIONS)
+    os.makedirs(versions_dir, exist_ok=True)
+    final = os.path.join(versions_dir, version)
+    staging = os.path.join(versions_dir, f".{version}.tmp")
+    if os.path.exists(final):
+        raise FileExistsError(f"Model version {version} already exists")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(array))
+    for name, values in ids.items():
+        _write_json(os.path.join(staging, f"{name}.json"), [str(v) for v in values])
+    _write_json(os.path.join(staging, MANIFEST), {
+        'format_version': FORMAT_VERSION,
+        'version': version,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'arrays': {name: {'dtype': str(a.dtype), 'shape': list(a.shape)} for name, a in arrays.items()},
+        'ids': {name: len(values) for name, values in ids.items()},
+        **(meta or {}),
+    })
+
+    os.rename(staging, final)
+    if activate:
+        set_current(model_dir, version)
+    logger.info(f"Wrote model bundle {final}")
+    return final
+
+
+def load_bundle(path: str, mmap: bool = True) -> Dict:
+    """Open every array of a bundle (memory-mapped by default) plus its id lists"""
+    manifest = _read_json(os.path.join(path, MANIFEST))
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported model format {manifest.get('format_version')}")
+    mode = 'r' if mmap else None
+    arrays = {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+        for name in manifest['arrays']
+    }
+    ids = {name: _read_json(os.path.join(path, f"{name}.json")) for name in manifest['ids']}
+    return {'manifest': manifest, 'arrays': arrays, 'ids': ids}
+
+
+def csr_arrays(prefix: str, matrix: sp.spmatrix, dtype=np.float32) -> Dict[str, np.ndarray]:
+    matrix = sp.csr_matrix(matrix, dtype=dtype)
+    return {
+        f"{prefix}_data": matrix.data.astype(dtype),
+        f"{prefix}_indices": matrix.indices.astype(np.int32),
+        f"{prefix}_indptr": matrix.indptr.astype(np.int64),
+        f"{prefix}_shape": np.asarray(matrix.shape, dtype=np.int64),
+    }
+
+
+def csr_from_arrays(prefix: str, arrays: Dict[str, np.ndarray]) -> Optional[sp.csr_matrix]:
+    if f"{prefix}_data" not in arrays:
+        return None
+    return sp.csr_matrix(
+        (arrays[f"{prefix}_data"], arrays[f"{prefix}_indices"], arrays[f"{prefix}_indptr"]),
+        shape=tuple(int(n) for n in arrays[f"{prefix}_shape"]),
+        copy=False,
+    )
@@ -0,0 +1,140 @@
+"""
+Model Reloader
+Holds the active ModelArtifacts behind one reference that is replaced
+atomically, loading and validating new bundles off the request path
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from artifacts import ModelArtifacts
+from model_format import VERSIONS, is_version_name, resolve_bundle, set_current
+
+logger = logging.getLogger("recommendation.reloader")
+
+
+class ModelReloader:
+    """
+    Requests read `current` once and keep that object for their whole
+    lifetime, so a swap never changes the model under a running request;
+    the old version is released when its last request finishes.
+    """
+
+    def __init__(self, model_dir: str, poll_seconds: float = 0):
+        self.model_dir = model_dir
+        self.poll_seconds = poll_seconds
+        self.current: Optional[ModelArtifacts] = None
+        self.path: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        # One load at a time; readers never take it
+        self._reload_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+
+    def load_initial(self) -> Optional[ModelArtifacts]:
+        """Startup load, including the legacy pickle fallback"""
+        started = time.perf_counter()
+        loaded = ModelArtifacts.load(self.model_dir)
+        self.path = resolve_bundle(self.model_dir)
+        if loaded is not None:
+            try:
+                loaded.validate()
+            except ValueError as e:
+                self.last_error = str(e)
+                logger.error(f"Ignoring invalid model in {self.model_dir}: {e}")
+                loaded = None
+        self.current = loaded
+        self.load_seconds = time.perf_counter() - started
+        self.loaded_at = time.time()
+        return self.current
+
+    def version_path(self, version: str) -> str:
+        """Directory of a named version; raises ValueError for names that would leave versions/"""
+        if not is_version_name(version):
+            raise ValueError(f"Invalid model version name {version!r}")
+        return os.path.join(self.model_dir, VERSIONS, version)
+
+    def reload(self, version: Optional[str] = None, force: bool = False) -> Dict:
+        """
+        Load the bundle CURRENT points at (or a named version, which then
+        becomes CURRENT), validate it and swap it in. Unchanged bundles are
+        skipped unless force is set. Raises FileNotFoundError or ValueError
+        and keeps the running model when the new one is missing or invalid.
+        """
+        with self._reload_lock:
+            if version is not None:
+                path = self.version_path(version)
+                if not os.path.isdir(path):
+                    raise FileNotFoundError(f"Model version {version} not found")
+            else:
+                path = resolve_bundle(self.model_dir)
+                if path is None:
+                    raise FileNotFoundError(f"No model bundle in {self.model_dir}")
+            if path == self.path and not force:
+                return {**self.stats(), 'changed': False}
+
+            started = time.perf_counter()
+            try:
+                loaded = ModelArtifacts.from_bundle(path)
+                loaded.validate()
+            except Exception as e:
+                self.last_error = f"{os.path.basename(path)}: {e}"
+                logger.error(f"Rejected model bundle {path}: {e}")
+                raise ValueError(str(e)) from e
+            if version is not None:
+                set_current(self.model_dir, version)
+
+            # Single reference assignment: requests see either the old or the new model
+            self.current = loaded
+            self.path = path
+            self.load_seconds = time.perf_counter() - started
+            self.loaded_at = time.time()
+            self.reloads += 1
+            self.last_error = None
+            logger.info(f"Switched to model version {loaded.version} in {self.load_seconds:.3f}s")
+            return {**self.stats(), 'changed': True}
+
+    def reload_async(self, version: Optional[str] = None, force: bool = False) -> None:
+        def run():
+            try:
+                self.reload(version, force)
+            except Exception:
+                pass  # recorded in last_error
+        threading.Thread(target=run, name='model-reload', daemon=True).start()
+
+    def start_watcher(self) -> None:
+        """Poll model/CURRENT and reload when it points at a new version (e.g. after train.py)"""
+        if self.poll_seconds <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def _watch(self) -> None:
+        failed = None
+        while True:
+            time.sleep(self.poll_seconds)
+            latest = resolve_bundle(self.model_dir)
+            # A bundle that failed validation is not retried until CURRENT moves again
+            if latest is None or latest in (self.path, failed):
+                continue
+            try:
+                self.reload()
+                failed = None
+            except Exception:
+                failed = latest
+
+    def stats(self) -> Dict:
+        model = self.current
+        return {
+            'version': model.version if model is not None else None,
+            'path': self.path,
+            'loaded_at': self.loaded_at,
+            'load_seconds': round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+            'watching': self._watcher is not None,
+        }
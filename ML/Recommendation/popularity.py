@@ -0,0 +1,171 @@
+"""
+Popularity
+Time-decayed registration counts per event, kept as a ranked list so
+cold-start users (no interests, skills or history) are answered without
+scoring the catalogue.
+
+Counts use forward decay: an action at time t adds
+weight * 2^((t - landmark) / half_life) to its event. Every stored score
+decays by the same factor as time passes, so the ranking only changes when
+an action arrives and never has to be recomputed on a timer. Scores only
+grow, which lets the top list be maintained by insertion alone.
+"""
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("recommendation.popularity")
+
+HALF_LIFE_DAYS = 7.0
+# Events kept in the ranked list
+TOP_SIZE = 1000
+# Rescale every score once the landmark is this many half-lives old (2^64 is far from float64 limits)
+REBASE_HALF_LIVES = 64
+# Profiles with fewer interests, skills and history events than this get
+# trending blended into their scores, the sparser the more
+SPARSE_PROFILE_SIZE = 5
+POPULARITY_WEIGHT = 0.3
+
+
+class TrendingIndex:
+    def __init__(self, half_life_days: float = HALF_LIFE_DAYS, top_size: int = TOP_SIZE):
+        self.half_life = half_life_days * 86400.0
+        self.top_size = top_size
+        self._lock = threading.Lock()
+        self._landmark = time.time()
+        # event id -> forward-decayed score
+        self._scores: Dict[str, float] = {}
+        # Top list, best first: negated scores (ascending, for bisect) and ids
+        self._top_keys: List[float] = []
+        self._top_ids: List[str] = []
+        self.actions = 0
+        self.rebases = 0
+        self.updated_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def _weight(self, weight: float, timestamp: float) -> float:
+        exponent = (timestamp - self._landmark) / self.half_life
+        if exponent > REBASE_HALF_LIVES:
+            self._rebase(timestamp)
+            exponent = (timestamp - self._landmark) / self.half_life
+        return weight * 2.0 ** exponent
+
+    def _rebase(self, timestamp: float) -> None:
+        """Move the landmark forward, scaling every score by the same factor (order is unchanged)"""
+        factor = 2.0 ** ((self._landmark - timestamp) / self.half_life)
+        for key in self._scores:
+            self._scores[key] *= factor
+        self._top_keys = [key * factor for key in self._top_keys]
+        self._landmark = timestamp
+        self.rebases += 1
+
+    def _place(self, event_id: str, old: float, new: float) -> None:
+        """Move event_id to its new score in the top list; O(top_size) at worst, nothing if it stays out"""
+        full = len(self._top_ids) >= self.top_size
+        if old > 0 and (not full or -old <= self._top_keys[-1]):
+            # Possibly in the list: find it among the entries with its old score
+            i = bisect.bisect_left(self._top_keys, -old)
+            while i < len(self._top_ids) and self._top_keys[i] == -old and self._top_ids[i] != event_id:
+                i += 1
+            if i < len(self._top_ids) and self._top_ids[i] == event_id:
+                del self._top_keys[i]
+                del self._top_ids[i]
+                full = False
+        if full and -new >= self._top_keys[-1]:
+            return
+        i = bisect.bisect_left(self._top_keys, -new)
+        self._top_keys.insert(i, -new)
+        self._top_ids.insert(i, event_id)
+        if len(self._top_ids) > self.top_size:
+            self._top_keys.pop()
+            self._top_ids.pop()
+
+    def add(self, items: Iterable[Tuple[str, float, Optional[float]]]) -> int:
+        """Record (event id, weight, timestamp or None for now) actions; returns how many were applied"""
+        now = time.time()
+        applied = 0
+        with self._lock:
+            for event_id, weight, timestamp in items:
+                if weight <= 0:
+                    continue
+                event_id = str(event_id)
+                old = self._scores.get(event_id, 0.0)
+                new = old + self._weight(weight, min(now, timestamp) if timestamp is not None else now)
+                self._scores[event_id] = new
+                self._place(event_id, old, new)
+                applied += 1
+            self.actions += applied
+            if applied:
+                self.updated_at = now
+        return applied
+
+    def seed(self, counts: Dict[str, float], timestamp: Optional[float] = None) -> int:
+        """Load counts (e.g. attendees per event from the model) as if they all happened at timestamp"""
+        applied = self.add((event_id, float(count), timestamp) for event_id, count in counts.items())
+        logger.info(f"Seeded trending index with {applied} events")
+        return applied
+
+    def ranked(self, limit: int, allowed: Callable[[str], bool]) -> List[Tuple[str, float]]:
+        """
+        Up to limit (event id, score relative to the leader) pairs from the top
+        list, best first, keeping only ids allowed accepts. Cost depends on
+        limit and on how many top events are skipped, not on catalogue size.
+        """
+        with self._lock:
+            if not self._top_ids or limit <= 0:
+                return []
+            leader = -self._top_keys[0]
+            picked = []
+            for key, event_id in zip(self._top_keys, self._top_ids):
+                if allowed(event_id):
+                    picked.append((event_id, -key / leader))
+                    if len(picked) >= limit:
+                        break
+            return picked
+
+    def scores(self, event_ids: List[str]) -> np.ndarray:
+        """Scores relative to the leader (0 to 1) for the given events, 0 for unseen ones"""
+        with self._lock:
+            if not self._top_ids:
+                return np.zeros(len(event_ids), dtype=np.float32)
+            leader = -self._top_keys[0]
+            get = self._scores.get
+            return np.fromiter((get(str(e), 0.0) / leader for e in event_ids), dtype=np.float32, count=len(event_ids))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            decay = 2.0 ** ((self._landmark - time.time()) / self.half_life)
+            top = [{'eventId': event_id, 'count': round(-key * decay, 3)}
+                   for key, event_id in zip(self._top_keys[:5], self._top_ids[:5])]
+            return {
+                'events': len(self._scores),
+                'ranked': len(self._top_ids),
+                'actions': self.actions,
+                'half_life_days': self.half_life / 86400.0,
+                'rebases': self.rebases,
+                'updated_at': self.updated_at,
+                'top': top,
+            }
+
+
+def model_counts(model) -> Dict[str, float]:
+    """Attendees per event in a model's interaction index, for seeding"""
+    interactions = model.interactions if model is not None else None
+    if interactions is None:
+        return {}
+    attendees = np.diff(np.asarray(interactions.event_indptr))
+    return {event_id: float(n) for event_id, n in zip(interactions.event_ids, attendees) if n > 0}
+
+
+def blend_weight(user_profile: Dict, weight: float = POPULARITY_WEIGHT,
+                 sparse_size: int = SPARSE_PROFILE_SIZE) -> float:
+    """Share of the score given to trending: weight for an empty profile, falling to 0 at sparse_size entries"""
+    size = sum(len(user_profile.get(field) or []) for field in
+               ('interests', 'skills', 'attendedEvents', 'registeredEvents'))
+    return weight * max(0.0, 1.0 - size / sparse_size) if sparse_size > 0 else 0.0
@@ -0,0 +1,72 @@
+"""
+Diversity Re-ranking
+Maximal Marginal Relevance over the best-scored candidates, using the stored
+TF-IDF rows for event-to-event similarity, with an optional cap on how many
+events one organizer may place in the final list
+"""
+from typing import Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+# Best-scored candidates considered for re-ranking
+RERANK_POOL = 200
+
+
+def _similarities(vectors: sp.csr_matrix, i: int, row: np.ndarray) -> np.ndarray:
+    """Dot product of every row with row i, densifying row i into the scratch buffer row"""
+    start, end = vectors.indptr[i], vectors.indptr[i + 1]
+    columns = vectors.indices[start:end]
+    row[columns] = vectors.data[start:end]
+    similarities = vectors @ row
+    row[columns] = 0
+    return similarities
+
+
+def mmr(relevance: np.ndarray, vectors: sp.csr_matrix, k: int, diversity: float = 0.0,
+        organizers: Optional[np.ndarray] = None, max_per_organizer: Optional[int] = None) -> np.ndarray:
+    """
+    Positions of k items picked greedily by
+
+        (1 - diversity) * relevance / max(relevance) - diversity * max similarity to the items already picked
+
+    vectors must be L2-normalised so their dot product is the cosine. No
+    pool x pool matrix is built: each pick multiplies the pool by its own
+    row and folds the result into a running maximum, so the loop costs k
+    sparse-matrix / dense-vector products.
+
+    Organizer id -1 (missing) is never capped. If the cap leaves fewer than
+    k items, the remaining slots are filled in the same order ignoring it.
+    """
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    scale = float(np.max(np.abs(relevance)))
+    gain = (1 - diversity) * (relevance / scale if scale > 0 else relevance).astype(np.float32)
+    vectors = vectors.tocsr()
+    row = np.zeros(vectors.shape[1], dtype=vectors.dtype)
+    penalty = np.zeros(n, dtype=np.float32)
+
+    open_ = np.ones(n, dtype=bool)
+    capped = np.zeros(n, dtype=bool)
+    per_organizer = {}
+    picked = []
+    while len(picked) < k:
+        objective = gain - penalty
+        objective[~open_ | capped] = -np.inf
+        i = int(np.argmax(objective))
+        if objective[i] == -np.inf:
+            # Every remaining item is capped; relax the cap for the rest
+            capped[:] = False
+            continue
+        picked.append(i)
+        open_[i] = False
+        if diversity > 0:
+            np.maximum(penalty, diversity * _similarities(vectors, i, row), out=penalty)
+        if max_per_organizer is not None and organizers is not None and organizers[i] >= 0:
+            count = per_organizer[organizers[i]] = per_organizer.get(organizers[i], 0) + 1
+            if count >= max_per_organizer:
+                capped |= organizers == organizers[i]
+    return np.asarray(picked, dtype=np.int64)
@@ -0,0 +1,33 @@
+"""
+Production launcher: uvicorn serving asgi:app with one or more worker processes
+
+    python serve.py --workers 2 --port 7860
+"""
+import argparse
+import logging
+import os
+
+import uvicorn
+
+logger = logging.getLogger("recommendation.serve")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 7860)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', 1)),
+                        help='Worker processes (default: WEB_CONCURRENCY or 1)')
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args(argv)
+
+    if args.workers > 1:
+        # Workers share the memory-mapped model bundle but nothing else
+        logger.warning(f"Starting {args.workers} workers; each keeps its own event catalogue and caches, "
+                       "so catalogue writes must reach every worker or requests must send availableEvents")
+    uvicorn.run('asgi:app', host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    main()
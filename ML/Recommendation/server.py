@@ -1,37 +1,249 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-import pickle
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import json
+import logging
+
+import ann
+import embeddings
+from cache import LRUCache
+from catalogue import EventCatalogue, VersionConflict
+from candidates import DEFAULT_POOL_SIZE, DEFAULT_RECENCY_DAYS, generate_candidates
+from event_store import INLINE_TTL, QUERY_CACHE_SIZE, QUERY_CACHE_TTL, REFIT_SECONDS, EventVectorStore, content_hash
+from inverted_index import normalize
+from feedback import COMPACT_SECONDS, KEEP_VERSIONS, MAX_PENDING, FeedbackStore
+from metrics import CONTENT_TYPE, SIZE_BUCKETS, Registry, StageTimer, cache_families
+from model_format import is_version_name
+from model_reloader import ModelReloader
+from popularity import HALF_LIFE_DAYS, POPULARITY_WEIGHT, SPARSE_PROFILE_SIZE, TrendingIndex, blend_weight, model_counts
+from rerank import RERANK_POOL, mmr
+from scoring import batch_top_k, boost_scores, profile_text, top_k
+
+logging.basicConfig(level=logging.INFO)
 
 app = Flask(__name__)
 CORS(app)
 
-
 import os
-similarity_matrix = None
-model_path = 'model/events_similarity.pkl'
-if os.path.exists(model_path):
-    try:
-        with open(model_path, 'rb') as f:
-            similarity_matrix = pickle.load(f)
-        print("Loaded pre-trained similarity matrix")
-    except Exception as e:
-        similarity_matrix = None
-        print(f"Error loading similarity matrix: {e}")
+
+# Long-lived event vectors; events are only vectorized when first seen or edited.
+# User profile vectors are cached per userId and profile hash.
+event_store = EventVectorStore(
+    query_cache_size=int(os.environ.get('RECOMMENDATION_USER_CACHE_SIZE', QUERY_CACHE_SIZE)),
+    query_cache_ttl=float(os.environ.get('RECOMMENDATION_USER_CACHE_TTL', QUERY_CACHE_TTL)),
+    refit_seconds=float(os.environ.get('RECOMMENDATION_REFIT_SECONDS', REFIT_SECONDS)),
+    inline_ttl=float(os.environ.get('RECOMMENDATION_INLINE_EVENT_TTL', INLINE_TTL))
+)
+# Events pushed by the backend, so requests can send IDs or a filter instead of full events
+catalogue = EventCatalogue(event_store)
+# Final /recommend responses per user, request and catalogue version (catalogue requests only)
+result_cache = LRUCache(
+    int(os.environ.get('RECOMMENDATION_RESULT_CACHE_SIZE', 10000)),
+    float(os.environ.get('RECOMMENDATION_RESULT_CACHE_TTL', 300))
+)
+
+# Optional FAISS index over dense event embeddings, used as a candidate source
+# for large catalogues; 'auto' retrieval switches to it from ANN_MIN_EVENTS events
+ann_retriever = ann.ANNRetriever(event_store) if ann.available() else None
+DEFAULT_RETRIEVAL = os.environ.get('RECOMMENDATION_RETRIEVAL', 'auto')
+ANN_MIN_EVENTS = int(os.environ.get('RECOMMENDATION_ANN_MIN_EVENTS', ann.MIN_EVENTS))
+DEFAULT_ANN_CANDIDATES = int(os.environ.get('RECOMMENDATION_ANN_CANDIDATES', ann.CANDIDATES))
+
+MODEL_DIR = os.environ.get('MODEL_DIR', 'model')
+DEFAULT_SCORING_MODE = os.environ.get('RECOMMENDATION_SCORING_MODE', 'content')
+DEFAULT_HYBRID_WEIGHT = float(os.environ.get('RECOMMENDATION_HYBRID_WEIGHT', 0.3))
+DEFAULT_CANDIDATE_POOL = int(os.environ.get('RECOMMENDATION_CANDIDATE_POOL', DEFAULT_POOL_SIZE))
+DEFAULT_CANDIDATE_RECENCY_DAYS = float(os.environ.get('RECOMMENDATION_RECENCY_DAYS', DEFAULT_RECENCY_DAYS))
+# MMR re-ranking: 0 keeps plain score order unless maxPerOrganizer is given
+DEFAULT_DIVERSITY = float(os.environ.get('RECOMMENDATION_DIVERSITY', 0))
+DEFAULT_RERANK_POOL = int(os.environ.get('RECOMMENDATION_RERANK_POOL', RERANK_POOL))
+# How often to check model/CURRENT for a new bundle (0 disables)
+MODEL_POLL_SECONDS = float(os.environ.get('RECOMMENDATION_MODEL_POLL', 30))
+
+# Optional sentence-transformer embeddings for scoringMode 'embedding', persisted
+# under the model directory; encoded lazily, or ahead of requests on catalogue
+# updates when warming is on (the default when 'embedding' is the default mode)
+event_embeddings = embeddings.EventEmbeddings(
+    event_store,
+    os.environ.get('RECOMMENDATION_EMBEDDING_DIR', os.path.join(MODEL_DIR, 'embeddings')),
+    os.environ.get('RECOMMENDATION_EMBEDDING_MODEL', embeddings.MODEL_NAME),
+    int(os.environ.get('RECOMMENDATION_EMBEDDING_BATCH', embeddings.BATCH_SIZE))
+) if embeddings.available() else None
+EMBEDDING_WARM = os.environ.get(
+    'RECOMMENDATION_EMBEDDING_WARM', '1' if DEFAULT_SCORING_MODE == 'embedding' else ''
+).lower() in ('1', 'true', 'yes')
+
+# Precomputed collaborative artifacts (similar users, item neighbours, co-attendance).
+# Handlers read models.current once per request; reloads swap it atomically.
+models = ModelReloader(MODEL_DIR, MODEL_POLL_SECONDS)
+if models.load_initial() is not None:
+    print("Loaded pre-trained model artifacts")
 else:
     print("No pre-trained model found, using dynamic calculation")
+models.start_watcher()
+
+# Time-decayed registration counts answering cold-start users; seeded with the
+# model's attendee counts and kept current by the feedback stream
+trending = TrendingIndex(float(os.environ.get('RECOMMENDATION_TRENDING_HALF_LIFE_DAYS', HALF_LIFE_DAYS)))
+trending.seed(model_counts(models.current))
+DEFAULT_POPULARITY_WEIGHT = float(os.environ.get('RECOMMENDATION_POPULARITY_WEIGHT', POPULARITY_WEIGHT))
+SPARSE_PROFILE = int(os.environ.get('RECOMMENDATION_SPARSE_PROFILE_SIZE', SPARSE_PROFILE_SIZE))
+
+# Streamed registrations, attendance and clicks, folded into the model by a background compactor
+feedback = FeedbackStore(
+    models,
+    float(os.environ.get('RECOMMENDATION_FEEDBACK_COMPACT', COMPACT_SECONDS)),
+    int(os.environ.get('RECOMMENDATION_FEEDBACK_MAX_PENDING', MAX_PENDING)),
+    trending,
+    int(os.environ.get('RECOMMENDATION_MODEL_KEEP_VERSIONS', KEEP_VERSIONS))
+)
+feedback.start()
+
+# Prometheus metrics served at /metrics. Handlers time their stages through
+# g.timer; RECOMMENDATION_SERVER_TIMING=1 also returns them as Server-Timing.
+SERVER_TIMING = os.environ.get('RECOMMENDATION_SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
+metrics = Registry()
+REQUESTS = metrics.counter('recommendation_requests_total', 'Requests by endpoint, method and status',
+                           ('endpoint', 'method', 'status'))
+REQUEST_SECONDS = metrics.histogram('recommendation_request_seconds', 'Request latency by endpoint', ('endpoint',))
+STAGE_SECONDS = metrics.histogram('recommendation_stage_seconds', 'Time spent in each request stage',
+                                  ('endpoint', 'stage'))
+EVENTS_PER_REQUEST = metrics.histogram('recommendation_request_events', 'Events considered per request',
+                                       ('endpoint',), SIZE_BUCKETS)
+CANDIDATES_PER_REQUEST = metrics.histogram('recommendation_request_candidates', 'Events scored per request',
+                                           ('endpoint',), SIZE_BUCKETS)
+COLD_STARTS = metrics.counter('recommendation_cold_start_total', 'Requests answered from the trending list')
+
+@metrics.collector
+def _service_metrics():
+    caches = {'result': result_cache, 'user_vector': event_store.query_cache}
+    if event_embeddings is not None:
+        caches['user_embedding'] = event_embeddings.query_cache
+    families = cache_families('recommendation', caches)
+    families.append(('recommendation_catalogue_events', 'gauge', 'Events in the catalogue', [({}, len(catalogue))]))
+    families.append(('recommendation_event_store_rows', 'gauge', 'Vectorized events held in memory',
+                     [({}, event_store.row_count())]))
+    feedback_stats = feedback.stats()
+    families.append(('recommendation_feedback_received_total', 'counter', 'Feedback actions accepted',
+                     [({}, feedback_stats['received'])]))
+    families.append(('recommendation_feedback_pending_pairs', 'gauge', 'User-event pairs waiting for compaction',
+                     [({}, feedback_stats['pending_pairs'])]))
+    families.append(('recommendation_feedback_compactions_total', 'counter', 'Feedback compactions into a new model',
+                     [({}, feedback_stats['compactions'])]))
+    trending_stats = trending.stats()
+    families.append(('recommendation_trending_events', 'gauge', 'Events with a trending count',
+                     [({}, trending_stats['events'])]))
+    families.append(('recommendation_trending_actions_total', 'counter', 'Actions added to the trending counts',
+                     [({}, trending_stats['actions'])]))
+    if event_embeddings is not None:
+        embedding_stats = event_embeddings.stats()
+        families.append(('recommendation_embedding_events', 'gauge', 'Event texts with a stored embedding',
+                         [({}, embedding_stats['events'])]))
+        families.append(('recommendation_embedding_matrix_bytes', 'gauge', 'Bytes used by the event embedding matrix',
+                         [({}, embedding_stats['matrix_bytes'])]))
+        families.append(('recommendation_embedding_encoded_total', 'counter', 'Event texts encoded by this process',
+                         [({}, embedding_stats['encoded'])]))
+        families.append(('recommendation_embedding_encode_seconds_total', 'counter', 'Time spent encoding event texts',
+                         [({}, embedding_stats['encode_seconds'])]))
+    serving = app.extensions.get('serving')
+    if serving is not None:
+        stats = serving.stats()
+        families.append(('recommendation_scoring_in_flight', 'gauge', 'Scoring requests running or queued',
+                         [({}, stats['in_flight'])]))
+        families.append(('recommendation_scoring_rejected_total', 'counter', 'Scoring requests shed with 503',
+                         [({}, stats['rejected'])]))
+        families.append(('recommendation_scoring_timed_out_total', 'counter', 'Scoring requests answered with 504',
+                         [({}, stats['timed_out'])]))
+    return families
+
+@app.before_request
+def _start_timer():
+    g.timer = StageTimer()
+
+@app.after_request
+def _record_request(response):
+    timer = g.get('timer')
+    if timer is None:
+        return response
+    elapsed = timer.elapsed()
+    # The route pattern, so /events/<event_id> is one series
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+    for stage, seconds in timer.stages.items():
+        STAGE_SECONDS.observe(seconds, endpoint=endpoint, stage=stage)
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = timer.server_timing(elapsed)
+    return response
 
 @app.route('/recommend', methods=['POST'])
 def recommend_events():
+    timer = g.timer
     try:
-        data = request.json
+        with timer.stage('parse'):
+            data = request.json
+        # Pin the model for this request; a concurrent reload does not affect it
+        model = models.current
         
         user_profile = data.get('userProfile', {})
-        available_events = data.get('availableEvents', [])
+        user_id = user_profile.get('userId')
         limit = data.get('limit', 10)
+        scoring_mode = data.get('scoringMode', DEFAULT_SCORING_MODE)
+        hybrid_weight = float(data.get('hybridWeight', DEFAULT_HYBRID_WEIGHT))
+        candidate_pool_size = int(data.get('candidatePoolSize', DEFAULT_CANDIDATE_POOL))
+        recency_days = float(data.get('recencyDays', DEFAULT_CANDIDATE_RECENCY_DAYS))
+        retrieval = data.get('retrieval', DEFAULT_RETRIEVAL)
+        ann_candidates = int(data.get('annCandidates', DEFAULT_ANN_CANDIDATES))
+        diversity = float(data.get('diversity', DEFAULT_DIVERSITY))
+        max_per_organizer = data.get('maxPerOrganizer')
+        rerank_pool = int(data.get('rerankPool', DEFAULT_RERANK_POOL))
+        popularity_weight = float(data.get('popularityWeight', DEFAULT_POPULARITY_WEIGHT))
+        
+        if not 0 <= diversity <= 1:
+            return jsonify({'error': 'diversity must be between 0 and 1', 'recommendations': []}), 400
+        if not 0 <= popularity_weight <= 1:
+            return jsonify({'error': 'popularityWeight must be between 0 and 1', 'recommendations': []}), 400
+        if scoring_mode == 'embedding' and event_embeddings is None:
+            return jsonify({
+                'error': 'Embedding scoring needs sentence-transformers (pip install sentence-transformers)',
+                'recommendations': []
+            }), 503
+        if max_per_organizer is not None:
+            max_per_organizer = int(max_per_organizer)
+            if max_per_organizer < 1:
+                return jsonify({'error': 'maxPerOrganizer must be at least 1', 'recommendations': []}), 400
+        
+        # Repeated catalogue requests (dashboard refreshes) are answered from memory
+        result_key = _result_key(data, user_id, model)
+        if result_key is not None:
+            cached = result_cache.get(result_key)
+            if cached is not None:
+                with timer.stage('serialize'):
+                    return jsonify(cached)
+        
+        with timer.stage('features'):
+            texts = [profile_text(user_profile)]
+        
+        # Nothing to match on: answer from the trending list without
+        # vectorizing or scoring the events
+        if _is_cold_start(user_profile, texts[0], user_id, scoring_mode, model):
+            with timer.stage('trending'):
+                recommendations = _trending_recommendations(data, limit)
+            COLD_STARTS.inc()
+            if recommendations is None:
+                return jsonify({
+                    'recommendations': [],
+                    'message': 'No events available for recommendation'
+                })
+            with timer.stage('serialize'):
+                return jsonify({
+                    'recommendations': recommendations,
+                    'message': 'Recommendations generated successfully'
+                })
+        
+        # Create user profile vector alongside the event vectors
+        with timer.stage('vectorize'):
+            available_events, batch = _request_events(data, texts, [user_id], scoring_mode == 'embedding')
         
         if not available_events:
             return jsonify({
@@ -39,68 +251,231 @@ def recommend_events():
                 'message': 'No events available for recommendation'
             })
         
-        # Extract user interests and event features
-        user_interests = user_profile.get('interests', [])
-        user_skills = user_profile.get('skills', [])
         attended_events = user_profile.get('attendedEvents', [])
         
-        # Create user profile vector
-        user_profile_text = ' '.join(user_interests + user_skills)
+        if scoring_mode == 'embedding':
+            # Dense similarity is one matrix-vector product over every event,
+            # so there is no candidate pre-filter
+            with timer.stage('embed'):
+                query = event_embeddings.encode_queries(texts, [user_id])[0]
+                matrix, rows = event_embeddings.lookup(batch.rows, batch.texts, batch.version)
+            candidates = np.arange(len(available_events))
+            with timer.stage('cosine'):
+                scores = event_embeddings.score(matrix, rows, query)
+        else:
+            # Stage 1: cheap candidate pool from the inverted index and recency
+            # window; fall back to every event when it cannot fill the limit
+            with timer.stage('candidates'):
+                candidates = generate_candidates(event_store, batch, user_profile, candidate_pool_size, recency_days)
+            if candidates is not None and _use_ann(retrieval, len(available_events)):
+                # Text-similar events the tag/type/organizer index cannot find
+                with timer.stage('ann'):
+                    nearest = ann_retriever.candidates(batch, ann_candidates)
+                if nearest is not None:
+                    # Both are batch positions; a mask merges them without sorting
+                    selected = np.zeros(len(available_events), dtype=bool)
+                    selected[candidates] = True
+                    selected[nearest] = True
+                    candidates = np.flatnonzero(selected)
+            if candidates is None or len(candidates) < min(limit, len(available_events)):
+                candidates = np.arange(len(available_events))
+            
+            # Stage 2: exact scoring on the candidates using stored TF-IDF rows
+            # (already L2-normalised, so the dot product is the cosine similarity)
+            with timer.stage('cosine'):
+                scores = (batch.vectors[candidates] @ batch.queries.T).toarray().ravel().astype(np.float32)
+        EVENTS_PER_REQUEST.observe(len(available_events), endpoint='/recommend')
+        CANDIDATES_PER_REQUEST.observe(len(candidates), endpoint='/recommend')
         
-        # Create event feature vectors
-        event_features = []
-        for event in available_events:
-            event_text = f"{event.get('title', '')} {event.get('description', '')} {' '.join(event.get('tags', []))} {event.get('type', '')} {event.get('organizer', '')}"
-            event_features.append(event_text)
+        # Organizer/type/tag boosts as one vectorized add
+        with timer.stage('boost'):
+            scores += boost_scores(event_store, batch, user_profile, candidates)
+        # Reasons describe profile similarity, so they read the score before
+        # trending and collaborative signals are blended in
+        content_scores = scores.copy()
         
-        # Calculate similarity using TF-IDF and cosine similarity
-        if event_features:
-            vectorizer = TfidfVectorizer(stop_words='english', max_features=1000)
-            event_vectors = vectorizer.fit_transform(event_features)
-            
-            # Add user profile to the vector space
-            user_vector = vectorizer.transform([user_profile_text])
-            
-            # Calculate similarities
-            similarities = cosine_similarity(user_vector, event_vectors).flatten()
-            
-            # Create recommendations
+        # Sparse profiles lean on what is trending, the sparser the more
+        weight = blend_weight(user_profile, popularity_weight, SPARSE_PROFILE)
+        popularity = None
+        if weight > 0:
+            with timer.stage('popularity'):
+                popularity = trending.scores([str(available_events[i].get('eventId')) for i in candidates])
+                scores = (1 - weight) * scores + weight * popularity
+        
+        # Collaborative signals from the precomputed artifacts
+        signals = None
+        if scoring_mode == 'hybrid' and model is not None:
+            with timer.stage('collaborative'):
+                # History known to the model (including compacted feedback) and
+                # feedback not compacted yet count alongside the request's events
+                history = [str(e.get('eventId')) for e in attended_events + user_profile.get('registeredEvents', [])]
+                if user_id is not None:
+                    if model.interactions is not None:
+                        history += model.interactions.events_of_user(str(user_id))
+                    history += feedback.events_of_user(str(user_id))
+                signals = model.collaborative_scores(
+                    [str(available_events[i].get('eventId')) for i in candidates],
+                    str(user_id) if user_id is not None else None,
+                    list(dict.fromkeys(history))
+                )
+                # Without any collaborative signal for this user, blending
+                # would only scale the content scores down
+                if signals['blend'].any():
+                    scores = (1 - hybrid_weight) * scores + hybrid_weight * signals['blend']
+        
+        # Select the top recommendations, then explain only those
+        if diversity > 0 or max_per_organizer is not None:
+            # Re-rank the best rerankPool by MMR so near-duplicates and
+            # one organizer's series do not fill the list
+            with timer.stage('rank'):
+                pool = top_k(scores[np.newaxis, :], max(rerank_pool, limit))[0]
+            with timer.stage('rerank'):
+                rows = candidates[pool]
+                top = pool[mmr(scores[pool], batch.vectors[rows], limit, diversity,
+                               batch.organizers[rows], max_per_organizer)]
+        else:
+            with timer.stage('rank'):
+                top = top_k(scores[np.newaxis, :], limit)[0]
+        with timer.stage('reasons'):
+            profile_sets = _profile_sets(user_profile)
             recommendations = []
-            for i, event in enumerate(available_events):
-                similarity_score = float(similarities[i])
-                
-                # Boost score based on user history
-                if event.get('organizer') in [e.get('organizer') for e in attended_events]:
-                    similarity_score += 0.2
-                
-                if event.get('type') in user_interests:
-                    similarity_score += 0.3
-                
-                # Add common tags bonus
-                event_tags = set(event.get('tags', []))
-                user_interest_tags = set(user_interests)
-                common_tags = event_tags.intersection(user_interest_tags)
-                similarity_score += len(common_tags) * 0.1
-                
+            for i in top:
+                event = available_events[candidates[i]]
+                event_signals = {name: float(values[i]) for name, values in signals.items()} if signals is not None else None
                 recommendations.append({
                     'eventId': event.get('eventId'),
-                    'similarityScore': round(similarity_score, 3),
-                    'reason': _get_recommendation_reason(event, user_profile, similarity_score)
+                    'similarityScore': round(float(scores[i]), 3),
+                    'reason': _get_recommendation_reason(event, user_profile, float(content_scores[i]), event_signals, profile_sets,
+                                                         float(popularity[i]) if popularity is not None else None)
                 })
+        
+        response = {
+            'recommendations': recommendations,
+            'message': 'Recommendations generated successfully'
+        }
+        if result_key is not None:
+            result_cache.put(result_key, response)
+        with timer.stage('serialize'):
+            return jsonify(response)
             
-            # Sort by similarity score and return top recommendations
-            recommendations.sort(key=lambda x: x['similarityScore'], reverse=True)
-            recommendations = recommendations[:limit]
-            
+    except Exception as e:
+        return jsonify({
+            'error': f'Error generating recommendations: {str(e)}',
+            'recommendations': []
+        }), 500
+
+@app.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    timer = g.timer
+    try:
+        with timer.stage('parse'):
+            data = request.json
+        
+        user_profiles = data.get('userProfiles', [])
+        limit = data.get('limit', 10)
+        empty = {
+            'results': [],
+            'message': 'No events or users available for recommendation'
+        }
+        if not user_profiles:
+            return jsonify(empty)
+        
+        # Vectorize the shared event list once and every profile in one call.
+        # The user vector cache is bypassed: one bulk transform is cheaper than
+        # per-user lookups, and a large batch would evict interactive users.
+        with timer.stage('features'):
+            texts = [profile_text(p) for p in user_profiles]
+        with timer.stage('vectorize'):
+            available_events, batch = _request_events(data, texts)
+        
+        if not available_events:
+            return jsonify(empty)
+        
+        EVENTS_PER_REQUEST.observe(len(available_events), endpoint='/recommend/batch')
+        
+        # Scoring and ranking run block by block inside batch_top_k, so they
+        # are timed together; reasons are timed separately
+        results = []
+        blocks = batch_top_k(event_store, batch, user_profiles, limit)
+        while True:
+            with timer.stage('score'):
+                block = next(blocks, None)
+            if block is None:
+                break
+            start, top, scores = block
+            with timer.stage('reasons'):
+                for offset in range(top.shape[0]):
+                    user_profile = user_profiles[start + offset]
+                    profile_sets = _profile_sets(user_profile)
+                    results.append({
+                        'userId': user_profile.get('userId'),
+                        'recommendations': [{
+                            'eventId': available_events[i].get('eventId'),
+                            'similarityScore': round(float(score), 3),
+                            'reason': _get_recommendation_reason(available_events[i], user_profile, float(score),
+                                                                 profile_sets=profile_sets)
+                        } for i, score in zip(top[offset], scores[offset])]
+                    })
+        
+        with timer.stage('serialize'):
             return jsonify({
-                'recommendations': recommendations,
+                'results': results,
                 'message': 'Recommendations generated successfully'
             })
-        else:
+            
+    except Exception as e:
+        return jsonify({
+            'error': f'Error generating recommendations: {str(e)}',
+            'results': []
+        }), 500
+
+@app.route('/recommend/collaborative', methods=['POST'])
+def recommend_collaborative():
+    try:
+        data = request.json
+        model = models.current
+        
+        user_id = data.get('userId')
+        limit = data.get('limit', 10)
+        neighbours = data.get('neighbours')
+        exclude_attended = data.get('excludeAttended', True)
+        event_ids = data.get('eventIds')
+        
+        if model is None or model.collaborative is None:
             return jsonify({
-                'recommendations': [],
-                'message': 'No event features available'
-            })
+                'error': 'Collaborative model not loaded',
+                'recommendations': []
+            }), 503
+        
+        if user_id is None:
+            return jsonify({
+                'error': 'userId is required',
+                'recommendations': []
+            }), 400
+        
+        engine = model.collaborative
+        user_id = str(user_id)
+        results = engine.recommend(
+            user_id,
+            limit=limit,
+            k=neighbours,
+            exclude_attended=exclude_attended,
+            allowed=[str(e) for e in event_ids] if event_ids is not None else None
+        )
+        
+        recommendations = [{
+            'eventId': result['eventId'],
+            'similarityScore': round(result['score'], 3),
+            'reason': f"Attended by {result['supportingUsers']} users similar to you"
+        } for result in results]
+        
+        return jsonify({
+            'recommendations': recommendations,
+            'similarUsers': [{'userId': u, 'similarity': round(score, 3)}
+                             for u, score in engine.similar_users(user_id, neighbours)],
+            'message': 'Recommendations generated successfully' if recommendations
+                       else 'No collaborative recommendations for this user'
+        })
             
     except Exception as e:
         return jsonify({
@@ -108,27 +483,282 @@ def recommend_events():
             'recommendations': []
         }), 500
 
-def _get_recommendation_reason(event, user_profile, similarity_score):
+def _request_events(data, texts, user_keys=None, with_texts=False):
+    """
+    Events for a request and their batch: the inline availableEvents list
+    when given, otherwise catalogue events picked by eventIds and/or filter
+    """
+    available_events = data.get('availableEvents')
+    if available_events is not None:
+        return available_events, (
+            event_store.vectorize(available_events, texts, user_keys, with_texts) if available_events else None
+        )
+    return catalogue.vectorize(texts, data.get('eventIds'), data.get('filter'), user_keys, with_texts)
+
+def _is_cold_start(user_profile, text, user_id, scoring_mode, model):
+    """No interests, skills or history to score against; in hybrid mode the model and pending feedback count as history"""
+    if text.strip() or user_profile.get('attendedEvents') or user_profile.get('registeredEvents'):
+        return False
+    if scoring_mode == 'hybrid' and user_id is not None:
+        if model is not None and model.interactions is not None and str(user_id) in model.interactions.user_index:
+            return False
+        if feedback.events_of_user(str(user_id)):
+            return False
+    return True
+
+def _trending_recommendations(data, limit):
+    """
+    Recommendations from the trending list restricted to the request's events,
+    topped up in request order when too few of them are trending; None when
+    the request has no events. Catalogue requests without a filter only look
+    up the trending events, so the cost does not grow with the catalogue.
+    """
+    available_events = data.get('availableEvents')
+    event_ids, filters = data.get('eventIds'), data.get('filter')
+    if available_events is not None:
+        events = {str(e.get('eventId')): e for e in available_events}
+    elif filters:
+        keys, selected = catalogue.select(event_ids, filters)
+        events = dict(zip(keys, selected))
+    elif event_ids is not None:
+        events = {str(k): catalogue.get(k) for k in event_ids if k in catalogue}
+    else:
+        events = None  # the whole catalogue
+    
+    lookup = events.get if events is not None else catalogue.get
+    picked = [(lookup(event_id), score) for event_id, score in trending.ranked(limit, lambda k: lookup(k) is not None)]
+    if len(picked) < limit:
+        seen = {str(event.get('eventId')) for event, _ in picked}
+        if events is None:
+            _, rest = catalogue.select()
+        else:
+            rest = events.values()
+        for event in rest:
+            if len(picked) >= limit:
+                break
+            if str(event.get('eventId')) not in seen:
+                picked.append((event, 0.0))
+    if not picked:
+        return None
+    
+    recommendations = []
+    for event, score in picked:
+        score = round(score, 3)
+        recommendations.append({
+            'eventId': event.get('eventId'),
+            'similarityScore': score,
+            'reason': "Trending now" if score > 0 else "Popular event"
+        })
+    return recommendations
+
+def _use_ann(retrieval, n_events):
+    """Whether a request should add ANN candidates: 'ann', 'exact' or 'auto' by catalogue size"""
+    if ann_retriever is None or retrieval == 'exact':
+        return False
+    return retrieval == 'ann' or n_events >= ANN_MIN_EVENTS
+
+def _result_key(data, user_id, model):
+    """
+    Result cache key for a catalogue request: user, catalogue, vocabulary and
+    model versions plus a hash of the whole request, so any profile or
+    parameter change misses. Inline availableEvents requests are not cached.
+    """
+    if user_id is None or data.get('availableEvents') is not None:
+        return None
+    return (
+        str(user_id),
+        catalogue.version,
+        event_store.vocabulary_version,
+        model.version if model is not None else None,
+        content_hash(json.dumps(data, sort_keys=True, default=str))
+    )
+
+@app.route('/model/reload', methods=['POST'])
+def reload_model():
+    try:
+        data = request.get_json(silent=True) or {}
+        version = data.get('version')
+        force = bool(data.get('force', False))
+        if version is not None and not is_version_name(version):
+            return jsonify({'error': 'version must be the name of a directory under model/versions'}), 400
+        
+        if not data.get('wait', True):
+            # Load in the background; poll /health for the outcome
+            models.reload_async(version, force)
+            return jsonify({'message': 'Model reload started'}), 202
+        
+        result = models.reload(version, force)
+        return jsonify({
+            **result,
+            'message': 'Model reloaded successfully' if result['changed'] else 'Model already up to date'
+        })
+            
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': f'Model validation failed: {str(e)}'}), 422
+    except Exception as e:
+        return jsonify({
+            'error': f'Error reloading model: {str(e)}'
+        }), 500
+
+@app.route('/feedback', methods=['POST'])
+def record_feedback():
+    try:
+        data = request.json
+        if isinstance(data, dict) and 'userId' in data:
+            items = [data]
+        else:
+            items = _events_payload(data)
+        
+        result = feedback.record(items)
+        if result['accepted']:
+            # Hybrid results for these users change before the next compaction
+            users = {str(item.get('userId')) for item in items}
+            result_cache.invalidate(lambda key: key[0] in users)
+        
+        status = 400 if result['rejected'] and not result['accepted'] else 200
+        return jsonify({**result, 'message': 'Feedback recorded' if result['accepted'] else 'No valid feedback'}), status
+            
+    except Exception as e:
+        return jsonify({
+            'error': f'Error recording feedback: {str(e)}'
+        }), 500
+
+@app.route('/feedback/compact', methods=['POST'])
+def compact_feedback():
+    try:
+        result = feedback.compact()
+        if result is None:
+            return jsonify({'message': 'No feedback to compact', **feedback.stats()})
+        return jsonify({**result, 'message': 'Feedback folded into the model'})
+            
+    except Exception as e:
+        return jsonify({
+            'error': f'Error compacting feedback: {str(e)}'
+        }), 500
+
+@app.route('/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    try:
+        data = request.json or {}
+        user_id = data.get('userId')
+        
+        if user_id is None:
+            user_vectors = event_store.query_cache.invalidate()
+            results = result_cache.invalidate()
+        else:
+            user_id = str(user_id)
+            user_vectors = event_store.invalidate_user(user_id)
+            results = result_cache.invalidate(lambda key: key[0] == user_id)
+        
+        return jsonify({
+            'userVectors': user_vectors,
+            'results': results,
+            'message': 'Cache invalidated successfully'
+        })
+            
+    except Exception as e:
+        return jsonify({
+            'error': f'Error invalidating cache: {str(e)}'
+        }), 500
+
+def _catalogue_response(payload, status=200):
+    response = jsonify({**payload, 'version': catalogue.version, 'etag': catalogue.etag})
+    response.headers['ETag'] = catalogue.etag
+    return response, status
+
+def _update_catalogue(upsert, remove=(), sync=False):
+    try:
+        if sync:
+            result = catalogue.sync(upsert, if_match=request.headers.get('If-Match'))
+        else:
+            result = catalogue.update(upsert, remove, if_match=request.headers.get('If-Match'))
+        if event_embeddings is not None and EMBEDDING_WARM and (result['upserted'] or result['removed']):
+            event_embeddings.warm()
+        return _catalogue_response({**result, 'message': 'Catalogue updated successfully'})
+    except VersionConflict as e:
+        return _catalogue_response({'error': str(e)}, 412)
+    except ValueError as e:
+        return _catalogue_response({'error': str(e)}, 400)
+    except Exception as e:
+        return jsonify({
+            'error': f'Error updating catalogue: {str(e)}'
+        }), 500
+
+def _events_payload(data):
+    """Accept either a bare list of events or {'events': [...]}"""
+    return data if isinstance(data, list) else (data or {}).get('events', [])
+
+@app.route('/events', methods=['GET'])
+def get_catalogue():
+    if request.if_none_match.contains(catalogue.etag.strip('"')):
+        response = app.response_class(status=304)
+        response.headers['ETag'] = catalogue.etag
+        return response
+    _, events = catalogue.select()
+    return _catalogue_response({
+        'count': len(events),
+        'eventIds': [e['eventId'] for e in events]
+    })
+
+@app.route('/events', methods=['PUT'])
+def put_events():
+    return _update_catalogue(_events_payload(request.json))
+
+@app.route('/events/<event_id>', methods=['DELETE'])
+def delete_event(event_id):
+    if event_id not in catalogue:
+        return _catalogue_response({'error': f'Event {event_id} not found'}, 404)
+    return _update_catalogue([], [event_id])
+
+@app.route('/events/sync', methods=['POST'])
+def sync_events():
+    return _update_catalogue(_events_payload(request.json), sync=True)
+
+@app.route('/events/ingest', methods=['POST'])
+def ingest_events():
+    data = request.json or {}
+    return _update_catalogue(data.get('upsert', []), [str(e) for e in data.get('remove', [])])
+
+def _profile_sets(user_profile):
+    """Normalized interest and attended-organizer sets, built once per user for reason generation"""
+    return (
+        {normalize(i) for i in user_profile.get('interests', [])},
+        {normalize(e.get('organizer')) for e in user_profile.get('attendedEvents', [])} - {''}
+    )
+
+def _get_recommendation_reason(event, user_profile, similarity_score, signals=None, profile_sets=None, trending_score=None):
     reasons = []
     
-    user_interests = user_profile.get('interests', [])
-    attended_events = user_profile.get('attendedEvents', [])
+    user_interest_tags, attended_organizers = profile_sets or _profile_sets(user_profile)
     
     # Check for interest matches
-    event_tags = set(event.get('tags', []))
-    user_interest_tags = set(user_interests)
-    common_tags = event_tags.intersection(user_interest_tags)
+    common_tags = [tag for tag in dict.fromkeys(event.get('tags', [])) if normalize(tag) in user_interest_tags]
     
     if common_tags:
         reasons.append(f"Matches your interests: {', '.join(common_tags)}")
     
-    if event.get('type') in user_interests:
+    if normalize(event.get('type')) in user_interest_tags:
         reasons.append(f"Matches your preferred event type: {event.get('type')}")
     
     # Check for organizer preference
-    if event.get('organizer') in [e.get('organizer') for e in attended_events]:
+    if normalize(event.get('organizer')) in attended_organizers:
         reasons.append(f"From organizer you've attended before: {event.get('organizer')}")
     
+    # Collaborative signals (hybrid mode only)
+    if signals:
+        if signals['user'] > 0:
+            reasons.append("Popular with users similar to you")
+        if signals['item'] > 0.5:
+            reasons.append("Similar to events you've attended")
+        if signals['coattendance'] > 0:
+            reasons.append("Often attended together with your events")
+    
+    # Blended trending score (sparse profiles only)
+    if trending_score is not None and trending_score > 0.5:
+        reasons.append("Trending now")
+    
     if similarity_score > 0.5:
         reasons.append("High similarity to your profile")
     elif similarity_score > 0.2:
@@ -140,12 +770,30 @@ def _get_recommendation_reason(event, user_profile, similarity_score):
 
 @app.route('/health', methods=['GET'])
 def health_check():
+    model = models.current
+    model_stats = models.stats()
     return jsonify({
         'status': 'healthy',
         'service': 'ML Recommendation API',
-        'model_loaded': similarity_matrix is not None
+        'model_loaded': model is not None,
+        'model_version': model_stats['version'],
+        'model_load_seconds': model_stats['load_seconds'],
+        'model': model.summary() if model is not None else None,
+        'model_reload': model_stats,
+        'event_store': event_store.stats(),
+        'catalogue': catalogue.stats(),
+        'result_cache': result_cache.stats(),
+        'feedback': feedback.stats(),
+        'trending': trending.stats(),
+        'ann': ann_retriever.stats() if ann_retriever is not None else None,
+        'embeddings': event_embeddings.stats() if event_embeddings is not None else None,
+        'serving': app.extensions['serving'].stats() if 'serving' in app.extensions else None
     })
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
 @app.route('/', methods=['GET'])
 def root():
     return jsonify({
@@ -159,5 +807,17 @@ if __name__ == '__main__':
     print(f"Starting ML Recommendation API server on port {port}...")
     print("Available endpoints:")
     print("- POST /recommend: Generate event recommendations")
+    print("- POST /recommend/batch: Recommendations for many users in one call")
+    print("- POST /recommend/collaborative: Recommendations from similar users")
+    print("- GET /events: Catalogue version (ETag) and event IDs")
+    print("- PUT /events: Add or update catalogue events")
+    print("- DELETE /events/<event_id>: Remove a catalogue event")
+    print("- POST /events/sync: Replace the whole catalogue")
+    print("- POST /events/ingest: Add and remove catalogue events in one version")
+    print("- POST /model/reload: Load, validate and swap in the current (or a named) model version")
+    print("- POST /feedback: Record registrations, attendance and clicks")
+    print("- POST /feedback/compact: Fold pending feedback into a new model version now")
+    print("- POST /cache/invalidate: Drop cached vectors and results for a user (or everyone)")
     print("- GET /health: Health check")
+    print("- GET /metrics: Prometheus metrics (request, stage, cache and queue)")
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,232 @@
+"""
+Rebuild the model bundle from dataset/events.json and dataset/users.json
+
+    python train.py --events dataset/events.json --users dataset/users.json --model-dir model
+
+Reproduces Scripts/events.ipynb and Scripts/users.ipynb without holding
+any N x N matrix: the JSON arrays are streamed in chunks, bag-of-words
+vectors are kept sparse, and top-K neighbours are computed block by block.
+The result is written as a new version under model/versions/ and CURRENT
+is switched atomically, which running servers pick up without a restart.
+"""
+import argparse
+import json
+import logging
+import string
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+from artifacts import ModelArtifacts
+from collaborative import BLOCK_SIZE, TOP_K, CollaborativeEngine, InteractionIndex, NeighbourIndex, top_k_from_vectors
+from model_format import new_version, write_bundle
+
+logger = logging.getLogger("recommendation.train")
+
+MAX_FEATURES = 5000
+CHUNK_SIZE = 5000
+READ_BUFFER = 1 << 20
+
+_PUNCTUATION = str.maketrans('', '', string.punctuation)
+
+
+def iter_json_array(path: str, buffer_size: int = READ_BUFFER) -> Iterator[Dict]:
+    """Yield the objects of a top-level JSON array without loading the whole file"""
+    decoder = json.JSONDecoder()
+    with open(path) as f:
+        buffer, started = '', False
+        while True:
+            chunk = f.read(buffer_size)
+            buffer += chunk
+            pos = 0
+            if not started:
+                pos = len(buffer) - len(buffer.lstrip())
+                if pos == len(buffer):
+                    if not chunk:
+                        raise ValueError(f"{path} is empty")
+                    continue
+                if buffer[pos] != '[':
+                    raise ValueError(f"{path} does not contain a JSON array")
+                pos, started = pos + 1, True
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buffer) and buffer[pos] == ']':
+                    return
+                try:
+                    item, pos = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    break
+                yield item
+            buffer = buffer[pos:]
+            if not chunk:
+                raise ValueError(f"{path} ended before the closing ]")
+
+
+def iter_chunks(items: Iterator, size: int) -> Iterator[List]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def event_key(event: Dict) -> str:
+    """Bag-of-words text for an event, as built in Scripts/events.ipynb"""
+    words = [event.get('title', ''), event.get('location', ''), event.get('organizationName', ''),
+             event.get('type', '')] + list(event.get('tags', [])) + [event.get('description', '')]
+    return ' '.join(str(w) for w in words).lower().translate(_PUNCTUATION)
+
+
+def user_key(user: Dict) -> str:
+    """Bag-of-words text for a user, as built in Scripts/users.ipynb"""
+    labels = list(user.get('interests', [])) + list(user.get('skills', []))
+    return ' '.join(labels + [user.get('location', '')] + labels)
+
+
+def user_labels(user: Dict) -> List[str]:
+    """users.json has no attendance history; users.ipynb stands in interests and skills for it"""
+    return list(user.get('interests', [])) + list(user.get('skills', []))
+
+
+class Timings:
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        yield
+        self.stages[name] = round(time.perf_counter() - started, 3)
+        logger.info(f"{name}: {self.stages[name]:.3f}s")
+
+
+def build_vocabulary(path: str, key: Callable[[Dict], str], id_field: str, max_features: int,
+                     chunk_size: int) -> Tuple[List[str], Dict[str, int]]:
+    """First pass: ids in file order and the max_features most frequent terms (CountVectorizer's rule)"""
+    analyzer = CountVectorizer(stop_words='english').build_analyzer()
+    ids, counts = [], Counter()
+    for chunk in iter_chunks(iter_json_array(path), chunk_size):
+        ids.extend(str(item[id_field]) for item in chunk)
+        for item in chunk:
+            counts.update(analyzer(key(item)))
+    terms = sorted(counts, key=lambda term: (-counts[term], term))[:max_features]
+    return ids, {term: i for i, term in enumerate(sorted(terms))}
+
+
+def vectorize(path: str, key: Callable[[Dict], str], vocabulary: Dict[str, int], chunk_size: int) -> sp.csr_matrix:
+    """Second pass: sparse term counts, one chunk at a time"""
+    vectorizer = CountVectorizer(stop_words='english', vocabulary=vocabulary)
+    blocks = [vectorizer.transform([key(item) for item in chunk])
+              for chunk in iter_chunks(iter_json_array(path), chunk_size)]
+    if not blocks:
+        return sp.csr_matrix((0, len(vocabulary)), dtype='float32')
+    return sp.vstack(blocks, format='csr').astype('float32')
+
+
+def load_interactions(path: Optional[str], users_path: str, chunk_size: int) -> Dict[str, List[str]]:
+    """User -> attended event ids from [{"user_id", "events"}], or the users.ipynb stand-in"""
+    if path is not None:
+        return {str(row['user_id']): [str(e) for e in row.get('events', [])] for row in iter_json_array(path)}
+    mapping = {}
+    for chunk in iter_chunks(iter_json_array(users_path), chunk_size):
+        mapping.update({str(user['user_id']): user_labels(user) for user in chunk})
+    return mapping
+
+
+def train(events_path: str, users_path: str, interactions_path: Optional[str] = None,
+          k: int = TOP_K, max_features: int = MAX_FEATURES, chunk_size: int = CHUNK_SIZE,
+          block_size: int = BLOCK_SIZE, timings: Optional[Timings] = None) -> ModelArtifacts:
+    timings = timings or Timings()
+
+    with timings.stage('events_vocabulary'):
+        event_ids, event_vocabulary = build_vocabulary(events_path, event_key, 'event_id', max_features, chunk_size)
+    with timings.stage('events_vectors'):
+        events_vector = vectorize(events_path, event_key, event_vocabulary, chunk_size)
+    with timings.stage('events_top_k'):
+        ids, scores = top_k_from_vectors(events_vector, k, block_size)
+        events = NeighbourIndex(event_ids, ids, scores)
+
+    with timings.stage('users_vocabulary'):
+        user_ids, user_vocabulary = build_vocabulary(users_path, user_key, 'user_id', max_features, chunk_size)
+    with timings.stage('users_vectors'):
+        users_vector = vectorize(users_path, user_key, user_vocabulary, chunk_size)
+    with timings.stage('users_top_k'):
+        ids, scores = top_k_from_vectors(users_vector, k, block_size)
+        users = NeighbourIndex(user_ids, ids, scores)
+
+    with timings.stage('interactions'):
+        interactions = InteractionIndex.from_mapping(
+            user_ids, load_interactions(interactions_path, users_path, chunk_size)
+        )
+
+    with timings.stage('cooccurrence'):
+        cooccurrence = interactions.cooccurrence() if len(interactions) else None
+
+    return ModelArtifacts(
+        events=events,
+        interactions=interactions if len(interactions) else None,
+        collaborative=CollaborativeEngine(users, interactions),
+        users_vector=normalize(users_vector).astype('float32'),
+        cooccurrence=cooccurrence,
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', default='dataset/events.json', help='JSON array of events')
+    parser.add_argument('--users', default='dataset/users.json', help='JSON array of users')
+    parser.add_argument('--interactions', default=None,
+                        help='JSON array of {"user_id", "events"} (default: interests and skills from --users)')
+    parser.add_argument('--model-dir', default='model', help='Where to write the bundle (default: model)')
+    parser.add_argument('--top-k', type=int, default=TOP_K, help=f'Neighbours kept per row (default: {TOP_K})')
+    parser.add_argument('--max-features', type=int, default=MAX_FEATURES)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Records vectorized at once')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help='Rows per similarity block')
+    parser.add_argument('--version', default=None, help='Version name (default: UTC timestamp)')
+    parser.add_argument('--no-activate', action='store_true', help='Write the bundle without updating CURRENT')
+    args = parser.parse_args(argv)
+
+    timings = Timings()
+    started = time.perf_counter()
+    artifacts = train(args.events, args.users, args.interactions, args.top_k, args.max_features,
+                      args.chunk_size, args.block_size, timings)
+
+    # The manifest is written by write_bundle itself, so it records the
+    # training stages only; the summary below adds write_bundle
+    training_timings = dict(timings.stages)
+    with timings.stage('write_bundle'):
+        arrays, ids = artifacts.to_bundle()
+        path = write_bundle(
+            args.model_dir,
+            args.version or new_version(),
+            arrays,
+            ids,
+            meta={'source': 'train', 'top_k': args.top_k, 'timings': training_timings},
+            activate=not args.no_activate,
+        )
+
+    summary = {
+        'bundle': path,
+        'events': len(artifacts.events.keys),
+        'users': len(artifacts.collaborative.users.keys),
+        'interactions': len(artifacts.interactions) if artifacts.interactions is not None else 0,
+        'seconds': round(time.perf_counter() - started, 3),
+        'stages': timings.stages,
+    }
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(main())
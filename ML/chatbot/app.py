@@ -4,15 +4,22 @@ import faiss
 import numpy as np
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 import socketio
 import logging
 import os
+from contextlib import asynccontextmanager
 
 # Import custom services
 from event_service import EventService
 from intent_classifier import IntentClassifier
 from gemini_service import get_gemini_service, GeminiService
+from executors import EMBED_WORKERS, IO_WORKERS, MAX_PENDING, BoundedPool, PoolFull
+from embedding_batcher import BATCH_SIZE_BUCKETS, MAX_BATCH, MAX_WAIT_MS, QUEUE_WAIT_BUCKETS, EmbeddingBatcher
+from metrics import CONTENT_TYPE, Registry
+from cache import LRUCache, normalize_question
+from refresher import INTERVAL, JITTER, MAX_BACKOFF, FULL_SYNC_EVERY, EventRefresher
 
 # --- Logging setup ---
 logging.basicConfig(level=logging.INFO)
@@ -29,7 +36,8 @@ try:
     # Initialize event service and intent classifier
     backend_url = os.getenv('BACKEND_URL') or 'https://imkrish-campverse-backend.hf.space'
     # If BACKEND_URL is not set, fallback to the HF Backend Space
-    event_service = EventService(backend_url, model)
+    # Set when the backend can filter events by update time, e.g. updatedSince
+    event_service = EventService(backend_url, model, os.getenv('CHATBOT_EVENTS_SINCE_PARAM') or None)
     intent_classifier = IntentClassifier()
     
     # Initialize Gemini service for enhanced NLP
@@ -39,16 +47,159 @@ try:
     else:
         logger.warning("⚠️ Gemini AI not available, using fallback intent classifier")
     
-    # Fetch events on startup
-    event_service.fetch_events()
-    
     logger.info("Resources loaded successfully.")
 except Exception as e:
     logger.error(f"Error loading resources: {e}")
     raise
 
+# --- Executor pools ---
+# Handlers are async, so encoding, FAISS search, backend requests and Gemini
+# calls run on these threads instead of blocking the event loop
+embedding_pool = BoundedPool(
+    'embedding',
+    int(os.getenv('CHATBOT_EMBED_WORKERS', EMBED_WORKERS)),
+    int(os.getenv('CHATBOT_EMBED_MAX_PENDING', MAX_PENDING))
+)
+io_pool = BoundedPool(
+    'io',
+    int(os.getenv('CHATBOT_IO_WORKERS', IO_WORKERS)),
+    int(os.getenv('CHATBOT_IO_MAX_PENDING', MAX_PENDING))
+)
+
+# --- Metrics ---
+metrics = Registry()
+BATCH_SIZES = metrics.histogram('chatbot_embedding_batch_size', 'Distinct texts per encode call', BATCH_SIZE_BUCKETS)
+QUEUE_WAITS = metrics.histogram('chatbot_embedding_queue_wait_seconds',
+                                'Time a question waited to join an encode batch', QUEUE_WAIT_BUCKETS)
+
+@metrics.collector
+def _pool_metrics():
+    stats = {pool.name: pool.stats() for pool in (embedding_pool, io_pool)}
+    return [
+        (f'chatbot_pool_{name}', kind, documentation,
+         [({'pool': pool}, s[key]) for pool, s in stats.items()])
+        for name, kind, key, documentation in (
+            ('running', 'gauge', 'running', 'Calls running on the pool'),
+            ('waiting', 'gauge', 'waiting', 'Calls waiting for a pool thread'),
+            ('completed_total', 'counter', 'completed', 'Calls finished by the pool'),
+            ('rejected_total', 'counter', 'rejected', 'Calls refused because the pool queue was full'),
+        )
+    ]
+
+# Concurrent questions share one encode call: up to CHATBOT_BATCH_MAX_SIZE
+# texts, each waiting at most CHATBOT_BATCH_MAX_WAIT_MS for others to join
+batcher = EmbeddingBatcher(
+    model,
+    embedding_pool,
+    int(os.getenv('CHATBOT_BATCH_MAX_SIZE', MAX_BATCH)),
+    float(os.getenv('CHATBOT_BATCH_MAX_WAIT_MS', MAX_WAIT_MS)),
+    BATCH_SIZES,
+    QUEUE_WAITS
+)
+
+# --- Event refresher ---
+# Syncs the event catalogue in the background (the first sync at startup),
+# so requests only ever search the catalogue they find
+refresher = EventRefresher(
+    event_service,
+    io_pool,
+    float(os.getenv('CHATBOT_EVENTS_REFRESH_INTERVAL', INTERVAL)),
+    float(os.getenv('CHATBOT_EVENTS_REFRESH_JITTER', JITTER)),
+    float(os.getenv('CHATBOT_EVENTS_REFRESH_MAX_BACKOFF', MAX_BACKOFF)),
+    int(os.getenv('CHATBOT_EVENTS_FULL_SYNC_EVERY', FULL_SYNC_EVERY))
+)
+
+@metrics.collector
+def _event_metrics():
+    stats, refresh = event_service.stats(), refresher.stats()
+    families = [
+        ('chatbot_events', 'gauge', 'Events in the catalogue', [({}, stats['events'])]),
+        ('chatbot_events_refreshes_total', 'counter', 'Successful event catalogue syncs', [({}, refresh['syncs'])]),
+        ('chatbot_events_refresh_failures_total', 'counter', 'Failed event catalogue syncs', [({}, refresh['failures'])]),
+    ]
+    if stats['age_seconds'] is not None:
+        families.append(('chatbot_events_catalogue_age_seconds', 'gauge', 'Seconds since the last successful sync',
+                         [({}, stats['age_seconds'])]))
+    return families
+
+# --- Caches ---
+# Keyed by the normalized question, so repeated questions skip the
+# transformer. Embeddings do not depend on the catalogue; event-search
+# answers are keyed by the event catalogue version as well and dropped
+# when it changes.
+embedding_cache = LRUCache(
+    int(os.getenv('CHATBOT_EMBEDDING_CACHE_SIZE', 10000)),
+    float(os.getenv('CHATBOT_EMBEDDING_CACHE_TTL', 86400))
+)
+answer_cache = LRUCache(
+    int(os.getenv('CHATBOT_ANSWER_CACHE_SIZE', 5000)),
+    float(os.getenv('CHATBOT_ANSWER_CACHE_TTL', 600))
+)
+_answers_version = event_service.version
+
+@metrics.collector
+def _cache_metrics():
+    stats = {'embedding': embedding_cache.stats(), 'answer': answer_cache.stats()}
+    return [
+        ('chatbot_cache_hits_total', 'counter', 'Cache lookups answered from the cache',
+         [({'cache': name}, s['hits']) for name, s in stats.items()]),
+        ('chatbot_cache_misses_total', 'counter', 'Cache lookups that missed or found an expired entry',
+         [({'cache': name}, s['misses']) for name, s in stats.items()]),
+        ('chatbot_cache_hit_ratio', 'gauge', 'Hits over lookups since start',
+         [({'cache': name}, s['hit_rate']) for name, s in stats.items()]),
+        ('chatbot_cache_entries', 'gauge', 'Entries currently cached',
+         [({'cache': name}, s['size']) for name, s in stats.items()]),
+    ]
+
+async def embed_question(text: str) -> np.ndarray:
+    """Embedding of a question, from the cache or the batcher"""
+    key = normalize_question(text)
+    cached = embedding_cache.get(key)
+    if cached is None:
+        cached = await batcher.encode(key)
+        embedding_cache.put(key, cached)
+    return cached
+
+def faq_lookup(question_embedding: np.ndarray):
+    """Closest FAQ entry to an embedded question: (matched question, answer)"""
+    distances, indices = index.search(question_embedding.reshape(1, -1), k=1)
+    best_match_index = indices[0][0]
+    return df.iloc[best_match_index]['question'], df.iloc[best_match_index]['answer']
+
+async def faq_match(question: str):
+    key = ('faq', normalize_question(question))
+    cached = answer_cache.get(key)
+    if cached is None:
+        cached = await embedding_pool.run(faq_lookup, await embed_question(question))
+        answer_cache.put(key, cached)
+    return cached
+
+async def search_events(query: str, top_k: int = 5):
+    """Search the current event catalogue on the embedding pool; the refresher keeps it up to date"""
+    global _answers_version
+    version = event_service.version
+    if version != _answers_version:
+        # Answers from the previous catalogue can never be hit again
+        answer_cache.invalidate(lambda key: key[0] == 'events')
+        _answers_version = version
+    key = ('events', normalize_question(query), top_k, version)
+    cached = answer_cache.get(key)
+    if cached is None:
+        query_embedding = await embed_question(query)
+        cached = await embedding_pool.run(event_service.search_events, query, top_k, query_embedding)
+        # An empty result may just mean the first sync has not finished
+        if cached:
+            answer_cache.put(key, cached)
+    return cached
+
 # --- FastAPI REST API ---
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    refresher.start()
+    yield
+    await refresher.stop()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -64,13 +215,25 @@ async def root():
         "status": "healthy",
         "endpoints": {
             "POST /chatbot": "Chat with the AI",
-            "GET /health": "Health check"
+            "GET /health": "Health check",
+            "GET /metrics": "Prometheus metrics"
         }
     }
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "executors": {pool.name: pool.stats() for pool in (embedding_pool, io_pool)},
+        "batching": batcher.stats(),
+        "caches": {"embedding": embedding_cache.stats(), "answer": answer_cache.stats()},
+        "events": event_service.stats(),
+        "refresher": refresher.stats()
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
 
 class QuestionRequest(BaseModel):
     question: str
@@ -87,7 +250,7 @@ async def chatbot(req: QuestionRequest, request: Request):
     try:
         # Try Gemini for enhanced understanding first
         if gemini_service.is_available():
-            intent, confidence, entities = gemini_service.classify_intent(question)
+            intent, confidence, entities = await io_pool.run(gemini_service.classify_intent, question)
             logger.info(f"Gemini Intent: {intent} (confidence: {confidence}), entities: {entities}")
             
             # Quick responses for simple intents
@@ -103,12 +266,12 @@ async def chatbot(req: QuestionRequest, request: Request):
             # Event search with enhanced understanding
             if intent in ['event_search', 'event_details']:
                 # Enhance search query using extracted entities
-                search_query = gemini_service.enhance_search_query(question, entities)
-                events = event_service.search_events(search_query, top_k=5)
+                search_query = await io_pool.run(gemini_service.enhance_search_query, question, entities)
+                events = await search_events(search_query, top_k=5)
                 
                 # Generate natural response using Gemini
-                response = gemini_service.generate_response(
-                    question, intent, entities, events
+                response = await io_pool.run(
+                    gemini_service.generate_response, question, intent, entities, events
                 )
                 if not response:
                     response = event_service.format_event_response(events)
@@ -122,7 +285,7 @@ async def chatbot(req: QuestionRequest, request: Request):
                 }
             
             # For other intents, generate contextual response
-            response = gemini_service.generate_response(question, intent, entities)
+            response = await io_pool.run(gemini_service.generate_response, question, intent, entities)
             if response:
                 return {
                     "question": question,
@@ -147,7 +310,7 @@ async def chatbot(req: QuestionRequest, request: Request):
         
         # Handle event search
         if intent == 'event_search':
-            events = event_service.search_events(question, top_k=5)
+            events = await search_events(question, top_k=5)
             response = event_service.format_event_response(events)
             return {
                 "question": question,
@@ -158,12 +321,7 @@ async def chatbot(req: QuestionRequest, request: Request):
             }
         
         # Default: FAQ search
-        user_question_embedding = model.encode(question, convert_to_tensor=True)
-        user_question_embedding_np = user_question_embedding.cpu().numpy().reshape(1, -1)
-        distances, indices = index.search(user_question_embedding_np, k=1)
-        best_match_index = indices[0][0]
-        retrieved_answer = df.iloc[best_match_index]['answer']
-        retrieved_question = df.iloc[best_match_index]['question']
+        retrieved_question, retrieved_answer = await faq_match(question)
         logger.info(f"FAQ match: {question} -> {retrieved_question}")
         return {
             "question": retrieved_question,
@@ -171,6 +329,9 @@ async def chatbot(req: QuestionRequest, request: Request):
             "intent": intent,
             "ai_enhanced": False
         }
+    except PoolFull as e:
+        logger.warning(f"Rejected question, {e}")
+        return JSONResponse(status_code=503, content={"error": "Server is busy, please try again."})
     except Exception as e:
         logger.error(f"Error processing question: {e}")
         return {"error": "Internal server error."}
@@ -215,7 +376,7 @@ async def user_question(sid, data):
         
         # Handle event search
         if intent == 'event_search':
-            events = event_service.search_events(question, top_k=5)
+            events = await search_events(question, top_k=5)
             response = event_service.format_event_response(events)
             await sio.emit('bot_answer', {
                 'question': question,
@@ -226,18 +387,16 @@ async def user_question(sid, data):
             return
         
         # Default: FAQ search
-        user_question_embedding = model.encode(question, convert_to_tensor=True)
-        user_question_embedding_np = user_question_embedding.cpu().numpy().reshape(1, -1)
-        distances, indices = index.search(user_question_embedding_np, k=1)
-        best_match_index = indices[0][0]
-        retrieved_answer = df.iloc[best_match_index]['answer']
-        retrieved_question = df.iloc[best_match_index]['question']
+        retrieved_question, retrieved_answer = await faq_match(question)
         await sio.emit('bot_answer', {
             'question': retrieved_question,
             'answer': retrieved_answer,
             'intent': intent
         }, to=sid)
         logger.info(f"SocketIO answered: {question} -> {retrieved_question}")
+    except PoolFull as e:
+        await sio.emit('bot_answer', {'error': 'Server is busy, please try again.'}, to=sid)
+        logger.warning(f"Rejected question from {sid}, {e}")
     except Exception as e:
         await sio.emit('bot_answer', {'error': 'Internal server error.'}, to=sid)
         logger.error(f"SocketIO error for {sid}: {e}")
@@ -0,0 +1,246 @@
+"""
+Concurrency check for the chatbot: N clients ask at the same moment while a
+prober times the event loop's responsiveness
+
+    PYTHONPATH=. python benchmarks/concurrency.py --clients 50 --mode pools
+
+    uvicorn app:app_socket --port 8000
+    python benchmarks/concurrency.py --clients 50 --mode rest
+    python benchmarks/concurrency.py --clients 50 --mode socketio
+
+'pools' is self-contained: it runs the /chatbot flow (intent, query rewrite,
+embedding search, answer) in-process on the app's BoundedPool executors,
+with sleeps standing in for Gemini calls and encoding, and needs neither a
+server, a model nor network access. --inline runs the same work on the
+event loop instead, to show what a regression looks like. 'rest' and
+'socketio' are a manual benchmark of a running server, with real Gemini and
+backend calls.
+
+If the handlers block the event loop, the answers come back one after
+another: the wall time approaches the sum of the request latencies (overlap
+near 1) and /health (or, in 'pools' mode, a timer on the loop) stalls behind
+them. With the work on executor pools the requests overlap and the loop
+stays responsive. Exits 1 when the overlap is below --min-overlap or, in
+'pools' mode, the loop stalled longer than --max-stall-ms.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from typing import Dict, List
+
+try:
+    import requests
+    import socketio
+except ImportError:  # only the server modes need them
+    requests = socketio = None
+
+QUESTIONS = [
+    "How do I register for an event?",
+    "Show me upcoming hackathons",
+    "How do I reset my password?",
+    "Any AI workshops this week?",
+    "How can I host an event?",
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return float('nan')
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def ask_rest(url: str, question: str, timeout: float) -> Dict:
+    response = requests.post(f"{url}/chatbot", json={'question': question}, timeout=timeout)
+    return {'status': response.status_code, 'error': response.json().get('error')}
+
+
+def ask_socketio(url: str, question: str, timeout: float) -> Dict:
+    client = socketio.Client()
+    answered = threading.Event()
+    result = {}
+
+    @client.on('bot_answer')
+    def on_answer(data):
+        result.update(status=200, error=data.get('error'))
+        answered.set()
+
+    client.connect(url, wait_timeout=timeout)
+    try:
+        client.emit('user_question', {'question': question})
+        if not answered.wait(timeout):
+            return {'status': 0, 'error': 'timed out'}
+        return result
+    finally:
+        client.disconnect()
+
+
+def run(url: str, clients: int, mode: str, questions: List[str], timeout: float,
+        probe_interval: float) -> Dict:
+    ask = ask_rest if mode == 'rest' else ask_socketio
+    barrier = threading.Barrier(clients + 1)
+    latencies: List[float] = [0.0] * clients
+    results: List[Dict] = [{}] * clients
+
+    def client(i: int) -> None:
+        barrier.wait()
+        started = time.perf_counter()
+        try:
+            results[i] = ask(url, questions[i % len(questions)], timeout)
+        except Exception as e:
+            results[i] = {'status': 0, 'error': str(e)}
+        latencies[i] = time.perf_counter() - started
+
+    health: List[float] = []
+    done = threading.Event()
+
+    def probe() -> None:
+        while not done.is_set():
+            started = time.perf_counter()
+            try:
+                requests.get(f"{url}/health", timeout=timeout)
+                health.append(time.perf_counter() - started)
+            except requests.RequestException:
+                health.append(timeout)
+            time.sleep(probe_interval)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    prober = threading.Thread(target=probe, daemon=True)
+    prober.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    done.set()
+    prober.join()
+
+    failed = [r for r in results if r.get('status') != 200 or r.get('error')]
+    return {
+        'mode': mode,
+        'clients': clients,
+        'wall_seconds': round(wall, 3),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50) * 1000, 1),
+            'p95': round(percentile(latencies, 95) * 1000, 1),
+            'max': round(max(latencies) * 1000, 1),
+            'sum': round(sum(latencies) * 1000, 1),
+        },
+        # ~1 when requests were answered one at a time, up to `clients` when fully parallel
+        'overlap': round(sum(latencies) / wall, 2) if wall > 0 else None,
+        'health_ms': {
+            'probes': len(health),
+            'p50': round(percentile(health, 50) * 1000, 1),
+            'max': round(max(health) * 1000, 1) if health else None,
+        },
+        'failed': len(failed),
+        'errors': sorted({str(r.get('error')) for r in failed})[:5],
+    }
+
+
+def run_pools(clients: int, io_ms: float, embed_ms: float, probe_interval: float, inline: bool = False) -> Dict:
+    """The /chatbot flow on the app's executor pools, with sleeps for the blocking work"""
+    from executors import EMBED_WORKERS, IO_WORKERS, MAX_PENDING, BoundedPool
+
+    embedding_pool = BoundedPool('embedding', EMBED_WORKERS, MAX_PENDING)
+    io_pool = BoundedPool('io', IO_WORKERS, MAX_PENDING)
+
+    async def call(pool: BoundedPool, seconds: float) -> None:
+        if inline:
+            time.sleep(seconds)
+        else:
+            await pool.run(time.sleep, seconds)
+
+    async def ask() -> float:
+        started = time.perf_counter()
+        await call(io_pool, io_ms / 1000)        # classify_intent
+        await call(io_pool, io_ms / 1000)        # enhance_search_query
+        await call(embedding_pool, embed_ms / 1000)  # encode and search events
+        await call(io_pool, io_ms / 1000)        # generate_response
+        return time.perf_counter() - started
+
+    async def main() -> Dict:
+        stalls: List[float] = []
+        done = asyncio.Event()
+
+        async def probe() -> None:
+            # How late the loop wakes a sleeper: what /health would wait
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(probe_interval)
+                stalls.append(time.perf_counter() - started - probe_interval)
+
+        prober = asyncio.ensure_future(probe())
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(ask() for _ in range(clients)))
+        wall = time.perf_counter() - started
+        done.set()
+        await prober
+        return {
+            'mode': 'inline' if inline else 'pools',
+            'clients': clients,
+            'wall_seconds': round(wall, 3),
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50) * 1000, 1),
+                'p95': round(percentile(latencies, 95) * 1000, 1),
+                'max': round(max(latencies) * 1000, 1),
+                'sum': round(sum(latencies) * 1000, 1),
+            },
+            'overlap': round(sum(latencies) / wall, 2) if wall > 0 else None,
+            'stall_ms': {
+                'probes': len(stalls),
+                'p50': round(percentile(stalls, 50) * 1000, 1),
+                'max': round(max(stalls) * 1000, 1) if stalls else None,
+            },
+            'executors': {pool.name: pool.stats() for pool in (embedding_pool, io_pool)},
+            'failed': 0,
+        }
+
+    try:
+        return asyncio.run(main())
+    finally:
+        embedding_pool.shutdown()
+        io_pool.shutdown()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--mode', choices=('pools', 'rest', 'socketio'), default='rest')
+    parser.add_argument('--question', action='append', help='question to ask (repeatable); defaults to a mixed set')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--probe-interval', type=float, default=0.02, help='seconds between /health probes')
+    parser.add_argument('--min-overlap', type=float, default=2.0)
+    parser.add_argument('--io-ms', type=float, default=100.0, help='pools mode: duration of each Gemini call')
+    parser.add_argument('--embed-ms', type=float, default=10.0, help='pools mode: duration of each encode and search')
+    parser.add_argument('--max-stall-ms', type=float, default=50.0,
+                        help='pools mode: longest acceptable delay of the loop timer')
+    parser.add_argument('--inline', action='store_true', help='pools mode: run the work on the event loop')
+    args = parser.parse_args(argv)
+
+    if args.mode == 'pools':
+        report = run_pools(args.clients, args.io_ms, args.embed_ms, args.probe_interval, args.inline)
+    elif requests is None:
+        parser.error("the rest and socketio modes need requests and python-socketio[client]")
+    else:
+        report = run(args.url, args.clients, args.mode, args.question or QUESTIONS, args.timeout,
+                     args.probe_interval)
+    print(json.dumps(report, indent=2))
+    stall = report.get('stall_ms', {}).get('max')
+    if report['failed'] or report['overlap'] is None or report['overlap'] < args.min_overlap:
+        print(f"FAIL: overlap {report['overlap']} (minimum {args.min_overlap}), {report['failed']} failed requests")
+        sys.exit(1)
+    if stall is not None and stall > args.max_stall_ms:
+        print(f"FAIL: event loop stalled {stall} ms (maximum {args.max_stall_ms})")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Embedding Batcher
+Coalesces concurrent single-question encodes into one
+SentenceTransformer.encode call. A request waits at most max_wait for
+others to join, a batch holds at most max_batch texts, and the encode runs
+on the embedding pool so the event loop keeps collecting the next batch
+meanwhile.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from executors import BoundedPool
+from metrics import Histogram
+
+logger = logging.getLogger("chatbot.batcher")
+
+MAX_BATCH = 32
+MAX_WAIT_MS = 5.0
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+QUEUE_WAIT_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class EmbeddingBatcher:
+    def __init__(self, model, pool: BoundedPool, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS,
+                 batch_sizes: Optional[Histogram] = None, queue_waits: Optional[Histogram] = None):
+        self.model = model
+        self.pool = pool
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.batch_sizes = batch_sizes
+        self.queue_waits = queue_waits
+        # Created inside the running loop on first use
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Embedding of one text, computed together with whatever else is queued"""
+        loop = asyncio.get_running_loop()
+        if self._collector is None or self._collector.done() or self._collector.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._collector = loop.create_task(self._collect())
+        future = loop.create_future()
+        self._queue.put_nowait((text, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> None:
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = loop.create_task(self._run(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True,
+                                            show_progress_bar=False), dtype=np.float32)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future, float]]) -> None:
+        dispatched = time.perf_counter()
+        # Identical questions asked at the same moment are encoded once
+        unique: Dict[str, int] = {}
+        for text, _, enqueued in batch:
+            unique.setdefault(text, len(unique))
+            if self.queue_waits is not None:
+                self.queue_waits.observe(dispatched - enqueued)
+        if self.batch_sizes is not None:
+            self.batch_sizes.observe(len(unique))
+        with self._lock:
+            self.batches += 1
+            self.items += len(batch)
+
+        try:
+            vectors = await self.pool.run(self._encode, list(unique))
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future, _ in batch:
+            if not future.done():
+                future.set_result(vectors[unique[text]])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'max_batch': self.max_batch,
+                'max_wait_ms': self.max_wait * 1000,
+                'batches': self.batches,
+                'items': self.items,
+                'mean_batch': round(self.items / self.batches, 2) if self.batches else None,
+            }
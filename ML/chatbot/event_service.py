@@ -3,68 +3,206 @@ Event Discovery Service
 Fetches and searches events from the backend API
 """
 import requests
+import hashlib
+import json
 import logging
-from typing import List, Dict, Optional
+import threading
+import time
+from typing import List, Dict, Optional, Tuple
 from sentence_transformers import SentenceTransformer
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 
 logger = logging.getLogger("chatbot.events")
 
+
+def event_text(event: Dict) -> str:
+    """Text an event is embedded from: title, description and tags"""
+    return f"{event.get('title', '')} {event.get('description', '')} {' '.join(event.get('tags', []))}"
+
+
+def _digest(value) -> str:
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+
 class EventService:
-    def __init__(self, backend_url: str, model: SentenceTransformer):
+    def __init__(self, backend_url: str, model: SentenceTransformer, since_param: Optional[str] = None):
         self.backend_url = backend_url
         self.model = model
-        self.events_cache = []
-        self.events_embeddings = None
+        # Query parameter the backend filters on to return only events
+        # updated after a timestamp; None when it cannot
+        self.since_param = since_param
+        # (events, embeddings), row i embedding event i. Never modified in
+        # place: a sync builds the next pair and replaces it in one assignment
+        self._catalogue: Tuple[List[Dict], Optional[np.ndarray]] = ([], None)
+        # event id -> (row, document hash, embedded text hash), and the id of
+        # each row; only read and written by the sync holding _sync_lock
+        self._rows: Dict[str, Tuple[int, str, str]] = {}
+        self._keys: List[str] = []
+        self._sync_lock = threading.Lock()
+        # Highest updatedAt seen, the starting point of the next incremental fetch
+        self._updated_since: Optional[str] = None
+        # Bumped whenever a fetch changes the events; answer caches key on it
+        self.version = 0
+        self.fetched_at = None
+        self.encoded = 0
+        self.last_sync: Optional[Dict] = None
+    
+    @property
+    def events_cache(self) -> List[Dict]:
+        return self._catalogue[0]
+    
+    @property
+    def events_embeddings(self) -> Optional[np.ndarray]:
+        return self._catalogue[1]
         
-    def fetch_events(self) -> List[Dict]:
-        """Fetch all approved public events from backend"""
+    def fetch_events(self, incremental: bool = False) -> List[Dict]:
+        """Sync events from the backend, logging failures; returns the catalogue, [] on failure"""
         try:
-            response = requests.get(f"{self.backend_url}/api/events", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                self.events_cache = data.get("data", {}).get("events", [])
-                logger.info(f"Fetched {len(self.events_cache)} events from backend")
-                
-                # Pre-compute embeddings for all events
-                self._compute_event_embeddings()
-                return self.events_cache
-            else:
-                logger.error(f"Failed to fetch events: {response.status_code}")
-                return []
+            return self.sync(incremental)
         except Exception as e:
             logger.error(f"Error fetching events: {e}")
             return []
     
-    def _compute_event_embeddings(self):
-        """Compute embeddings for all events"""
-        if not self.events_cache:
-            return
-        
-        event_texts = []
-        for event in self.events_cache:
-            # Combine title, description, and tags for better matching
-            text = f"{event.get('title', '')} {event.get('description', '')} {' '.join(event.get('tags', []))}"
-            event_texts.append(text)
-        
-        self.events_embeddings = self.model.encode(event_texts, convert_to_tensor=False)
-        logger.info(f"Computed embeddings for {len(event_texts)} events")
+    def sync(self, incremental: bool = False) -> List[Dict]:
+        """
+        Sync approved public events from the backend, raising on failure. A
+        full fetch drops events the backend no longer returns; an incremental
+        one (only when since_param is set and a fetch has succeeded before)
+        asks for events updated since the last one and only adds or replaces.
+        Either way only new events and events whose text changed are encoded.
+        """
+        with self._sync_lock:
+            since = self._updated_since if incremental and self.since_param else None
+            params = {self.since_param: since} if since else None
+            response = requests.get(f"{self.backend_url}/api/events", params=params, timeout=5)
+            if response.status_code != 200:
+                raise RuntimeError(f"Failed to fetch events: {response.status_code}")
+            data = response.json()
+            events = data.get("data", {}).get("events", [])
+            logger.info(f"Fetched {len(events)} events from backend" + (f" updated since {since}" if since else ""))
+            
+            self._apply(events, full=since is None)
+            self.fetched_at = time.time()
+            return self.events_cache
     
-    def search_events(self, query: str, top_k: int = 5) -> List[Dict]:
-        """Search events using semantic similarity"""
-        if not self.events_cache or self.events_embeddings is None:
-            self.fetch_events()
+    def _apply(self, events: List[Dict], full: bool):
+        """Merge fetched events into a new catalogue, encoding only new or changed texts, and swap it in"""
+        started = time.perf_counter()
+        fetched: Dict[str, Tuple[Dict, str, str]] = {}
+        for event in events:
+            text = event_text(event)
+            doc_hash = _digest(event)
+            key = str(event.get('_id') or event.get('id') or doc_hash)
+            fetched[key] = (event, doc_hash, _digest(text))
+        
+        removed = [key for key in self._rows if key not in fetched] if full else []
+        changed = {key: entry for key, entry in fetched.items()
+                   if key not in self._rows or self._rows[key][1] != entry[1]}
+        to_encode = [key for key, entry in changed.items()
+                     if key not in self._rows or self._rows[key][2] != entry[2]]
+        added = sum(1 for key in changed if key not in self._rows)
+        stamps = [str(e['updatedAt']) for e, _, _ in fetched.values() if e.get('updatedAt')]
+        if stamps:
+            self._updated_since = max([self._updated_since or ''] + stamps)
         
-        if not self.events_cache:
+        if removed or changed:
+            # Searches keep reading the current catalogue while this one is
+            # encoded and assembled
+            vectors = None
+            if to_encode:
+                vectors = np.asarray(self.model.encode([event_text(changed[key][0]) for key in to_encode],
+                                                       convert_to_tensor=False), dtype=np.float32)
+                self.encoded += len(to_encode)
+            self._swap(removed, changed, {key: vectors[i] for i, key in enumerate(to_encode)})
+            self.version += 1
+        
+        self.last_sync = {
+            'full': full,
+            'fetched': len(events),
+            'added': added,
+            'changed': len(changed) - added,
+            'removed': len(removed),
+            'encoded': len(to_encode),
+            'seconds': round(time.perf_counter() - started, 3),
+            'at': time.time(),
+        }
+        logger.info(f"Synced events: {added} new, {len(changed) - added} changed, {len(removed)} removed, "
+                    f"{len(to_encode)} encoded, {len(self.events_cache)} total")
+    
+    def _swap(self, removed: List[str], changed: Dict[str, Tuple[Dict, str, str]], vectors: Dict[str, np.ndarray]):
+        """Build the next catalogue from copies of the current one and publish it"""
+        current_events, current_matrix = self._catalogue
+        events, keys, rows = list(current_events), list(self._keys), dict(self._rows)
+        matrix = current_matrix.copy() if current_matrix is not None else None
+        
+        # Removed rows are filled by moving the last row into them
+        for key in removed:
+            row = rows.pop(key)[0]
+            last = len(events) - 1
+            if row != last:
+                events[row], keys[row] = events[last], keys[last]
+                matrix[row] = matrix[last]
+                rows[keys[row]] = (row,) + rows[keys[row]][1:]
+            events.pop()
+            keys.pop()
+        if matrix is not None:
+            matrix = matrix[:len(events)]
+        
+        appended = []
+        for key, (event, doc_hash, text_hash) in changed.items():
+            if key in rows:
+                row = rows[key][0]
+                events[row] = event
+                if key in vectors:
+                    matrix[row] = vectors[key]
+            else:
+                row = len(events)
+                events.append(event)
+                keys.append(key)
+                appended.append(vectors[key])
+            rows[key] = (row, doc_hash, text_hash)
+        
+        if appended:
+            matrix = np.vstack([matrix, appended]) if matrix is not None and len(matrix) else np.vstack(appended)
+        
+        self._rows, self._keys = rows, keys
+        self._catalogue = (events, matrix if events else None)
+    
+    def stats(self) -> Dict:
+        events = self.events_cache
+        return {
+            'events': len(events),
+            'version': self.version,
+            'fetched_at': self.fetched_at,
+            'age_seconds': round(time.time() - self.fetched_at, 3) if self.fetched_at else None,
+            'encoded': self.encoded,
+            'incremental': self.since_param is not None,
+            'updated_since': self._updated_since,
+            'last_sync': self.last_sync,
+        }
+    
+    def search_events(self, query: str, top_k: int = 5, query_embedding: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        Search events using semantic similarity; query_embedding skips encoding
+        the query here. Never fetches: an empty catalogue means the background
+        refresher has not synced yet.
+        """
+        # One read of the pair, so a sync swapping in a new catalogue mid-search cannot misalign rows
+        events, embeddings = self._catalogue
+        if not events or embeddings is None:
             logger.warning("No events available in cache")
             return []
         
         # Encode user query
-        query_embedding = self.model.encode([query], convert_to_tensor=False)
+        if query_embedding is None:
+            query_embedding = self.model.encode([query], convert_to_tensor=False)
+        query_embedding = np.asarray(query_embedding).reshape(1, -1)
         
         # Calculate cosine similarity
-        similarities = cosine_similarity(query_embedding, self.events_embeddings)[0]
+        similarities = cosine_similarity(query_embedding, embeddings)[0]
         
         # Log similarity scores for debugging
         logger.info(f"Query: {query}")
@@ -78,7 +216,7 @@ class EventService:
         for idx in top_indices:
             score = similarities[idx]
             if score > 0.15:  # Lowered threshold
-                event = self.events_cache[idx].copy()
+                event = events[idx].copy()
                 event['similarity_score'] = float(score)
                 results.append(event)
                 logger.info(f"  Event '{event.get('title', 'Untitled')}' matched with score {score:.3f}")
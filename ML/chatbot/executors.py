@@ -0,0 +1,91 @@
+"""
+Executor Pools
+Bounded thread pools that keep blocking work off the event loop: one for
+CPU-bound embedding and FAISS search, one for outbound I/O (backend API and
+Gemini calls). A pool runs at most `workers` calls at once and lets at most
+`max_pending` more wait; beyond that callers get PoolFull instead of an
+ever-growing queue.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+logger = logging.getLogger("chatbot.executors")
+
+# Encoding is CPU-bound and already multi-threaded inside torch, so a few
+# workers are enough; I/O workers mostly wait on the network
+EMBED_WORKERS = min(4, os.cpu_count() or 1)
+IO_WORKERS = 16
+MAX_PENDING = 256
+
+
+class PoolFull(Exception):
+    """Raised when a pool already has max_pending calls waiting"""
+
+
+class BoundedPool:
+    def __init__(self, name: str, workers: int, max_pending: int = MAX_PENDING):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"chatbot-{name}")
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Run func(*args, **kwargs) on a pool thread and await its result"""
+        submitted = time.perf_counter()
+        with self._lock:
+            if self.waiting >= self.max_pending:
+                self.rejected += 1
+                raise PoolFull(f"{self.name} pool has {self.waiting} calls waiting")
+            self.waiting += 1
+
+        def call():
+            started = time.perf_counter()
+            with self._lock:
+                self.waiting -= 1
+                self.running += 1
+                self.wait_seconds += started - submitted
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.run_seconds += time.perf_counter() - started
+
+        def release_if_cancelled(f):
+            # A call cancelled before it started never reaches call()
+            if f.cancelled():
+                with self._lock:
+                    self.waiting -= 1
+
+        future = self._executor.submit(call)
+        future.add_done_callback(release_if_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'running': self.running,
+                'waiting': self.waiting,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'mean_wait_ms': round(1000 * self.wait_seconds / self.completed, 3) if self.completed else None,
+                'mean_run_ms': round(1000 * self.run_seconds / self.completed, 3) if self.completed else None,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,110 @@
+"""
+Metrics
+Thread-safe counters and histograms rendered in the Prometheus text
+exposition format (version 0.0.4) for GET /metrics. Values owned by other
+components (pool stats) are read at scrape time through collectors.
+
+A trimmed copy of Recommendation/metrics.py, kept here on purpose: each
+service is built into its own image from its own directory, so neither can
+import the other's modules. Fix exposition bugs in both files.
+"""
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# name, type, help, [(labels, value[, suffix])]
+Family = Tuple[str, str, str, List[tuple]]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def collect(self) -> Iterable[Family]:
+        yield self.name, 'counter', self.documentation, [({}, self.value)]
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # per-bucket counts, the last one is +Inf
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[slot] += 1
+            self._sum += value
+
+    def collect(self) -> Iterable[Family]:
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        samples, cumulative = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            samples.append(({'le': _format_value(bound)}, cumulative, '_bucket'))
+        samples.append(({}, total, '_sum'))
+        samples.append(({}, cumulative, '_count'))
+        yield self.name, 'histogram', self.documentation, samples
+
+
+class Registry:
+    def __init__(self):
+        self._sources: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        metric = Counter(name, documentation)
+        self.collector(metric.collect)
+        return metric
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float]) -> Histogram:
+        metric = Histogram(name, documentation, buckets)
+        self.collector(metric.collect)
+        return metric
+
+    def collector(self, collect: Callable[[], Iterable[Family]]) -> Callable[[], Iterable[Family]]:
+        """Register a function returning (name, type, help, [(labels, value)]) families at scrape time"""
+        with self._lock:
+            self._sources.append(collect)
+        return collect
+
+    def render(self) -> str:
+        with self._lock:
+            sources = list(self._sources)
+        lines = []
+        for source in sources:
+            for name, kind, documentation, samples in source():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for sample in samples:
+                    suffix = sample[2] if len(sample) > 2 else ''
+                    lines.append(f"{name}{suffix}{_format_labels(sample[0])} {_format_value(sample[1])}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,107 @@
+"""
+Event Refresher
+Background task that keeps the event catalogue fresh so user requests never
+fetch or encode events themselves. Syncs run on the I/O pool every interval
+(with jitter so replicas do not hit the backend together); after a failure
+the next attempt backs off exponentially up to max_backoff.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, Optional
+
+from event_service import EventService
+from executors import BoundedPool
+
+logger = logging.getLogger("chatbot.refresher")
+
+INTERVAL = 300.0
+# Each delay is scaled by a random factor in [1 - jitter, 1 + jitter]
+JITTER = 0.1
+# First retry after a failure, doubling up to MAX_BACKOFF
+RETRY_DELAY = 5.0
+MAX_BACKOFF = 1800.0
+# With incremental fetches, every Nth sync is full so deletions are noticed
+FULL_SYNC_EVERY = 12
+
+
+class EventRefresher:
+    def __init__(self, service: EventService, pool: BoundedPool, interval: float = INTERVAL,
+                 jitter: float = JITTER, max_backoff: float = MAX_BACKOFF, full_sync_every: int = FULL_SYNC_EVERY):
+        self.service = service
+        self.pool = pool
+        self.interval = max(1.0, interval)
+        self.jitter = min(max(0.0, jitter), 1.0)
+        self.max_backoff = max(RETRY_DELAY, max_backoff)
+        self.full_sync_every = max(1, full_sync_every)
+        self._task: Optional[asyncio.Task] = None
+        self.syncs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.last_success_at: Optional[float] = None
+        self.next_run_at: Optional[float] = None
+
+    def _jittered(self, delay: float) -> float:
+        return delay * random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+
+    def next_delay(self) -> float:
+        """Seconds until the next sync: the interval, or the backoff after consecutive failures"""
+        if self.consecutive_failures:
+            return self._jittered(min(self.max_backoff, RETRY_DELAY * 2 ** (self.consecutive_failures - 1)))
+        return self._jittered(self.interval)
+
+    def start(self) -> None:
+        """Start the loop on the running event loop; the first sync runs at once if none has succeeded"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def refresh(self) -> bool:
+        """Run one sync now; True when it succeeded"""
+        # The first sync and every full_sync_every-th one fetch everything
+        incremental = self.service.fetched_at is not None and self.syncs % self.full_sync_every != 0
+        try:
+            await self.pool.run(self.service.sync, incremental)
+        except Exception as e:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(e)
+            logger.warning(f"Event refresh failed ({self.consecutive_failures} in a row): {e}")
+            return False
+        self.syncs += 1
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_success_at = time.time()
+        return True
+
+    async def _run(self) -> None:
+        delay = 0.0 if self.service.fetched_at is None else self.next_delay()
+        while True:
+            self.next_run_at = time.time() + delay
+            await asyncio.sleep(delay)
+            await self.refresh()
+            delay = self.next_delay()
+
+    def stats(self) -> Dict:
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'interval': self.interval,
+            'jitter': self.jitter,
+            'max_backoff': self.max_backoff,
+            'syncs': self.syncs,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+            'last_success_at': self.last_success_at,
+            'next_run_in': round(max(0.0, self.next_run_at - time.time()), 3) if self.next_run_at else None,
+        }